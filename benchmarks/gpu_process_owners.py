@@ -0,0 +1,55 @@
+"""
+Cycle latency of GPUMonitor vs. number of GPU processes per node.
+
+Compares owner resolution done inside the probe script (single `ps` for all PIDs)
+with the previous approach, which issued one `ps` round trip per process.
+
+Usage: python -m benchmarks.gpu_process_owners [--hosts 4] [--latency 0.005]
+"""
+from tensorhive.core.fake_ssh import FakeCluster, FakeParallelSSHClient
+from tensorhive.core.monitors.GPUMonitor import GPUMonitor
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+import argparse
+import time
+
+
+def per_process_owner_lookup(client, infrastructure_manager):
+    '''Previous behaviour: one `ps` round trip for each process on each node'''
+    for hostname, node in infrastructure_manager.infrastructure.items():
+        for gpu in node['GPU'].values():
+            for process in gpu['processes'] or []:
+                _, _, stdout, _, _ = client.host_clients[hostname].run_command(
+                    'ps --no-headers -o user {}'.format(process['pid']))
+                process['owner'] = next(stdout, None)
+
+
+def measure(hosts: int, processes_per_node: int, latency: float, legacy: bool) -> float:
+    hostnames = ['node{}'.format(i) for i in range(hosts)]
+    cluster = FakeCluster(hostnames, gpus_per_node=8, processes_per_node=processes_per_node, latency=latency)
+    client = FakeParallelSSHClient(hostnames, cluster=cluster)
+    infrastructure_manager = InfrastructureManager({host: {} for host in client.hosts})
+    monitor = GPUMonitor()
+
+    start = time.perf_counter()
+    monitor.update(client, infrastructure_manager)
+    if legacy:
+        per_process_owner_lookup(client, infrastructure_manager)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.005, help='Simulated SSH round trip in seconds')
+    args = parser.parse_args()
+
+    print('hosts={} latency={:.1f}ms'.format(args.hosts, args.latency * 1000))
+    print('{:>20} {:>20} {:>20}'.format('processes per node', 'per-process ps [s]', 'batched ps [s]'))
+    for processes_per_node in [0, 8, 16, 32, 64, 128]:
+        legacy = measure(args.hosts, processes_per_node, args.latency, legacy=True)
+        batched = measure(args.hosts, processes_per_node, args.latency, legacy=False)
+        print('{:>20} {:>20.3f} {:>20.3f}'.format(processes_per_node, legacy, batched))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Memory used by the infrastructure model (working state and published snapshot) of a simulated fleet.
+
+Compares compact records (tensorhive.core.utils.records) with the previous representation,
+where every metric was a {'value': ..., 'unit': ...} dict and GPU, CPU and process records were dicts.
+Both go through the same steady-state monitoring cycle: parse nvidia-smi and /proc output of every node,
+merge it with the working state and publish the node.
+
+Resident is the memory held by the working state and the snapshot, allocated per cycle is the sum of peaks
+of each node's update on top of that (both measured with tracemalloc).
+Cycle time is measured separately, without tracing.
+
+Usage: python -m benchmarks.infrastructure_memory [--nodes 100] [--gpus 8] [--cycles 5]
+"""
+from tensorhive.core.fake_ssh import FakeNode
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+from tensorhive.core.monitors.CPUMonitor import CPUMonitor
+from tensorhive.core.monitors.GPUMonitor import GPUMonitor
+from tensorhive.core.monitors.probe import SectionOutput
+from tensorhive.core.utils.NvidiaSmiParser import NvidiaSmiParser
+from typing import Callable, Dict, List
+import argparse
+import gc
+import time
+import tracemalloc
+
+METRICS_FIELDS = ['uuid', 'fan.speed', 'memory.free', 'memory.used', 'utilization.gpu', 'utilization.memory',
+                  'temperature.gpu', 'power.draw']
+INVENTORY_FIELDS = ['uuid', 'name', 'index', 'memory.total']
+
+Sections = Dict[str, SectionOutput]
+
+
+def node_sections(node: FakeNode) -> Sections:
+    '''Output of a single probe of the node, split into sections like MonitoringService does'''
+    return {
+        'gpu_inventory': SectionOutput(0, []),
+        'gpu_metrics': SectionOutput(0, node.query_gpu(METRICS_FIELDS)),
+        'gpu_processes': SectionOutput(0, node.compute_apps() + node.owners()),
+        'cpu': SectionOutput(0, node.proc_stat() + node.meminfo())
+    }
+
+
+class RecordsModel():
+    '''Current monitors and InfrastructureManager'''
+
+    def __init__(self, nodes: Dict[str, FakeNode]) -> None:
+        self.infrastructure_manager = InfrastructureManager({hostname: {} for hostname in nodes})
+        self.gpu_monitor = GPUMonitor()
+        self.cpu_monitor = CPUMonitor()
+        for hostname, node in nodes.items():
+            inventory = NvidiaSmiParser.parse_gpu_inventory_stdout(node.query_gpu(INVENTORY_FIELDS))
+            self.infrastructure_manager.set_gpu_inventory(hostname, inventory)
+
+    def probe(self, hostname: str, sections: Sections) -> None:
+        self.gpu_monitor.parse_probe(hostname, sections, self.infrastructure_manager)
+        self.cpu_monitor.parse_probe(hostname, sections, self.infrastructure_manager)
+        self.infrastructure_manager.mark_updated(hostname)
+
+
+class DictsModel():
+    '''Previous behaviour: nested dicts built for every metric, process and record'''
+
+    def __init__(self, nodes: Dict[str, FakeNode]) -> None:
+        # Published the same way, dict records are copied like before
+        self.infrastructure_manager = InfrastructureManager({hostname: {} for hostname in nodes})
+        self.cpu_monitor = CPUMonitor()
+        self.inventory = {hostname: self.parse_rows(node.query_gpu(INVENTORY_FIELDS))
+                          for hostname, node in nodes.items()}
+
+    @staticmethod
+    def parse_rows(stdout: List[str]) -> Dict[str, Dict]:
+        plan = NvidiaSmiParser.column_plan(stdout[0])
+        result = {}
+        for line in stdout[1:]:
+            row = {}
+            for column, value in zip(plan, line.split(', ')):
+                value = column.convert(value)
+                row[column.key] = value if column.unit is None else {'value': value, 'unit': column.unit}
+            result[row.pop('uuid')] = row
+        return result
+
+    def probe(self, hostname: str, sections: Sections) -> None:
+        node = self.infrastructure_manager.infrastructure[hostname]
+        cached_gpus = node.get('GPU') or {}
+        gpus = {}
+        for uuid, gpu_metrics in self.parse_rows(sections['gpu_metrics'].lines).items():
+            static = self.inventory[hostname][uuid]
+            record = cached_gpus.get(uuid) or {'name': None, 'index': None, 'metrics': {}, 'processes': None}
+            record['name'] = static['name']
+            record['index'] = static['index']
+            record['metrics'].update(gpu_metrics)
+            record['metrics']['mem_total'] = static['mem_total']
+            record['processes'] = None
+            gpus[uuid] = record
+        node['GPU'] = gpus
+
+        process_lines, owner_lines = NvidiaSmiParser.split_owners_block(sections['gpu_processes'].lines)
+        owners = NvidiaSmiParser.parse_ps_owners_stdout(owner_lines)
+        for process in NvidiaSmiParser.parse_compute_apps_stdout(process_lines[1:]):
+            process['owner'] = owners.get(process['pid'])
+            record = gpus[process.pop('uuid')]
+            if record['processes'] is None:
+                record['processes'] = []
+            record['processes'].append(process)
+
+        samples, meminfo = self.cpu_monitor._parse_stdout(sections['cpu'].lines)
+        previous_samples = self.cpu_monitor._previous_samples.get(hostname, {})
+        self.cpu_monitor._previous_samples[hostname] = samples
+        utilization, iowait = self.cpu_monitor._usage(previous_samples.get('cpu'), samples['cpu'])
+        cores = []
+        for name in sorted((name for name in samples if name != 'cpu'), key=lambda name: int(name[3:])):
+            core_utilization, core_iowait = self.cpu_monitor._usage(previous_samples.get(name), samples[name])
+            cores.append({'utilization': {'unit': '%', 'value': core_utilization},
+                          'iowait': {'unit': '%', 'value': core_iowait}})
+        node['CPU'] = {'CPU_{}'.format(hostname): {'index': 0, 'cores': cores, 'metrics': {
+            'utilization': {'unit': '%', 'value': utilization},
+            'iowait': {'unit': '%', 'value': iowait},
+            'mem_total': {'unit': 'MiB', 'value': meminfo['MemTotal'] // 1024},
+            'mem_used': {'unit': 'MiB', 'value': (meminfo['MemTotal'] - meminfo['MemFree']) // 1024},
+            'mem_free': {'unit': 'MiB', 'value': meminfo['MemFree'] // 1024}
+        }}}
+        self.infrastructure_manager.mark_updated(hostname)
+
+
+def measure(model_class: Callable, nodes: Dict[str, FakeNode], cycles: List[Dict[str, Sections]]) -> Dict:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    model = model_class(nodes)
+    # Warm-up, so that records of the previous cycle exist
+    for hostname, sections in cycles[0].items():
+        model.probe(hostname, sections)
+    gc.collect()
+    resident = tracemalloc.get_traced_memory()[0] - before
+
+    allocated = []
+    for cycle in cycles[1:]:
+        # Sum of peaks of each node's update (data of the node is built, then the previous one is released)
+        total = 0
+        for hostname, sections in cycle.items():
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            model.probe(hostname, sections)
+            total += tracemalloc.get_traced_memory()[1] - start
+        allocated.append(total)
+    tracemalloc.stop()
+
+    times = []
+    for cycle in cycles[1:]:
+        start_time = time.perf_counter()
+        for hostname, sections in cycle.items():
+            model.probe(hostname, sections)
+        times.append(time.perf_counter() - start_time)
+    return {'resident': resident, 'allocated': min(allocated), 'time': min(times)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=100)
+    parser.add_argument('--gpus', type=int, default=8)
+    parser.add_argument('--cycles', type=int, default=5)
+    args = parser.parse_args()
+
+    nodes = {}
+    for index in range(args.nodes):
+        node = nodes['node{:04}'.format(index)] = FakeNode('node{:04}'.format(index), gpus=args.gpus, seed=index)
+        for gpu in node.gpus:
+            node.spawn('user', 'python train.py', gpu_index=gpu['index'])
+    # Output is generated up front, so it is not measured
+    cycles = [{hostname: node_sections(node) for hostname, node in nodes.items()} for _ in range(args.cycles + 1)]
+
+    print('nodes={} gpus={} (total {} GPUs)'.format(args.nodes, args.gpus, args.nodes * args.gpus))
+    print('{:>8} {:>14} {:>22} {:>14}'.format('model', 'resident [KiB]', 'allocated/cycle [KiB]', 'cycle [ms]'))
+    for name, model_class in [('dicts', DictsModel), ('records', RecordsModel)]:
+        result = measure(model_class, nodes, cycles)
+        print('{:>8} {:>14.0f} {:>22.0f} {:>14.1f}'.format(
+            name, result['resident'] / 1024, result['allocated'] / 1024, result['time'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
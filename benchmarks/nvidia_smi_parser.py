@@ -0,0 +1,67 @@
+"""
+Per-row cost of parsing `nvidia-smi --query-gpu` output with NvidiaSmiParser.
+
+Compares the column plan compiled once per header with the previous approach,
+which recompiled the unit regex and looked up key names and units for every row.
+
+Usage: python -m benchmarks.nvidia_smi_parser [--rows 1000] [--repeat 20]
+"""
+from tensorhive.core.utils.NvidiaSmiParser import NvidiaSmiParser
+from tensorhive.core.fake_ssh import FakeNode
+from typing import Callable, Dict, List
+import argparse
+import re
+import timeit
+
+METRICS_FIELDS = ['uuid', 'fan.speed', 'memory.free', 'memory.used', 'utilization.gpu', 'utilization.memory',
+                  'temperature.gpu', 'power.draw']
+INVENTORY_FIELDS = ['uuid', 'name', 'index', 'memory.total']
+
+
+def legacy_parse(stdout: List[str]) -> Dict[str, Dict]:
+    '''Previous behaviour: regex compiled and every column described again for each row'''
+    keys = stdout[0].split(', ')
+    result = {}
+    for line in stdout[1:]:
+        values = [int(value) if value.isdecimal() else None if value == '[Not Supported]' else value
+                  for value in line.split(', ')]
+        unit_regex = re.compile(r'\[(.*)\]$')
+        row = {}
+        for long_key_name, value in zip(keys, values):
+            short_key_name = NvidiaSmiParser.key_mapping[long_key_name]
+            unit_found = unit_regex.search(long_key_name)
+            row[short_key_name] = {'value': value, 'unit': unit_found.group(1)} if unit_found else value
+        result[row.pop('uuid')] = row
+    return result
+
+
+def stdout_with_rows(fields: List[str], rows: int) -> List[str]:
+    node = FakeNode('benchmark', gpus=rows, seed=0)
+    for index in range(0, rows, 2):
+        node.spawn('user', 'python train.py', gpu_index=index)
+    return node.query_gpu(fields)
+
+
+def per_row_cost(parse: Callable, stdout: List[str], repeat: int) -> float:
+    '''Best per-row time in microseconds'''
+    times = timeit.repeat(lambda: parse(stdout), number=1, repeat=repeat)
+    return min(times) / (len(stdout) - 1) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print('rows={}'.format(args.rows))
+    print('{:>12} {:>20} {:>20}'.format('query', 'per-row legacy [us]', 'column plan [us]'))
+    for name, fields in [('metrics', METRICS_FIELDS), ('inventory', INVENTORY_FIELDS)]:
+        stdout = stdout_with_rows(fields, args.rows)
+        legacy = per_row_cost(legacy_parse, stdout, args.repeat)
+        compiled = per_row_cost(NvidiaSmiParser.parse_gpu_metrics_stdout, stdout, args.repeat)
+        print('{:>12} {:>20.2f} {:>20.2f}'.format(name, legacy, compiled))
+
+
+if __name__ == '__main__':
+    main()
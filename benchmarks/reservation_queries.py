@@ -0,0 +1,149 @@
+"""
+Latency of the hot reservation and job queries on a synthetic database, without and with the indexes
+added to the `reservations` and `jobs` tables.
+
+Every GPU has a history of consecutive reservations (most of them finished long ago, the latest ones
+current or upcoming), jobs are mostly finished, some of them are queued or scheduled.
+Database is a temporary file, so the user's database is not touched.
+
+Usage: python -m benchmarks.reservation_queries [--reservations 1000000] [--gpus 2000] [--jobs 100000] [--repeat 20]
+"""
+from tensorhive.database import Base, db_session
+from tensorhive.core.services.JobSchedulingService import JobSchedulingService
+from tensorhive.models.Job import Job, JobStatus
+from tensorhive.models.Reservation import Reservation
+from tensorhive.models.Role import Role
+from tensorhive.models.Task import Task
+from tensorhive.models.User import User
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from typing import Callable, List, Tuple
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+BATCH_SIZE = 50000
+
+
+def gpu_uuid(index: int) -> str:
+    return 'GPU-{:036d}'.format(index)
+
+
+def populate(engine, reservations: int, gpus: int, jobs: int) -> None:
+    users = [User(username='user{}'.format(index), password='benchmark', roles=[Role(name='user')])
+             for index in range(10)]
+    db_session.add_all(users)
+    db_session.commit()
+    user_ids = [user.id for user in users]
+
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    per_gpu = reservations // gpus
+    # Reservations of each GPU follow one another every 2 days, the last few of them are upcoming
+    gap = timedelta(days=2)
+    rows = []
+    for gpu in range(gpus):
+        start = now - gap * (per_gpu - 3) + timedelta(minutes=rng.randrange(24 * 60))
+        for _ in range(per_gpu):
+            rows.append({'user_id': rng.choice(user_ids), 'title': 'benchmark', 'resource_id': gpu_uuid(gpu),
+                         '_start': start, '_end': start + timedelta(hours=rng.randrange(1, 40)),
+                         'is_cancelled': rng.random() < 0.05, 'created_at': start})
+            start += gap
+            if len(rows) == BATCH_SIZE:
+                engine.execute(Reservation.__table__.insert(), rows)
+                rows = []
+    if rows:
+        engine.execute(Reservation.__table__.insert(), rows)
+
+    rows = []
+    for index in range(jobs):
+        # Finished long enough ago not to be stopped by stop_scheduled
+        start = now - timedelta(minutes=rng.randrange(2 * 24 * 60, 3 * 365 * 24 * 60))
+        # About one in a thousand jobs waits in the queue or is scheduled for the future
+        pending = index % 1000 == 0
+        if pending:
+            start = now + timedelta(minutes=rng.randrange(1, 24 * 60))
+        rows.append({'name': 'benchmark', 'user_id': rng.choice(user_ids), 'is_queued': pending and index % 2000 == 0,
+                     '_status': JobStatus.not_running.name if pending else JobStatus.terminated.name,
+                     '_start_at': start, '_stop_at': start + timedelta(hours=rng.randrange(1, 40))})
+        if len(rows) == BATCH_SIZE:
+            engine.execute(Job.__table__.insert(), rows)
+            rows = []
+    if rows:
+        engine.execute(Job.__table__.insert(), rows)
+
+
+def hot_queries(gpus: int) -> List[Tuple[str, Callable[[], object]]]:
+    now = datetime.utcnow()
+    service = JobSchedulingService(interval=0.0, stop_attempts_after=5.0)
+    candidate = Reservation(user_id=1, title='benchmark', resource_id=gpu_uuid(gpus // 2),
+                            start=now + timedelta(days=1), end=now + timedelta(days=1, hours=8))
+    batch = [Reservation(user_id=1, title='benchmark', resource_id=gpu_uuid(index), start=now + timedelta(days=1),
+                         end=now + timedelta(days=1, hours=8)) for index in range(0, gpus, max(gpus // 50, 1))]
+    calendar = [gpu_uuid(index) for index in range(8)]
+    return [
+        ('current_events()', lambda: Reservation.current_events()),
+        ('current_events(gpu)', lambda: Reservation.current_events(gpu_uuid(gpus // 2))),
+        ('upcoming_events_for_resource', lambda: Reservation.upcoming_events_for_resource(
+            gpu_uuid(gpus // 2), timedelta(minutes=30))),
+        ('would_interfere', candidate.would_interfere),
+        ('find_interfering (50 GPUs)', lambda: Reservation.find_interfering(batch)),
+        ('filter_by_uuids_and_time_range', lambda: Reservation.filter_by_uuids_and_time_range(
+            calendar, now - timedelta(days=7), now + timedelta(days=7))),
+        ('get_job_queue', Job.get_job_queue),
+        ('find_jobs_scheduled_for_date', lambda: service.find_jobs_scheduled_for_date(now)),
+        ('stop_scheduled', service.stop_scheduled),
+    ]
+
+
+def measure(query: Callable[[], object], repeat: int) -> float:
+    '''Median time of a query (first run is a warm-up)'''
+    query()
+    times = []
+    for _ in range(repeat):
+        db_session.expunge_all()
+        start_time = time.perf_counter()
+        query()
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reservations', type=int, default=1000000)
+    parser.add_argument('--gpus', type=int, default=2000)
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine('sqlite:///{}'.format(os.path.join(directory, 'benchmark.sqlite')))
+        db_session.remove()
+        db_session.configure(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        indexes = [index for model in [Reservation, Job, Task] for index in model.__table__.indexes]
+        for index in indexes:
+            index.drop(bind=engine)
+
+        start_time = time.perf_counter()
+        populate(engine, args.reservations, args.gpus, args.jobs)
+        print('reservations={} gpus={} jobs={} (populated in {:.0f}s)'.format(
+            args.reservations, args.gpus, args.jobs, time.perf_counter() - start_time))
+
+        queries = hot_queries(args.gpus)
+        without_indexes = [measure(query, args.repeat) for _, query in queries]
+        for index in indexes:
+            index.create(bind=engine)
+        with_indexes = [measure(query, args.repeat) for _, query in queries]
+
+        print('{:>30} {:>18} {:>15}'.format('query', 'no indexes [ms]', 'indexes [ms]'))
+        for (name, _), before, after in zip(queries, without_indexes, with_indexes):
+            print('{:>30} {:>18.2f} {:>15.2f}'.format(name, before * 1000, after * 1000))
+        db_session.remove()
+
+
+if __name__ == '__main__':
+    main()
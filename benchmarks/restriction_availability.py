@@ -0,0 +1,212 @@
+"""
+Time of verifying reservations against restrictions of a user with many schedules: the previous algorithm
+(walking through restrictions and schedules for every reservation) versus compiled availability
+(see tensorhive.core.utils.AvailabilityIndex), both on the first verification after a change of restrictions
+and when it is cached.
+
+Every restriction applies to all GPUs, lasts a few weeks and has schedules on random days and hours
+(some of them overnight). Reservations start at random times within the restrictions and last up to 2 days.
+Database is a temporary file, so the user's database is not touched.
+
+Verdicts of both algorithms are checked against an oracle which marks every allowed minute separately.
+Verdicts of the previous algorithm depend on the (unstable) order of restrictions, so its errors vary between runs.
+
+Usage: python -m benchmarks.restriction_availability [--restrictions 20] [--schedules 10] [--gpus 8]
+                                                     [--reservations 1000]
+"""
+from tensorhive.database import Base, db_session, _import_models
+from tensorhive.core.utils.AvailabilityIndex import AvailabilityIndex
+from tensorhive.core.utils.ReservationVerifier import ReservationVerifier
+from tensorhive.models.Reservation import Reservation
+from tensorhive.models.Resource import Resource
+from tensorhive.models.Restriction import Restriction
+from tensorhive.models.RestrictionSchedule import RestrictionSchedule
+from tensorhive.models.User import User
+from datetime import datetime, time, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm.exc import NoResultFound
+from typing import List
+import argparse
+import numpy as np
+import os
+import random
+import tempfile
+import timeit
+
+
+def get_latest_date_allowed_by_schedules(start_date, end_date, schedules):
+    '''Previous implementation of ReservationVerifier (the baseline)'''
+    while True:
+        start_date_changed = False
+        for schedule in schedules:
+            day = start_date.weekday() + 1
+            if str(day) in schedule.schedule_days and schedule.hour_start <= start_date.time():
+                if schedule.hour_end == time(hour=23, minute=59):
+                    start_date = start_date.replace(hour=0, minute=0) + timedelta(days=1)
+                elif schedule.hour_start > schedule.hour_end:
+                    start_date = start_date.replace(hour=schedule.hour_end.hour, minute=schedule.hour_end.minute) \
+                        + timedelta(days=1)
+                elif start_date.time() < schedule.hour_end:
+                    start_date = start_date.replace(hour=schedule.hour_end.hour, minute=schedule.hour_end.minute)
+                else:
+                    continue
+                start_date_changed = True
+            elif str((day - 1) % 7) in schedule.schedule_days \
+                    and start_date.time() < schedule.hour_end < schedule.hour_start:
+                start_date = start_date.replace(hour=schedule.hour_end.hour, minute=schedule.hour_end.minute)
+                start_date_changed = True
+            if start_date.minute == 59:
+                start_date = start_date + timedelta(minutes=1)
+            if start_date >= end_date:
+                return start_date
+        if not start_date_changed:
+            break
+    return start_date
+
+
+def is_reservation_allowed(user, reservation):
+    '''Previous implementation of ReservationVerifier (the baseline)'''
+    try:
+        resource = Resource.get(reservation.resource_id)
+    except NoResultFound:
+        return False
+    restrictions = [r for r in user.get_restrictions(include_group=True) if r.is_global or resource in r.resources]
+    start_date = reservation.start
+    end_date = reservation.end
+    while True:
+        start_date_changed = False
+        for restriction in restrictions:
+            if restriction.starts_at <= start_date and \
+                    (restriction.ends_at is None or start_date < restriction.ends_at):
+                schedules = restriction.schedules
+                if not schedules:
+                    if restriction.ends_at is None:
+                        return True
+                    else:
+                        start_date = restriction.ends_at
+                        start_date_changed = True
+                else:
+                    date = get_latest_date_allowed_by_schedules(start_date, end_date, schedules)
+                    if date > start_date:
+                        start_date_changed = True
+                        start_date = date
+                if start_date >= end_date:
+                    return True
+        if not start_date_changed:
+            break
+    return False
+
+
+def allowed_minutes(restrictions, since: datetime, until: datetime) -> np.ndarray:
+    '''Oracle: whether each minute between `since` and `until` is allowed by any of the restrictions'''
+    allowed = np.zeros(int((until - since).total_seconds()) // 60, dtype=bool)
+    for restriction in restrictions:
+        # Minutes of a week (starting on Monday) covered by schedules of the restriction
+        week = np.zeros(7 * 24 * 60, dtype=bool)
+        if not restriction.schedules:
+            week[:] = True
+        for schedule in restriction.schedules:
+            start = schedule.hour_start.hour * 60 + schedule.hour_start.minute
+            end = schedule.hour_end.hour * 60 + schedule.hour_end.minute
+            if schedule.hour_end.minute == 59:
+                end += 1
+            if schedule.hour_start > schedule.hour_end:
+                # Lasts until the next day
+                end += 24 * 60
+            elif schedule.hour_start == schedule.hour_end:
+                continue
+            for day in schedule.schedule_days:
+                for minute in range((int(day) - 1) * 24 * 60 + start, (int(day) - 1) * 24 * 60 + end):
+                    week[minute % len(week)] = True
+        first = max(int((restriction.starts_at - since).total_seconds()) // 60, 0)
+        last = len(allowed) if restriction.ends_at is None else \
+            min(int((restriction.ends_at - since).total_seconds()) // 60, len(allowed))
+        for minute in range(first, last):
+            if week[(since.weekday() * 24 * 60 + minute) % len(week)]:
+                allowed[minute] = True
+    return allowed
+
+
+def populate(restrictions: int, schedules: int, gpus: int) -> User:
+    rng = random.Random(0)
+    user = User(username='benchmark', password='benchmark')
+    db_session.add(user)
+    resources = [Resource(id='GPU-{:036d}'.format(index)) for index in range(gpus)]
+    db_session.add_all(resources)
+    first_day = datetime(2101, 1, 1)
+    for index in range(restrictions):
+        starts_at = first_day + timedelta(days=rng.randrange(28))
+        restriction = Restriction(name='benchmark{}'.format(index), starts_at=starts_at,
+                                  ends_at=starts_at + timedelta(days=rng.randrange(7, 28)), is_global=False)
+        restriction.users.append(user)
+        restriction.resources.extend(resources)
+        for _ in range(schedules):
+            days = ''.join(sorted(rng.sample('1234567', rng.randrange(1, 8))))
+            hour_start = time(rng.randrange(24), rng.choice([0, 30]))
+            hour_end = time(rng.randrange(24), rng.choice([0, 30, 59]))
+            restriction.schedules.append(RestrictionSchedule(schedule_days=days, hour_start=hour_start,
+                                                             hour_end=hour_end))
+        db_session.add(restriction)
+    db_session.commit()
+    return user
+
+
+def candidates(count: int, gpus: int) -> List[Reservation]:
+    rng = random.Random(1)
+    first_day = datetime(2101, 1, 1)
+    reservations = []
+    for _ in range(count):
+        start = first_day + timedelta(minutes=30 * rng.randrange(2 * 28 * 48))
+        reservations.append(Reservation(user_id=1, title='benchmark', resource_id='GPU-{:036d}'.format(
+            rng.randrange(gpus)), start=start, end=start + timedelta(minutes=30 * rng.randrange(1, 4 * 24))))
+    return reservations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--restrictions', type=int, default=20)
+    parser.add_argument('--schedules', type=int, default=10, help='per restriction')
+    parser.add_argument('--gpus', type=int, default=8)
+    parser.add_argument('--reservations', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine('sqlite:///{}'.format(os.path.join(directory, 'benchmark.sqlite')))
+        db_session.remove()
+        db_session.configure(bind=engine)
+        _import_models()
+        Base.metadata.create_all(bind=engine)
+        user = populate(args.restrictions, args.schedules, args.gpus)
+        reservations = candidates(args.reservations, args.gpus)
+        index = AvailabilityIndex()
+
+        def previous():
+            return [is_reservation_allowed(user, reservation) for reservation in reservations]
+
+        def compiled():
+            return ReservationVerifier.are_reservations_allowed(user, reservations)
+
+        def compiled_first():
+            index.invalidate()
+            return compiled()
+
+        # All restrictions apply to all GPUs
+        first_day = datetime(2101, 1, 1)
+        oracle = allowed_minutes(user.get_restrictions(include_group=True), first_day, first_day + timedelta(days=60))
+        expected = [bool(oracle[int((reservation.start - first_day).total_seconds()) // 60:
+                                int((reservation.end - first_day).total_seconds()) // 60].all())
+                    for reservation in reservations]
+        results = compiled_first()
+        print('restrictions={} schedules={} gpus={} reservations={} (allowed: {})'.format(
+            args.restrictions, args.restrictions * args.schedules, args.gpus, args.reservations, sum(expected)))
+        print('wrong verdicts: previous algorithm {}, compiled {}'.format(
+            sum(a != b for a, b in zip(expected, previous())), sum(a != b for a, b in zip(expected, results))))
+        print('{:>35} {:>12}'.format('verification', 'total [ms]'))
+        for name, function in [('previous algorithm', previous), ('compiled, after a change', compiled_first),
+                               ('compiled, cached', compiled)]:
+            print('{:>35} {:>12.2f}'.format(name, min(timeit.repeat(function, number=1, repeat=5)) * 1000))
+        db_session.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Cycle latency and CPU cost of MonitoringService, ProtectionService and JobSchedulingService
+against a simulated cluster (tensorhive.core.fake_ssh) of 10, 100 and 1000 nodes.
+
+Every node has `--gpus` GPUs, each GPU runs one process, half of the GPUs are reserved by a user other than
+the owner of the process (so ProtectionService finds violations) and every tenth node has a queued job.
+Database is kept in memory, so the user's database is not touched.
+
+Wall time is the latency of a whole cycle (SSH round trips are simulated with `--latency`),
+CPU time is what the cycle costs TensorHive itself.
+
+Usage: python -m benchmarks.services [--nodes 10 100 1000] [--gpus 4] [--latency 0.005] [--cycles 3]
+"""
+from tensorhive.config import SSH
+from tensorhive.core import fake_ssh
+from tensorhive.database import Base, db_session
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+from tensorhive.core.managers.SSHConnectionManager import SSHConnectionManager
+from tensorhive.core.monitors.CompositeMonitor import CompositeMonitor
+from tensorhive.core.monitors.CPUMonitor import CPUMonitor
+from tensorhive.core.monitors.GPUMonitor import GPUMonitor
+from tensorhive.core.scheduling import GreedyScheduler
+from tensorhive.core.services.MonitoringService import MonitoringService
+from tensorhive.core.services.ProtectionService import ProtectionService
+from tensorhive.core.services.JobSchedulingService import JobSchedulingService
+from tensorhive.core.violation_handlers.ProtectionHandler import ProtectionHandler
+from tensorhive.core.violation_handlers.MessageSendingBehaviour import MessageSendingBehaviour
+from tensorhive.models.Job import Job
+from tensorhive.models.Reservation import Reservation
+from tensorhive.models.Resource import Resource
+from tensorhive.models.Restriction import Restriction
+from tensorhive.models.Role import Role
+from tensorhive.models.Task import Task
+from tensorhive.models.User import User
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from typing import Callable, List, Tuple
+import argparse
+import logging
+import statistics
+import time
+import gevent
+
+USERNAMES = ['alice', 'bob', 'carol', 'dave']
+
+
+def setup(nodes: int, gpus: int, latency: float) -> Tuple[InfrastructureManager, SSHConnectionManager]:
+    hostnames = ['node{:04}'.format(i) for i in range(nodes)]
+    SSH.BACKEND = 'fake'
+    SSH.AVAILABLE_NODES = {hostname: {'user': USERNAMES[0], 'port': 22} for hostname in hostnames}
+
+    cluster = fake_ssh.FakeCluster(gpus_per_node=gpus, latency=latency, seed=0)
+    for hostname in hostnames:
+        node = cluster.node(hostname)
+        for gpu in node.gpus:
+            owner = USERNAMES[gpu['index'] % len(USERNAMES)]
+            node.spawn(owner, 'python train.py', gpu_index=gpu['index'])
+            node.login(owner)
+    fake_ssh.set_default_cluster(cluster)
+
+    engine = create_engine('sqlite://')
+    db_session.remove()
+    db_session.configure(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    users = [User(username=username, password='benchmark', roles=[Role(name='user')]) for username in USERNAMES]
+    for user in users:
+        user.save()
+    restriction = Restriction(name='everyone', starts_at=datetime.utcnow() - timedelta(days=1), is_global=True)
+    restriction.save()
+    for user in users:
+        restriction.apply_to_user(user)
+
+    now = datetime.utcnow()
+    for hostname in hostnames:
+        for gpu in cluster.node(hostname).gpus:
+            db_session.add(Resource(id=gpu['uuid'], name=gpu['name'], hostname=hostname))
+            if gpu['index'] % 2 == 0:
+                db_session.add(Reservation(user_id=users[(gpu['index'] + 1) % len(users)].id, title='benchmark',
+                                           resource_id=gpu['uuid'], start=now - timedelta(hours=1),
+                                           end=now + timedelta(hours=1)))
+    db_session.commit()
+
+    for hostname in hostnames[::10]:
+        job = Job(name='queued', description='', user_id=users[0].id)
+        job.save()
+        job.add_task(Task(command='python train.py', hostname=hostname, gpu_id=gpus - 1))
+        job.enqueue()
+
+    infrastructure_manager = InfrastructureManager(SSH.AVAILABLE_NODES)
+    connection_manager = SSHConnectionManager(SSH.AVAILABLE_NODES, ssh_key_path=None)
+    return infrastructure_manager, connection_manager
+
+
+def monitoring_cycle(infrastructure_manager, connection_manager) -> Callable[[], None]:
+    service = MonitoringService([CompositeMonitor([CPUMonitor(), GPUMonitor()])])
+    service.inject(infrastructure_manager)
+    service.inject(connection_manager)
+
+    def cycle():
+        service.update_all()
+        gevent.joinall(list(service._pending.values()))
+    return cycle
+
+
+def protection_cycle(infrastructure_manager, connection_manager) -> Callable[[], None]:
+    service = ProtectionService([ProtectionHandler(MessageSendingBehaviour())])
+    service.inject(infrastructure_manager)
+    service.inject(connection_manager)
+    return service.do_run
+
+
+def job_scheduling_cycle(infrastructure_manager, connection_manager) -> Callable[[], None]:
+    service = JobSchedulingService(interval=0.0, stop_attempts_after=5.0)
+    service.inject(infrastructure_manager)
+    service.inject(connection_manager)
+    service.inject(GreedyScheduler())
+    return service.do_run
+
+
+def measure(cycle: Callable[[], None], cycles: int) -> Tuple[float, float]:
+    '''Median wall and CPU time of a cycle (first cycle is a warm-up)'''
+    cycle()
+    wall_times, cpu_times = [], []  # type: List[float], List[float]
+    for _ in range(cycles):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        cycle()
+        wall_times.append(time.perf_counter() - wall_start)
+        cpu_times.append(time.process_time() - cpu_start)
+    return statistics.median(wall_times), statistics.median(cpu_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--gpus', type=int, default=4, help='GPUs per node')
+    parser.add_argument('--latency', type=float, default=0.005, help='Simulated SSH round trip in seconds')
+    parser.add_argument('--cycles', type=int, default=3)
+    args = parser.parse_args()
+    # Services log every violation and every scheduling decision
+    logging.disable(logging.WARNING)
+
+    print('gpus per node={} latency={:.1f}ms'.format(args.gpus, args.latency * 1000))
+    print('{:>8} {:>20} {:>12} {:>12}'.format('nodes', 'service', 'wall [s]', 'cpu [s]'))
+    for nodes in args.nodes:
+        infrastructure_manager, connection_manager = setup(nodes, args.gpus, args.latency)
+        # Other services work on data gathered by monitoring, so it goes first
+        for name, build in [('monitoring', monitoring_cycle), ('protection', protection_cycle),
+                            ('job scheduling', job_scheduling_cycle)]:
+            wall, cpu = measure(build(infrastructure_manager, connection_manager), args.cycles)
+            print('{:>8} {:>20} {:>12.3f} {:>12.3f}'.format(nodes, name, wall, cpu))
+
+
+if __name__ == '__main__':
+    main()
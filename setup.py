@@ -51,6 +51,7 @@ setup(
         'jsonschema==2.6.0',
         'Mako==1.1.4',
         'MarkupSafe==1.1.1',
+        'numpy==1.19.5',
         'openapi-spec-validator==0.2.9',
         'paramiko==2.7.2',
         'parallel-ssh==1.9.1',
@@ -30,7 +30,8 @@ class APIServer():
                     },
                     resolver=connexion.RestyResolver(API.IMPL_LOCATION),
                     strict_validation=True)
-        CORS(app.app)
+        # Lets the web app read the tag of /nodes responses and the version to use with ?since_version=
+        CORS(app.app, expose_headers=['ETag', 'X-Infrastructure-Version'])
         log.info('[⚙] Starting API server with {} backend'.format(API_SERVER.BACKEND))
         URL = '{schema}://{host}:{port}/{url_prefix}/ui/'.format(
             schema=API.URL_SCHEMA,
@@ -0,0 +1,150 @@
+from tensorhive.core.utils.AllowedGPUIndex import AllowedGPUIndex
+from tensorhive.core.utils.records import render
+from tensorhive.models.User import User
+from typing import Callable, Dict, FrozenSet, Iterator, Optional, Set
+from gevent.queue import Queue, Full, Empty
+import gevent
+import json
+import logging
+import time
+log = logging.getLogger(__name__)
+
+
+class InfrastructureStream():
+    '''
+    Pushes changes of the infrastructure to subscribers as Server-Sent Events.
+
+    A single greenlet (in the API server's hub) checks the version of the published snapshot every `interval`.
+    When it has changed, nodes updated since the previous event are filtered and serialized once
+    for each distinct set of GPUs visible to subscribers, and the same message is queued for all of them.
+    Subscribers which do not keep up (full queue) are disconnected, they can resume with Last-Event-ID.
+
+    Example event (id is the snapshot version, data has the same structure as /nodes/metrics):
+    id: 42
+    event: delta
+    data: {"example_host_0": {"GPU": {...}, "CPU": {...}}, "example_host_1": null}
+
+    Nodes which are no longer visible to subscribers (e.g. their GPUs could not be listed) are sent as null.
+    '''
+    # Comment line sent when nothing changes for that long, so that proxies do not close the connection
+    keepalive = 15.0
+    max_queued_events = 16
+
+    def __init__(self, infrastructure_manager, interval: float = 1.0) -> None:
+        self.infrastructure_manager = infrastructure_manager
+        self.interval = interval
+        # Queues of subscribers, grouped by GPUs they can see (None means all)
+        self._subscribers = {}  # type: Dict[Optional[FrozenSet[str]], Set[Queue]]
+        # Snapshot of the previous broadcast
+        self._snapshot = infrastructure_manager.snapshot
+        self._greenlet = None  # type: Optional[gevent.Greenlet]
+
+    @staticmethod
+    def format_event(version: int, event: str, infrastructure: Dict) -> str:
+        return 'id: {}\nevent: {}\ndata: {}\n\n'.format(version, event, json.dumps(render(infrastructure)))
+
+    def subscribe(self, allowed_gpus: Optional[Set[str]], last_version: Optional[int] = None,
+                  refresh_allowed_gpus: Optional[Callable[[], Optional[Set[str]]]] = None,
+                  expires_at: Optional[float] = None) -> Iterator[str]:
+        '''
+        Generates events for a single subscriber, starting with the whole (filtered) infrastructure,
+        or with nodes changed since `last_version` when the subscriber resumes the stream.
+
+        When permissions change (see AllowedGPUIndex.version), GPUs visible to the subscriber are taken
+        from `refresh_allowed_gpus` again and, if they differ, the whole infrastructure is sent once more.
+        The stream ends at `expires_at` (UNIX time), when the subscriber's token expires.
+        '''
+        key = frozenset(allowed_gpus) if allowed_gpus is not None else None
+        permissions_version = AllowedGPUIndex().version
+        queue = Queue(maxsize=self.max_queued_events)
+        snapshot = self.infrastructure_manager.snapshot
+        nodes = snapshot.nodes
+        if last_version is not None:
+            nodes = {hostname: node for hostname, node in nodes.items()
+                     if snapshot.node_versions.get(hostname, 0) > last_version}
+        queue.put(self.format_event(snapshot.version, 'snapshot' if last_version is None else 'delta',
+                                    User.filter_infrastructure_by_gpus(nodes, allowed_gpus)))
+
+        self._subscribers.setdefault(key, set()).add(queue)
+        if self._greenlet is None or self._greenlet.ready():
+            self._snapshot = snapshot
+            self._greenlet = gevent.spawn(self._run)
+        try:
+            while True:
+                timeout = self.keepalive
+                if expires_at is not None:
+                    timeout = min(timeout, expires_at - time.time())
+                    if timeout <= 0:
+                        # Token has expired, client has to reconnect with a new one
+                        return
+                try:
+                    event = queue.get(timeout=timeout)
+                except Empty:
+                    if expires_at is not None and time.time() >= expires_at:
+                        return
+                    event = ':\n\n'
+                if event is None:
+                    # Disconnected for being too slow
+                    return
+                if refresh_allowed_gpus is not None and AllowedGPUIndex().version != permissions_version:
+                    permissions_version = AllowedGPUIndex().version
+                    allowed_gpus = refresh_allowed_gpus()
+                    new_key = frozenset(allowed_gpus) if allowed_gpus is not None else None
+                    if new_key != key:
+                        # Queued events were filtered with previous permissions
+                        self._unsubscribe(key, queue)
+                        queue.queue.clear()
+                        key = new_key
+                        self._subscribers.setdefault(key, set()).add(queue)
+                        snapshot = self.infrastructure_manager.snapshot
+                        event = self.format_event(snapshot.version, 'snapshot',
+                                                  User.filter_infrastructure_by_gpus(snapshot.nodes, key))
+                yield event
+        finally:
+            self._unsubscribe(key, queue)
+
+    def _unsubscribe(self, key: Optional[FrozenSet[str]], queue: Queue) -> None:
+        queues = self._subscribers.get(key, set())
+        queues.discard(queue)
+        if not queues:
+            self._subscribers.pop(key, None)
+
+    def broadcast(self) -> int:
+        '''Queues nodes changed since the previous broadcast for all subscribers, returns the number of messages'''
+        previous_snapshot, snapshot = self._snapshot, self.infrastructure_manager.snapshot
+        if snapshot.version == previous_snapshot.version:
+            return 0
+        changed_nodes = {hostname: node for hostname, node in snapshot.nodes.items()
+                         if snapshot.node_versions.get(hostname, 0) > previous_snapshot.version}
+        previous_nodes = {hostname: previous_snapshot.nodes[hostname] for hostname in changed_nodes
+                          if hostname in previous_snapshot.nodes}
+        self._snapshot = snapshot
+
+        messages = 0
+        for key, queues in list(self._subscribers.items()):
+            infrastructure = User.filter_infrastructure_by_gpus(changed_nodes, key)
+            if key is not None:
+                # Filtering leaves out nodes which were visible so far, subscribers have to know they are gone
+                for hostname in User.filter_infrastructure_by_gpus(previous_nodes, key):
+                    infrastructure.setdefault(hostname, None)
+            if not infrastructure:
+                continue
+            event = self.format_event(snapshot.version, 'delta', infrastructure)
+            messages += 1
+            for queue in list(queues):
+                try:
+                    queue.put_nowait(event)
+                except Full:
+                    log.warning('Infrastructure stream subscriber is too slow, disconnecting')
+                    queues.discard(queue)
+                    queue.queue.clear()
+                    queue.put_nowait(None)
+        return messages
+
+    def _run(self) -> None:
+        while self._subscribers:
+            gevent.sleep(self.interval)
+            try:
+                self.broadcast()
+            except Exception as e:
+                log.error('Could not broadcast infrastructure changes: {}'.format(e))
@@ -117,6 +117,8 @@ class SSH:
     TIMEOUT = config.getfloat(section, 'timeout', fallback=10.0)
     NUM_RETRIES = config.getint(section, 'number_of_retries', fallback=1)
     KEY_FILE = config.get(section, 'key_file', fallback='~/.config/TensorHive/ssh_key')
+    # pssh -> real SSH connections, fake -> simulated cluster (see [fake_cluster])
+    BACKEND = config.get(section, 'backend', fallback='pssh')
 
     def hosts_config_to_dict(path: str) -> Dict:  # type: ignore
         '''Parses sections containing hostnames'''
@@ -153,6 +155,16 @@ class SSH:
     PROXY = proxy_config_to_dict(HOSTS_CONFIG_FILE)
 
 
+class FAKE_CLUSTER:
+    section = 'fake_cluster'
+    GPUS_PER_NODE = config.getint(section, 'gpus_per_node', fallback=4)
+    PROCESSES_PER_NODE = config.getint(section, 'processes_per_node', fallback=2)
+    LATENCY = config.getfloat(section, 'latency', fallback=0.005)
+    FAILURE_RATE = config.getfloat(section, 'failure_rate', fallback=0.0)
+    TIMEOUT_RATE = config.getfloat(section, 'timeout_rate', fallback=0.0)
+    SEED = config.getint(section, 'seed', fallback=None)
+
+
 class DB:
     section = 'database'
     default_path = '~/.config/TensorHive/database.sqlite'
@@ -173,6 +185,7 @@ class API:
     URL_PREFIX = config.get(section, 'url_prefix', fallback='api')
     SPEC_FILE = config.get(section, 'spec_file', fallback='api_specification.yml')
     IMPL_LOCATION = config.get(section, 'impl_location', fallback='tensorhive.api.controllers')
+    STREAM_INTERVAL = config.getfloat(section, 'stream_interval', fallback=1.0)
 
     import yaml
     respones_file_path = str(PosixPath(__file__).parent / 'controllers/responses.yml')
@@ -202,6 +215,19 @@ class MONITORING_SERVICE:
     ENABLED = config.getboolean(section, 'enabled', fallback=True)
     ENABLE_GPU_MONITOR = config.getboolean(section, 'enable_gpu_monitor', fallback=True)
     UPDATE_INTERVAL = config.getfloat(section, 'update_interval', fallback=2.0)
+    UPDATE_DEADLINE = config.getfloat(section, 'update_deadline', fallback=UPDATE_INTERVAL)
+    BUSY_UPDATE_INTERVAL = config.getfloat(section, 'busy_update_interval', fallback=UPDATE_INTERVAL)
+    IDLE_UPDATE_INTERVAL = config.getfloat(section, 'idle_update_interval', fallback=UPDATE_INTERVAL)
+    MAX_BACKOFF = config.getfloat(section, 'max_backoff', fallback=300.0)
+    AGENT_MODE = config.getboolean(section, 'agent_mode', fallback=False)
+    AGENT_INTERVAL = config.getfloat(section, 'agent_interval', fallback=1.0)
+    COMPOSITE_PROBE = config.getboolean(section, 'composite_probe', fallback=True)
+    GPU_PROCESS_DISCOVERY = config.get(section, 'gpu_process_discovery', fallback='compute_apps')
+    GPU_INVENTORY_REFRESH_INTERVAL = config.getfloat(section, 'gpu_inventory_refresh_interval', fallback=600.0)
+    METRIC_HISTORY_RETENTION = config.getfloat(section, 'metric_history_retention', fallback=3600.0)
+    SNAPSHOT_FILE = config.get(section, 'snapshot_file', fallback='~/.config/TensorHive/infrastructure_snapshot.json')
+    SNAPSHOT_FILE = str(PosixPath(SNAPSHOT_FILE).expanduser()) if SNAPSHOT_FILE else None
+    SNAPSHOT_INTERVAL = config.getfloat(section, 'snapshot_interval', fallback=30.0)
 
 
 class PROTECTION_SERVICE:
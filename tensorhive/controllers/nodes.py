@@ -1,72 +1,131 @@
-import copy
 from connexion import NoContent
-from flask_jwt_extended import jwt_required, get_jwt_claims, get_jwt_identity
+from flask import Response, request
+from flask_jwt_extended import jwt_required, get_jwt_claims, get_jwt_identity, get_raw_jwt
 from sqlalchemy.orm.exc import NoResultFound
 from tensorhive.config import API
 from tensorhive.core.managers.TensorHiveManager import TensorHiveManager
+from tensorhive.core.utils.AllowedGPUIndex import AllowedGPUIndex
+from tensorhive.core.utils.records import render
+from tensorhive.database import db_session
 from tensorhive.models import User
-from tensorhive.models.Resource import Resource
+from functools import lru_cache, partial
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+from werkzeug.http import quote_etag
+import hashlib
 
 NODES = API.RESPONSES['nodes']
 
 
-def get_infrastructure():
-    # Make a copy of infrastructure
-    infrastructure = copy.deepcopy(TensorHiveManager().infrastructure_manager.infrastructure)
+def get_allowed_gpus() -> Optional[FrozenSet[str]]:
+    '''UUIDs of GPUs the current user is allowed to see, None means all of them'''
+    if is_admin():
+        return None
+    return allowed_gpus_of(get_jwt_identity())
+
+
+def allowed_gpus_of(user_id: int, session=None) -> Optional[FrozenSet[str]]:
+    try:
+        return AllowedGPUIndex().get(user_id, session)
+    except NoResultFound:
+        # Such user does not exist
+        return frozenset()
+
 
-    # Try to save new and update existing GPU resources to database
+def stream_allowed_gpus(user_id: int) -> Optional[FrozenSet[str]]:
+    '''Same as allowed_gpus_of, called by InfrastructureStream when the request has already ended'''
+    # Scoped session may be shared with requests served meanwhile (e.g. by greenlets of the same thread),
+    # so the stream uses its own short-lived session
+    session = db_session.session_factory()
     try:
-        resources = Resource.all()
-        id_list = [resource.id for resource in resources]
-        for hostname, value in infrastructure.items():
-            gpu_list = value.get('GPU')
-            if gpu_list is not None:
-                for gpu_uuid, gpu_metrics in gpu_list.items():
-                    if gpu_uuid not in id_list:
-                        new_resource = Resource(
-                            id=gpu_uuid,
-                            name=gpu_metrics.get('name'),
-                            hostname=hostname
-                        )
-                        new_resource.save()
-                    else:
-                        for resource in resources:
-                            if resource.id == gpu_uuid and resource.hostname != hostname:
-                                resource.hostname = hostname
-                                resource.save()
-                                break
-    except Exception:
-        # In case of failure just return infrastructure
-        pass
-
-    if not is_admin():
-        try:
-            user = User.get(get_jwt_identity())
-            infrastructure = user.filter_infrastructure_by_user_restrictions(infrastructure)
-        except NoResultFound:
-            # Such user does not exist
-            return {}
-
-    return infrastructure
+        return allowed_gpus_of(user_id, session)
+    finally:
+        session.close()
+
+
+def get_infrastructure():
+    # Published snapshot is never modified, so it is read without copying (and must not be modified here).
+    # Records are rendered into JSON-compatible dicts only by endpoints which serve them (see `render`).
+    # Discovered GPUs are registered as resources by MonitoringService, so this is a pure read.
+    infrastructure = TensorHiveManager().infrastructure_manager.snapshot.nodes
+    return User.filter_infrastructure_by_gpus(infrastructure, get_allowed_gpus())
+
+
+@lru_cache(maxsize=256)
+def restriction_tag(allowed_gpus: Optional[FrozenSet[str]]) -> str:
+    if allowed_gpus is None:
+        return 'all'
+    return hashlib.sha1(','.join(sorted(allowed_gpus)).encode()).hexdigest()[:16]
+
+
+def get_infrastructure_if_modified(hostname: Optional[str] = None,
+                                   since_version: Optional[int] = None) -> Tuple[Optional[Dict], Dict[str, str]]:
+    '''
+    Same as get_infrastructure (or a single node only, if hostname is given), along with response headers.
+    ETag is made of the snapshot's version (or node's version) and of the set of GPUs visible to the user,
+    so None is returned instead of infrastructure when it matches If-None-Match (client's copy is up to date).
+    With since_version, only nodes which have changed after that snapshot version are returned.
+    '''
+    snapshot = TensorHiveManager().infrastructure_manager.snapshot
+    allowed_gpus = get_allowed_gpus()
+    version = snapshot.version if hostname is None else snapshot.node_versions.get(hostname, 0)
+    etag = '{}-{}'.format(version, restriction_tag(allowed_gpus))
+    headers = {'ETag': quote_etag(etag), 'X-Infrastructure-Version': str(snapshot.version)}
+    if request.if_none_match.contains(etag):
+        return None, headers
+
+    nodes = snapshot.nodes
+    if hostname is not None:
+        nodes = {hostname: nodes[hostname]} if hostname in nodes else {}
+    if since_version is not None:
+        nodes = {hostname: node for hostname, node in nodes.items()
+                 if snapshot.node_versions.get(hostname, 0) > since_version}
+    return User.filter_infrastructure_by_gpus(nodes, allowed_gpus), headers
 
 
 @jwt_required
-def get_all_data():
-    infrastructure = get_infrastructure()
-    return infrastructure, 200
+def get_all_data(since_version: int = None):
+    infrastructure, headers = get_infrastructure_if_modified(since_version=since_version)
+    if infrastructure is None:
+        return NoContent, 304, headers
+    return render(infrastructure), 200, headers
+
+
+@jwt_required
+def stream_all_data():
+    '''Server-Sent Events with changes of each node's data, see InfrastructureStream'''
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    last_version = int(last_event_id) if last_event_id.isdigit() else None
+    refresh_allowed_gpus = None if is_admin() else partial(stream_allowed_gpus, get_jwt_identity())
+    events = TensorHiveManager().infrastructure_stream.subscribe(get_allowed_gpus(), last_version,
+                                                                 refresh_allowed_gpus=refresh_allowed_gpus,
+                                                                 expires_at=get_raw_jwt().get('exp'))
+    # Proxies (e.g. nginx) must not buffer the stream
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(events, mimetype='text/event-stream', headers=headers)
 
 
 @jwt_required
 def get_hostnames():
-    infrastructure = get_infrastructure()
+    infrastructure, headers = get_infrastructure_if_modified()
+    if infrastructure is None:
+        return NoContent, 304, headers
     hostnames = infrastructure.keys()
-    return list(hostnames), 200
+    return list(hostnames), 200, headers
+
+
+@jwt_required
+def get_status():
+    hostnames = get_infrastructure().keys()
+    node_status = TensorHiveManager().infrastructure_manager.node_status()
+    return {hostname: node_status[hostname] for hostname in hostnames if hostname in node_status}, 200
 
 
 @jwt_required
 def get_cpu_metrics(hostname: str, metric_type: str = None):
+    infrastructure, headers = get_infrastructure_if_modified(hostname)
+    if infrastructure is None:
+        return NoContent, 304, headers
     try:
-        infrastructure = get_infrastructure()
         resource_data = infrastructure[hostname]['CPU']
 
         # No data about GPU
@@ -79,17 +138,19 @@ def get_cpu_metrics(hostname: str, metric_type: str = None):
             # Put only requested metric data for each GPU
             result = {uuid: gpu_data['metrics'][metric_type] for uuid, gpu_data in resource_data.items()}
     except (KeyError, AssertionError):
-        content, status = NoContent, 404
+        content, status, headers = NoContent, 404, {}
     else:
-        content, status = result, 200
+        content, status = render(result), 200
     finally:
-        return content, status
+        return content, status, headers
 
 
 @jwt_required
 def get_gpu_metrics(hostname: str, metric_type: str = None):
+    infrastructure, headers = get_infrastructure_if_modified(hostname)
+    if infrastructure is None:
+        return NoContent, 304, headers
     try:
-        infrastructure = get_infrastructure()
         resource_data = infrastructure[hostname]['GPU']
 
         '''
@@ -118,20 +179,69 @@ def get_gpu_metrics(hostname: str, metric_type: str = None):
             # Put only requested metric data for each GPU
             result = {uuid: gpu_data['metrics'][metric_type] for uuid, gpu_data in resource_data.items()}
     except (KeyError, AssertionError):
-        content, status = NoContent, 404
+        content, status, headers = NoContent, 404, {}
+    else:
+        content, status = render(result), 200
+    finally:
+        return content, status, headers
+
+
+def get_metrics_history(hostname: str, resource_type: str, since: Optional[float], until: Optional[float],
+                        metric_type: Optional[str]):
+    infrastructure, headers = get_infrastructure_if_modified(hostname)
+    if infrastructure is None:
+        return NoContent, 304, headers
+    try:
+        resource_data = infrastructure[hostname][resource_type]
+        # No data about resources
+        assert resource_data
+
+        infrastructure_manager = TensorHiveManager().infrastructure_manager
+        result = {}
+        for uuid in resource_data:
+            history = infrastructure_manager.metric_history(uuid, since, until, metric_type)
+            if history is not None:
+                result[uuid] = history
+    except (KeyError, AssertionError):
+        content, status, headers = NoContent, 404, {}
     else:
         content, status = result, 200
     finally:
-        return content, status
+        return content, status, headers
+
+
+@jwt_required
+def get_gpu_metrics_history(hostname: str, since: float = None, until: float = None, metric_type: str = None):
+    '''
+    Recent metrics of each GPU (available to the user) as columns of values,
+    sample times are UNIX timestamps shared by all metrics of a GPU.
+
+    Example:
+    {
+        '<GPU0_UUID>': {
+            'timestamps': [1577836800.0, 1577836805.0],
+            'metrics': {'utilization': {'values': [20, 25], 'unit': '%'}, ...}
+        }
+    }
+    '''
+    return get_metrics_history(hostname, 'GPU', since, until, metric_type)
+
+
+@jwt_required
+def get_cpu_metrics_history(hostname: str, since: float = None, until: float = None, metric_type: str = None):
+    '''Recent metrics of the node's CPU, in the same format as get_gpu_metrics_history'''
+    return get_metrics_history(hostname, 'CPU', since, until, metric_type)
 
 
 @jwt_required
 def get_gpu_processes(hostname: str):
+    infrastructure, headers = get_infrastructure_if_modified(hostname)
+    if infrastructure is None:
+        return NoContent, 304, headers
     try:
-        infrastructure = get_infrastructure()
         resource_data = infrastructure[hostname]['GPU']
         result = {uuid: gpu_data['processes'] for uuid, gpu_data in resource_data.items()}
-        response = result, 200
+        response = render(result), 200, headers
     except KeyError:
         response = NoContent, 404
     finally:
@@ -140,8 +250,10 @@ def get_gpu_processes(hostname: str):
 
 @jwt_required
 def get_gpu_info(hostname: str):
+    infrastructure, headers = get_infrastructure_if_modified(hostname)
+    if infrastructure is None:
+        return NoContent, 304, headers
     try:
-        infrastructure = get_infrastructure()
         resource_data = infrastructure[hostname]['GPU']
 
         def basic_info(full_dict):
@@ -155,9 +267,9 @@ def get_gpu_info(hostname: str):
     except KeyError:
         # TODO Theoretically possible that ['GPU'] can trigger this exception
         content = {'msg': NODES['hostname']['not_found']}
-        status = 404
+        status, headers = 404, {}
     finally:
-        return content, status
+        return content, status, headers
 
 
 def is_admin() -> bool:
@@ -115,6 +115,57 @@ def create(reservation: Dict[str, Any]) -> Tuple[Content, HttpStatusCode]:
         return content, status
 
 
+@jwt_required
+def create_batch(reservations: List[Dict[str, Any]]) -> Tuple[Content, HttpStatusCode]:
+    try:
+        new_reservations = [Reservation(
+            title=reservation['title'],
+            description=reservation['description'],
+            resource_id=reservation['resourceId'],
+            user_id=reservation['userId'],
+            start=reservation['start'],
+            end=reservation['end']
+        ) for reservation in reservations]
+        assert new_reservations, 'No reservations given'
+
+        if not is_admin() and not all(__is_reservation_owner(r) for r in new_reservations):
+            raise ForbiddenException("Cannot reserve resources in another user's name")
+
+        request_time_limit = timedelta(minutes=1)
+        starts_in_the_future = all((DateUtils.try_parse_string(r.start) + request_time_limit) >= datetime.utcnow()
+                                   for r in new_reservations)
+        if not is_admin() and not starts_in_the_future:
+            raise ForbiddenException("Cannot reserve resources in the past")
+
+        # Restrictions are checked once for each reserved resource
+        user = User.get(get_jwt_identity())
+        allowed = ReservationVerifier.are_reservations_allowed(user, new_reservations)
+        if not all(allowed):
+            raise ForbiddenException('Reservations at positions {} not allowed'.format(
+                ', '.join(str(position) for position, is_allowed in enumerate(allowed) if not is_allowed)))
+
+        Reservation.save_all(new_reservations)
+        content = {
+            'msg': RESERVATION['create_batch']['success'],
+            'reservations': [reservation.as_dict() for reservation in new_reservations]
+        }
+        status = 201
+    except ForbiddenException as e:
+        content = {
+            'msg': RESERVATION['create_batch']['failure']['forbidden'].format(reason=e)
+        }
+        status = 403
+    except AssertionError as e:
+        content = {'msg': RESERVATION['create_batch']['failure']['invalid'].format(reason=e)}
+        status = 422
+    except Exception as e:
+        log.critical(e)
+        content = {'msg': GENERAL['internal_error'] + str(e)}
+        status = 500
+    finally:
+        return content, status
+
+
 @jwt_required
 def update(id: ReservationId, newValues: Dict[str, Any]) -> Tuple[Content, HttpStatusCode]:
     new_values = newValues
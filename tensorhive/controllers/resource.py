@@ -4,7 +4,6 @@ from typing import Any, Dict, List, Tuple
 from flask_jwt_extended import jwt_required
 from sqlalchemy.orm.exc import NoResultFound
 from tensorhive.config import API
-from tensorhive.controllers.nodes import get_infrastructure
 from tensorhive.models.Resource import Resource
 
 log = logging.getLogger(__name__)
@@ -19,7 +18,6 @@ ResourceUUID = int
 
 @jwt_required
 def get() -> Tuple[List[Any], HttpStatusCode]:
-    get_infrastructure()  # Save new GPUs in database
     return [
         resource.as_dict() for resource in Resource.all()
     ], HTTPStatus.OK.value
@@ -27,7 +25,6 @@ def get() -> Tuple[List[Any], HttpStatusCode]:
 
 @jwt_required
 def get_by_id(uuid: ResourceUUID) -> Tuple[Content, HttpStatusCode]:
-    get_infrastructure()  # Save new GPUs in database
     try:
         resource = Resource.get(uuid)
     except NoResultFound as e:
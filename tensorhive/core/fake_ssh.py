@@ -0,0 +1,477 @@
+"""
+In-process stand-in for pssh's ParallelSSHClient which simulates a cluster of GPU nodes.
+It is selected with `[ssh] backend = fake` (see `[fake_cluster]` in main_config.ini for its settings)
+and is meant for development without real machines, tests and benchmarks.
+
+Commands are not executed, instead they are recognized and answered with output that looks like
+the output of the real programs (nvidia-smi, pmon, ps, screen, who, /proc/stat), generated from the state
+of simulated nodes. Processes can be spawned on the nodes and killed, either through commands sent
+by TensorHive (screen, kill) or directly from Python:
+
+    cluster = FakeCluster(['node0', 'node1'], gpus_per_node=2, latency=0.01)
+    pid = cluster.node('node0').spawn('alice', 'python train.py', gpu_index=1)
+    client = FakeParallelSSHClient(['node0', 'node1'], cluster=cluster)
+    output = client.run_command('who')
+
+Round trips cost `latency` seconds (gevent.sleep, so hosts are handled concurrently). A fraction of commands
+can fail with a connection error (`failure_rate`) or hang until `timeout` (`timeout_rate`).
+"""
+from tensorhive.config import SSH, FAKE_CLUSTER
+from tensorhive.core.monitors import agent, probe
+from pssh.exceptions import ConnectionErrorException, Timeout
+from typing import Dict, Generator, Iterable, List, Optional, Tuple
+import random
+import re
+import threading
+import uuid
+import gevent
+import logging
+log = logging.getLogger(__name__)
+
+CommandOutput = Tuple[List[str], int]
+
+GPU_NAME = 'GeForce GTX 1080 Ti'
+GPU_MEMORY_TOTAL = 11178
+# nvidia-smi field name -> header printed with `--format=csv,nounits`
+QUERY_GPU_HEADERS = {
+    'uuid': 'uuid',
+    'name': 'name',
+    'index': 'index',
+    'fan.speed': 'fan.speed [%]',
+    'memory.free': 'memory.free [MiB]',
+    'memory.used': 'memory.used [MiB]',
+    'memory.total': 'memory.total [MiB]',
+    'utilization.gpu': 'utilization.gpu [%]',
+    'utilization.memory': 'utilization.memory [%]',
+    'temperature.gpu': 'temperature.gpu',
+    'power.draw': 'power.draw [W]'
+}
+NVIDIA_SMI_FAILED = 'NVIDIA-SMI has failed because it couldn\'t communicate with the NVIDIA driver.'
+
+_section_regex = re.compile(r'echo "{begin} (\S+)"\n\(\n(.*?)\n\)\necho "{end} \1 \$\?"'.format(
+    begin=probe.BEGIN_MARKER, end=probe.END_MARKER), re.DOTALL)
+_stream_regex = re.compile(r'\(\n(.*?)\n\) 2>/dev/null \| while IFS= read -r line; do echo "{marker} (\S+) \$line"'
+                           .format(marker=agent.STREAM_MARKER), re.DOTALL)
+_screen_spawn_regex = re.compile(r'screen -Dm -S (\S+) bash -c "(.*?)\s*(?:\|& tee .*?\$\((.*?)\))?\s*" &')
+
+
+class FakeProcess():
+    __slots__ = ['pid', 'owner', 'command', 'gpu_index', 'mem_used', 'session']
+
+    def __init__(self, pid: int, owner: str, command: str, gpu_index: Optional[int] = None, mem_used: int = 0,
+                 session: Optional[str] = None) -> None:
+        self.pid = pid
+        self.owner = owner
+        self.command = command
+        self.gpu_index = gpu_index
+        self.mem_used = mem_used
+        # Name of the screen session, set only for session's main process
+        self.session = session
+
+
+class FakeNode():
+    '''Single simulated machine, its state is mutated by commands, so it is guarded by a lock'''
+
+    def __init__(self, hostname: str, gpus: int, seed: Optional[int] = None) -> None:
+        self.hostname = hostname
+        self.reachable = True
+        self.gpus = [{
+            'uuid': 'GPU-{}'.format(uuid.uuid5(uuid.NAMESPACE_DNS, '{}/{}'.format(hostname, index))),
+            'name': GPU_NAME,
+            'index': index,
+            'mem_total': GPU_MEMORY_TOTAL
+        } for index in range(gpus)]
+        self.processes = {}  # type: Dict[int, FakeProcess]
+        # Terminal sessions listed by `who`: [(username, tty), ...]
+        self.tty_sessions = []  # type: List[Tuple[str, str]]
+        # Content of log files written by screen sessions
+        self.logs = {}  # type: Dict[str, List[str]]
+        self.cores = 8
+        self._cpu_times = [[0] * 10 for _ in range(self.cores)]
+        self._next_pid = 1000
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+
+    def spawn(self, owner: str, command: str, gpu_index: Optional[int] = None, mem_used: Optional[int] = None,
+              session: Optional[str] = None) -> int:
+        '''Starts a simulated process, returns its pid'''
+        with self._lock:
+            pid = self._next_pid
+            self._next_pid += 1
+            if gpu_index is not None and mem_used is None:
+                mem_used = self._random.randrange(500, 4000)
+            self.processes[pid] = FakeProcess(pid, owner, command, gpu_index, mem_used or 0, session)
+            return pid
+
+    def kill(self, pid: int) -> bool:
+        '''Terminates a process (along with other processes of its screen session), False if it did not exist'''
+        with self._lock:
+            process = self.processes.pop(pid, None)
+            if process is None:
+                return False
+            if process.session is not None:
+                for child in [p for p in self.processes.values() if p.session == process.session]:
+                    del self.processes[child.pid]
+            return True
+
+    def login(self, username: str) -> str:
+        '''Opens a terminal session, returns its tty'''
+        tty = 'pts/{}'.format(len(self.tty_sessions))
+        self.tty_sessions.append((username, tty))
+        return tty
+
+    def gpu_processes(self, gpu_index: int) -> List[FakeProcess]:
+        return [process for process in list(self.processes.values()) if process.gpu_index == gpu_index]
+
+    def execute(self, command: str, user: str) -> CommandOutput:
+        '''Answers a command (or a probe script) as `user` would see it'''
+        sections = _section_regex.findall(command)
+        if not sections:
+            return self._execute_command(command.strip(), user)
+
+        lines = []  # type: List[str]
+        for name, section_command in sections:
+            section_lines, exit_code = self._execute_fragment(section_command, user)
+            lines.append('{} {}'.format(probe.BEGIN_MARKER, name))
+            lines.extend(section_lines)
+            lines.append('{} {} {}'.format(probe.END_MARKER, name, exit_code))
+        return lines, 0
+
+    def _execute_fragment(self, command: str, user: str) -> CommandOutput:
+        '''Recognizes shell fragments contributed by monitors'''
+        if command.strip() == 'true':
+            return [], 0
+        if '/proc/stat' in command:
+            return self.proc_stat() + self.meminfo(), 0
+        if not self.gpus and 'nvidia-smi' in command:
+            return [NVIDIA_SMI_FAILED], 9
+        if '--query-compute-apps' in command:
+            return self.compute_apps() + self.owners(), 0
+        if 'pmon' in command:
+            return self.pmon() + self.owners(), 0
+        query_match = re.search(r'--query-gpu=(\S+) --format=(\S+)', command)
+        if query_match:
+            fields, format_options = query_match.group(1).split(','), query_match.group(2).split(',')
+            return self.query_gpu(fields, header='noheader' not in format_options), 0
+        return self._execute_command(command.strip(), user)
+
+    def _execute_command(self, command: str, user: str) -> CommandOutput:
+        '''Recognizes single commands issued by services and controllers'''
+        spawn_match = _screen_spawn_regex.match(command)
+        if spawn_match:
+            return self._screen_spawn(spawn_match.group(1), spawn_match.group(2), spawn_match.group(3), user)
+
+        kill_match = re.match(r'^(sudo )?kill (-\d+ )?(\d+)', command)
+        if kill_match:
+            pid = int(kill_match.group(3))
+            process = self.processes.get(pid)
+            if process is None:
+                return ['kill: ({}) - No such process'.format(pid)], 1
+            if process.owner != user and not kill_match.group(1):
+                return ['kill: ({}) - Operation not permitted'.format(pid)], 1
+            self.kill(pid)
+            return [], 0
+
+        screen_match = re.match(r'^screen (?:-X -S|-S) (\d+) (?:quit|-X stuff)', command)
+        if screen_match:
+            pid = int(screen_match.group(1))
+            if pid not in self.processes:
+                return ['No screen session found.'], 1
+            self.kill(pid)
+            return [], 0
+
+        ps_match = re.match(r'^ps --no-headers -o user (\d+)$', command)
+        if ps_match:
+            process = self.processes.get(int(ps_match.group(1)))
+            return ([process.owner], 0) if process is not None else ([], 1)
+
+        if command.startswith('screen -ls'):
+            return self.screen_ls(user, command), 0
+        if command == 'who':
+            return self.who(), 0
+        if command == 'uname':
+            return ['Linux'], 0
+        if command.startswith('echo -e'):
+            return [], 0
+        log_match = re.match(r'^(cat|tail) (\S+)$', command)
+        if log_match:
+            if log_match.group(2) not in self.logs:
+                return ['{}: {}: No such file or directory'.format(log_match.group(1), log_match.group(2))], 1
+            content = self.logs[log_match.group(2)]
+            return (content[-10:] if log_match.group(1) == 'tail' else content), 0
+        return ['bash: {}: command not found'.format(command.split()[0] if command else '')], 127
+
+    def _screen_spawn(self, session_name: str, command: str, logfile_command: Optional[str],
+                      user: str) -> CommandOutput:
+        gpu_match = re.search(r'CUDA_VISIBLE_DEVICES=(\d+)', command)
+        gpu_index = int(gpu_match.group(1)) if gpu_match else None
+        if gpu_index is not None and gpu_index >= len(self.gpus):
+            gpu_index = None
+        with self._lock:
+            session = '{}.{}'.format(self._next_pid, session_name)
+            pid = self.spawn(user, 'SCREEN -Dm -S {}'.format(session_name), session=session)
+            # Actual command is a child of the screen session
+            self.spawn(user, command, gpu_index=gpu_index, session=session)
+        if logfile_command:
+            path_match = re.search(r'echo (\S+)$', logfile_command)
+            path = path_match.group(1) if path_match else '~/TensorHiveLogs/{}.log'.format(session_name)
+            self.logs[path] = ['Running: {}'.format(command)]
+        return [str(pid)], 0
+
+    def query_gpu(self, fields: List[str], header: bool = True) -> List[str]:
+        '''
+        Output of `nvidia-smi --query-gpu=<fields> --format=csv,nounits`, e.g.:
+            uuid, fan.speed [%], memory.used [MiB], power.draw [W]
+            GPU-1a2b3c4d-..., 46, 3012, 151.37
+        '''
+        lines = [', '.join(QUERY_GPU_HEADERS.get(field, field) for field in fields)] if header else []
+        for gpu in self.gpus:
+            processes = self.gpu_processes(gpu['index'])
+            mem_used = min(gpu['mem_total'], 2 + sum(process.mem_used for process in processes))
+            utilization = self._random.randrange(60, 100) if processes else 0
+            values = {
+                'uuid': gpu['uuid'],
+                'name': gpu['name'],
+                'index': gpu['index'],
+                'fan.speed': 23 + utilization // 3,
+                'memory.free': gpu['mem_total'] - mem_used,
+                'memory.used': mem_used,
+                'memory.total': gpu['mem_total'],
+                'utilization.gpu': utilization,
+                'utilization.memory': utilization // 3,
+                'temperature.gpu': 35 + utilization * 2 // 5,
+                'power.draw': '{:.2f}'.format(15 + utilization * 2 + self._random.random())
+            }
+            lines.append(', '.join(str(values.get(field, '[Not Supported]')) for field in fields))
+        return lines
+
+    def compute_apps(self) -> List[str]:
+        '''Output of `nvidia-smi --query-compute-apps=...` preceded by its block header, see GPUMonitor'''
+        lines = ['[COMPUTE APPS]']
+        for gpu in self.gpus:
+            lines.extend('{}, {}, {}, {}'.format(gpu['uuid'], process.pid, process.mem_used,
+                                                 process.command.split()[0])
+                         for process in self.gpu_processes(gpu['index']))
+        return lines
+
+    def pmon(self) -> List[str]:
+        '''Output of `nvidia-smi pmon --count 1 --id <uuid>` for each GPU, see GPUMonitor'''
+        lines = []  # type: List[str]
+        for gpu in self.gpus:
+            lines.append('UUID={}'.format(gpu['uuid']))
+            lines.append('# gpu        pid  type    sm   mem   enc   dec   command')
+            lines.append('# Idx          #   C/G     %     %     %     %   name')
+            processes = self.gpu_processes(gpu['index'])
+            for process in processes:
+                lines.append('{:>5} {:>10}     C {:>5} {:>5}     0     0   {}'.format(
+                    gpu['index'], process.pid, self._random.randrange(0, 100), self._random.randrange(0, 50),
+                    process.command.split()[0]))
+            if not processes:
+                lines.append('{:>5}          -     -     -     -     -     -   -'.format(gpu['index']))
+        return lines
+
+    def owners(self) -> List[str]:
+        '''Owners block of GPU processes, as printed by `ps --no-headers -o pid=,user:32= -p <pids>`'''
+        return ['[OWNERS]'] + [' {:>5} {}'.format(process.pid, process.owner)
+                               for process in list(self.processes.values()) if process.gpu_index is not None]
+
+    def proc_stat(self) -> List[str]:
+        '''`cpu` lines of /proc/stat, counters grow between calls according to the number of processes'''
+        busy_cores = min(self.cores, len(self.processes))
+        for core, times in enumerate(self._cpu_times):
+            busy = self._random.randrange(80, 100) if core < busy_cores else self._random.randrange(0, 5)
+            times[0] += busy
+            times[3] += 100 - busy
+            times[4] += self._random.randrange(0, 2)
+        total = [sum(column) for column in zip(*self._cpu_times)]
+        lines = ['cpu  ' + ' '.join(map(str, total))]
+        lines.extend('cpu{} {}'.format(core, ' '.join(map(str, times))) for core, times in enumerate(self._cpu_times))
+        return lines
+
+    def meminfo(self) -> List[str]:
+        used = 4 * 1024 * 1024 + 512 * 1024 * len(self.processes)
+        return [
+            'MemTotal:       65856000 kB',
+            'MemFree:        {:>8} kB'.format(max(65856000 - used - 8 * 1024 * 1024, 0)),
+            'Buffers:          524288 kB',
+            'Cached:          7340032 kB',
+            'SReclaimable:     524288 kB'
+        ]
+
+    def who(self) -> List[str]:
+        return ['{:<8} {:<12} 2020-01-01 12:00 (10.0.0.1)'.format(username, tty)
+                for username, tty in self.tty_sessions]
+
+    def screen_ls(self, user: str, command: str) -> List[str]:
+        '''Session names (`pid.name`) after `cut` and `sed`, filtered with the `grep` pattern if present'''
+        sessions = [process.session for process in list(self.processes.values())
+                    if process.owner == user and (process.session or '').startswith('{}.'.format(process.pid))]
+        grep_match = re.search(r'grep -e "(.*?)"', command)
+        if grep_match:
+            sessions = [session for session in sessions if re.search(grep_match.group(1), session)]
+        return sessions
+
+
+class FakeChannel():
+    closed = False
+
+
+class FakeHostOutput():
+    '''Mimics pssh.output.HostOutput'''
+
+    def __init__(self, host: str, cmd: str, stdout: Iterable[str], exit_code: Optional[int] = None,
+                 exception: Optional[Exception] = None) -> None:
+        self.host = host
+        self.cmd = cmd
+        self.channel = FakeChannel()
+        self.stdout = iter(stdout)
+        self.stderr = iter([])  # type: Iterable[str]
+        self.stdin = None
+        self.exit_code = exit_code
+        self.exception = exception
+
+
+class FakeCluster():
+    '''Simulated nodes, nodes which are not known yet are created on first use'''
+
+    def __init__(self, hostnames: Iterable[str] = (), gpus_per_node: int = 4, processes_per_node: int = 0,
+                 latency: float = 0.0, failure_rate: float = 0.0, timeout_rate: float = 0.0,
+                 timeout: float = 10.0, seed: Optional[int] = None) -> None:
+        self.gpus_per_node = gpus_per_node
+        self.processes_per_node = processes_per_node
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+        self.seed = seed
+        self.nodes = {}  # type: Dict[str, FakeNode]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        for hostname in hostnames:
+            self.node(hostname)
+
+    def node(self, hostname: str, owners: Iterable[str] = ()) -> FakeNode:
+        with self._lock:
+            if hostname not in self.nodes:
+                node = FakeNode(hostname, self.gpus_per_node, seed=self._random.randrange(2 ** 32))
+                owners = list(owners) or ['user{}'.format(i) for i in range(self.processes_per_node)]
+                for i in range(self.processes_per_node):
+                    gpu_index = i % self.gpus_per_node if self.gpus_per_node else None
+                    node.spawn(owners[i % len(owners)], 'python train.py', gpu_index=gpu_index)
+                self.nodes[hostname] = node
+            return self.nodes[hostname]
+
+    def execute(self, hostname: str, command: str, user: str) -> FakeHostOutput:
+        '''Single round trip to a node, with injected failures'''
+        node = self.node(hostname)
+        chance = self._random.random()
+        if not node.reachable or chance < self.failure_rate:
+            gevent.sleep(self.latency)
+            error = ConnectionErrorException('Error connecting to host {} - simulated failure'.format(hostname))
+            return FakeHostOutput(hostname, command, [], exception=error)
+        if chance < self.failure_rate + self.timeout_rate:
+            gevent.sleep(self.timeout)
+            return FakeHostOutput(hostname, command, [], exception=Timeout())
+
+        gevent.sleep(self.latency)
+        if agent.CYCLE_MARKER in command:
+            output = FakeHostOutput(hostname, command, [])
+            output.stdout = self._agent_stdout(node, command, user, output.channel)
+            return output
+        lines, exit_code = node.execute(command, user)
+        return FakeHostOutput(hostname, command, lines, exit_code=exit_code)
+
+    def _agent_stdout(self, node: FakeNode, script: str, user: str, channel: FakeChannel) -> Generator:
+        '''Endless output of the agent script (see tensorhive.core.monitors.agent), until channel is closed'''
+        interval = float(re.search(r'while sleep (\S+); do', script).group(1))
+        cycle_script, stream_script = script.split('cycle() {', 1)[1].split(agent.CYCLE_MARKER, 1)
+        streams = _stream_regex.findall(stream_script)
+        while not channel.closed and node.reachable:
+            lines, _ = node.execute(cycle_script, user)
+            yield from lines
+            yield agent.CYCLE_MARKER
+            for command, name in streams:
+                stream_lines, _ = node._execute_fragment(command, user)
+                for line in stream_lines:
+                    yield '{} {} {}'.format(agent.STREAM_MARKER, name, line)
+            gevent.sleep(interval)
+
+
+class FakeSSHClient():
+    '''Mimics pssh.clients.native.SSHClient of a single host'''
+
+    def __init__(self, cluster: FakeCluster, host: str, user: str) -> None:
+        self.cluster = cluster
+        self.host = host
+        self.user = user
+
+    def run_command(self, command: str, **kwargs):
+        output = self.cluster.execute(self.host, command, self.user)
+        if output.exception is not None:
+            raise output.exception
+        return output.channel, self.host, output.stdout, output.stderr, output.stdin
+
+    def close_channel(self, channel: FakeChannel) -> None:
+        channel.closed = True
+
+
+class FakeParallelSSHClient():
+    '''Mimics pssh.clients.native.ParallelSSHClient, all hosts are handled concurrently'''
+
+    def __init__(self, hosts: Iterable[str], host_config: Optional[Dict] = None, user: Optional[str] = None,
+                 cluster: Optional[FakeCluster] = None, **kwargs) -> None:
+        self.hosts = list(hosts)
+        self.host_config = host_config or {}
+        self.user = user
+        self.cluster = cluster or default_cluster()
+        self._host_clients = {}  # type: Dict[str, FakeSSHClient]
+
+    def _user(self, host: str) -> str:
+        return self.host_config.get(host, {}).get('user') or self.user or 'root'
+
+    @property
+    def host_clients(self) -> Dict[str, FakeSSHClient]:
+        for host in self.hosts:
+            if host not in self._host_clients:
+                self._host_clients[host] = FakeSSHClient(self.cluster, host, self._user(host))
+        return self._host_clients
+
+    def run_command(self, command: str, stop_on_errors: bool = True, **kwargs) -> Dict[str, FakeHostOutput]:
+        greenlets = {host: gevent.spawn(self.cluster.execute, host, command, self._user(host)) for host in self.hosts}
+        gevent.joinall(list(greenlets.values()))
+        output = {host: greenlet.get() for host, greenlet in greenlets.items()}
+        if stop_on_errors:
+            for host_output in output.values():
+                if host_output.exception is not None:
+                    raise host_output.exception
+        return output
+
+    def join(self, output: Dict[str, FakeHostOutput], **kwargs) -> None:
+        pass
+
+
+_default_cluster = None  # type: Optional[FakeCluster]
+
+
+def default_cluster() -> FakeCluster:
+    '''Cluster shared by all clients of the fake backend, configured by [fake_cluster]'''
+    global _default_cluster
+    if _default_cluster is None:
+        _default_cluster = FakeCluster(gpus_per_node=FAKE_CLUSTER.GPUS_PER_NODE,
+                                       processes_per_node=FAKE_CLUSTER.PROCESSES_PER_NODE,
+                                       latency=FAKE_CLUSTER.LATENCY,
+                                       failure_rate=FAKE_CLUSTER.FAILURE_RATE,
+                                       timeout_rate=FAKE_CLUSTER.TIMEOUT_RATE,
+                                       timeout=SSH.TIMEOUT,
+                                       seed=FAKE_CLUSTER.SEED)
+        users = sorted({node_config['user'] for node_config in SSH.AVAILABLE_NODES.values()})
+        for hostname in SSH.AVAILABLE_NODES:
+            _default_cluster.node(hostname, owners=users)
+        log.warning('[•] Using simulated SSH backend with {} nodes'.format(len(SSH.AVAILABLE_NODES)))
+    return _default_cluster
+
+
+def set_default_cluster(cluster: FakeCluster) -> None:
+    '''Replaces the cluster used by clients which were not given one explicitly'''
+    global _default_cluster
+    _default_cluster = cluster
@@ -1,26 +1,296 @@
 from typing import Dict
+from tensorhive.core.utils.MetricHistory import MetricHistory
+from tensorhive.core.utils.ProcessIndex import ProcessIndex
+from tensorhive.core.utils.records import CPURecord, GPURecord, Record, metric_item, metric_value, render
 import json
 import logging
-from typing import List
+import os
+import threading
+import time
+from typing import Iterable, List, NamedTuple, Optional, Tuple
 log = logging.getLogger(__name__)
 
+# Published, read-only state of the infrastructure (same structure as InfrastructureManager.infrastructure)
+# along with the version in which each node has changed for the last time
+InfrastructureSnapshot = NamedTuple('InfrastructureSnapshot', [('version', int), ('nodes', Dict[str, Dict]),
+                                                               ('node_versions', Dict[str, int])])
+
 
 class InfrastructureManager():
     '''
     Holds the state/representation of discovered/known infrastruture with metrics
+
+    `infrastructure` is the working state, modified in place by monitors (monitoring thread only).
+    Other threads (API, services) read `snapshot` instead: after each update of a node, its state is copied
+    into a new snapshot with a higher version, which replaces the previous one with a single reference swap.
+    Snapshots are never modified, so readers neither copy nor lock them (and must not modify them either).
+    Nodes which have not changed are shared between consecutive snapshots.
+
+    GPUs, CPUs and processes are kept as compact records (see tensorhive.core.utils.records),
+    which are rendered into the JSON format of the API only when served (see `render`).
     '''
+    # Version of the file format written by `save_snapshot`
+    snapshot_format = 1
+    # Resource types which are stored as records, other values (e.g. of custom monitors) are restored as they are
+    record_types = {'GPU': GPURecord, 'CPU': CPURecord}
 
-    def __init__(self, available_nodes):
+    def __init__(self, available_nodes, history_capacity: int = 0):
         self._infrastructure = {}  # type: Dict
         for node in available_nodes.keys():
             self._infrastructure[node] = {}  # type: Dict
+        # Static GPU properties (name, index, mem_total) for each node, keyed by UUID
+        self._gpu_inventory = {}  # type: Dict[str, Dict[str, Dict]]
+        # Incremented whenever inventory of any node changes
+        self._gpu_inventory_version = 0
+        # Where each GPU from inventories is, and the other way round, see `gpu_location` and `gpu_uuid`.
+        # Rebuilt (and replaced) only when inventory changes, so lookups cost O(1) and need no lock.
+        self._gpu_locations = {}  # type: Dict[str, Tuple[str, int]]
+        self._gpu_uuids = {}  # type: Dict[Tuple[str, int], str]
+        # When data of each node was updated for the last time (timestamp) and whether it is outdated
+        self._node_status = {node: {'last_updated': None, 'stale': True}
+                             for node in available_nodes.keys()}  # type: Dict[str, Dict]
+        # Recent metrics of each GPU and CPU, up to `history_capacity` samples each (0 disables history)
+        self._metric_history = MetricHistory(history_capacity)
+        self._snapshot = InfrastructureSnapshot(version=0, nodes={node: {} for node in available_nodes.keys()},
+                                                node_versions={node: 0 for node in available_nodes.keys()})
+        self._publish_lock = threading.Lock()
+        # Index of GPU processes of the latest snapshot, see `process_index`
+        self._process_index = ProcessIndex(self._snapshot.nodes, self._snapshot.version)
 
     @property
     def infrastructure(self) -> Dict:
         return self._infrastructure
 
-    def node_gpu_processes(self, hostname: str) -> Dict:
+    @property
+    def snapshot(self) -> InfrastructureSnapshot:
+        '''The latest published state, safe to read from any thread'''
+        return self._snapshot
+
+    @staticmethod
+    def _copy_node(node: Dict) -> Dict:
+        '''
+        Copies containers which monitors modify in place (resource records, their metrics and process lists).
+        Metric values and processes themselves are replaced, not modified, so they are shared.
+        '''
+        node_copy = {}
+        for resource_type, resources in node.items():
+            if not isinstance(resources, dict):
+                # No data (None) or custom monitor's value
+                node_copy[resource_type] = list(resources) if isinstance(resources, list) else resources
+                continue
+            node_copy[resource_type] = {}
+            for uuid, record in resources.items():
+                if isinstance(record, Record):
+                    node_copy[resource_type][uuid] = record.copy()
+                    continue
+                # Plain dict, e.g. from a custom monitor
+                record = dict(record)
+                if record.get('metrics') is not None:
+                    record['metrics'] = dict(record['metrics'])
+                if record.get('processes') is not None:
+                    record['processes'] = list(record['processes'])
+                node_copy[resource_type][uuid] = record
+        return node_copy
+
+    def publish(self, hostnames: Optional[Iterable[str]] = None) -> InfrastructureSnapshot:
+        '''Publishes current state of given nodes (all by default) as a new snapshot'''
+        with self._publish_lock:
+            version = self._snapshot.version + 1
+            nodes = dict(self._snapshot.nodes)
+            node_versions = dict(self._snapshot.node_versions)
+            for hostname in (self._infrastructure if hostnames is None else hostnames):
+                nodes[hostname] = self._copy_node(self._infrastructure[hostname])
+                node_versions[hostname] = version
+            self._snapshot = InfrastructureSnapshot(version=version, nodes=nodes, node_versions=node_versions)
+            return self._snapshot
+
+    def save_snapshot(self, path: str) -> None:
+        '''
+        Writes the latest snapshot (with GPU inventories and update times of nodes) to a JSON file,
+        so that it can be served right after restart, see `load_snapshot`.
+        The file is replaced atomically, raises OSError.
+        '''
+        snapshot = self._snapshot
+        data = {
+            'format': self.snapshot_format,
+            'saved_at': time.time(),
+            'nodes': render(snapshot.nodes),
+            'gpu_inventory': render(self._gpu_inventory),
+            'last_updated': {hostname: status['last_updated'] for hostname, status in self._node_status.items()}
+        }
+        temporary_path = '{}.tmp'.format(path)
+        with open(temporary_path, 'w') as file:
+            # dumps is much faster than dump, which does not use the C encoder
+            file.write(json.dumps(data, separators=(',', ':')))
+        os.replace(temporary_path, path)
+
+    def load_snapshot(self, path: str) -> bool:
+        '''
+        Restores state saved by `save_snapshot` (only of nodes which are still configured) and publishes it.
+        All nodes are marked as stale, until monitors update them. Returns False if there is no valid file.
+        Processes are not restored, so that services do not act on them.
+        '''
+        try:
+            with open(path) as file:
+                data = json.loads(file.read())
+            assert data.get('format') == self.snapshot_format, 'Unsupported format: {}'.format(data.get('format'))
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            log.warning('Could not load infrastructure snapshot from {}: {}'.format(path, e))
+            return False
+
+        for hostname, node in data['nodes'].items():
+            if hostname not in self._infrastructure:
+                continue
+            for resource_type, record_type in self.record_types.items():
+                if node.get(resource_type) is not None:
+                    node[resource_type] = {uuid: record_type.from_dict(record)
+                                           for uuid, record in node[resource_type].items()}
+            # Processes may have ended long ago and their PIDs may have been reused since
+            for gpu in (node.get('GPU') or {}).values():
+                gpu.processes = None
+            self._infrastructure[hostname] = node
+            self._node_status[hostname] = {'last_updated': data['last_updated'].get(hostname), 'stale': True}
+        # Indexed once, instead of after each node (see `set_gpu_inventory`)
+        self._gpu_inventory.update({hostname: inventory for hostname, inventory in data['gpu_inventory'].items()
+                                    if hostname in self._infrastructure})
+        self._gpu_inventory_version += 1
+        self._index_gpus()
+        self.publish()
+        log.info('Infrastructure snapshot from {} loaded (saved {:.0f}s ago)'.format(
+            path, time.time() - data['saved_at']))
+        return True
+
+    def record_history(self, resources: Dict[str, Dict]) -> None:
+        '''Appends current metrics of given resources (records keyed by UUID, see `infrastructure`) to history'''
+        now = time.time()
+        for uuid, record in resources.items():
+            self._metric_history.append(uuid, record['metrics'], now)
+
+    def metric_history(self, uuid: str, since: Optional[float] = None, until: Optional[float] = None,
+                       metric_type: Optional[str] = None) -> Optional[Dict]:
+        '''Columnar history of a single GPU or CPU within given time window, see MetricHistory.window'''
+        return self._metric_history.window(uuid, since, until, metric_type)
+
+    def mark_updated(self, hostname: str) -> None:
+        '''Node has just been probed (successfully or not), so its data is up to date and gets published'''
+        self._node_status[hostname] = {'last_updated': time.time(), 'stale': False}
+        self.publish([hostname])
+
+    def mark_stale(self, hostname: str) -> None:
+        '''Node did not answer in time, its data from the last successful update is kept'''
+        self._node_status.setdefault(hostname, {'last_updated': None})['stale'] = True
+
+    def node_status(self) -> Dict[str, Dict]:
+        '''
+        Example result:
+        {
+            "example_host_0": {"last_updated": 1577836800.0, "age": 2.04, "stale": False},
+            "example_host_1": {"last_updated": 1577836740.0, "age": 62.04, "stale": True},
+            # Never updated
+            "example_host_2": {"last_updated": None, "age": None, "stale": True}
+        }
+        '''
+        now = time.time()
+        result = {}
+        for hostname, status in self._node_status.items():
+            last_updated = status['last_updated']
+            result[hostname] = {
+                'last_updated': last_updated,
+                'age': round(now - last_updated, 2) if last_updated is not None else None,
+                'stale': status['stale']
+            }
+        return result
+
+    def gpu_inventory(self, hostname: str) -> Optional[Dict[str, Dict]]:
+        return self._gpu_inventory.get(hostname)
+
+    def set_gpu_inventory(self, hostname: str, inventory: Optional[Dict[str, Dict]]) -> None:
         '''
+        Example inventory:
+        {
+            "GPU-c6d01ed6-8240-2e11-efe9-aa32794b8273": {
+                "name": "GeForce GTX 1060 6GB",
+                "index": 0,
+                "mem_total": {"value": 6078, "unit": "MiB"}
+            }
+        }
+        '''
+        if self._gpu_inventory.get(hostname) == inventory:
+            return
+        if inventory is None:
+            self._gpu_inventory.pop(hostname, None)
+        else:
+            self._gpu_inventory[hostname] = inventory
+        self._gpu_inventory_version += 1
+        self._index_gpus()
+
+    def _index_gpus(self) -> None:
+        locations = {}  # type: Dict[str, Tuple[str, int]]
+        for hostname, inventory in self._gpu_inventory.items():
+            for uuid, gpu in inventory.items():
+                locations[uuid] = (hostname, metric_value(gpu, 'index'))
+        self._gpu_uuids = {location: uuid for uuid, location in locations.items()}
+        self._gpu_locations = locations
+
+    def gpu_location(self, uuid: str) -> Optional[Tuple[str, int]]:
+        '''(hostname, index) of GPU with given UUID, None if it is not in any inventory'''
+        return self._gpu_locations.get(uuid)
+
+    def gpu_uuid(self, hostname: str, index: int) -> Optional[str]:
+        '''UUID of GPU with given index (as in nvidia-smi and CUDA_VISIBLE_DEVICES) on given node'''
+        return self._gpu_uuids.get((hostname, index))
+
+    @property
+    def gpu_uuids(self) -> Dict[Tuple[str, int], str]:
+        '''UUIDs of all GPUs keyed by (hostname, index), the returned dict is never modified'''
+        return self._gpu_uuids
+
+    @property
+    def gpu_inventory_version(self) -> int:
+        return self._gpu_inventory_version
+
+    def gpu_locations(self) -> Dict[str, Tuple[str, Optional[str]]]:
+        '''Hostname and name of every GPU known from inventories, keyed by UUID'''
+        return {uuid: (hostname, gpu['name'])
+                for hostname, inventory in self._gpu_inventory.items()
+                for uuid, gpu in inventory.items()}
+
+    def merge_gpu_metrics(self, hostname: str, metrics: Dict[str, Dict], partial: bool = False) -> List[str]:
+        '''
+        Merges dynamic GPU metrics (keyed by UUID) with the node's GPU inventory.
+        GPU records from the previous cycle are reused and only their metrics are updated in place.
+        Unless `partial` is set (metrics of some GPUs only, e.g. streamed line by line),
+        records of GPUs which are not present in metrics are removed.
+        Returns UUIDs which are missing from the inventory (these GPUs are skipped).
+        '''
+        inventory = self._gpu_inventory.get(hostname, {})
+        cached_gpus = self._infrastructure[hostname].get('GPU') or {}
+        gpus = dict(cached_gpus) if partial else {}
+        unknown_uuids = []
+        for uuid, gpu_metrics in metrics.items():
+            static = inventory.get(uuid)
+            if static is None:
+                unknown_uuids.append(uuid)
+                continue
+
+            record = cached_gpus.get(uuid)
+            if not isinstance(record, GPURecord):
+                record = GPURecord()
+            record.name = metric_value(static, 'name')
+            record.index = metric_value(static, 'index')
+            record.metrics.update(gpu_metrics)
+            record.metrics.set('mem_total', *metric_item(static, 'mem_total'))
+            gpus[uuid] = record
+
+        self._infrastructure[hostname]['GPU'] = gpus
+        self.record_history({uuid: gpus[uuid] for uuid in metrics if uuid in gpus})
+        return unknown_uuids
+
+    def node_gpu_processes(self, hostname: str, infrastructure: Optional[Dict] = None) -> Dict:
+        '''
+        Processes running on each GPU of the node, according to given infrastructure (the latest snapshot by default)
 
         Example result:
         {
@@ -41,17 +311,20 @@ class InfrastructureManager():
         }
         '''
 
+        if infrastructure is None:
+            infrastructure = self.snapshot.nodes
+
         # Make sure we can fetch GPU data first.
         # Example reasons: node is unreachable, nvidia-smi failed
-        if self.infrastructure.get(hostname, {}).get('GPU') is None:
+        if infrastructure.get(hostname, {}).get('GPU') is None:
             log.debug('There is no GPU data for host: {}'.format(hostname))
             return {}
 
         # Loop through each GPU on node
         node_processes = {}
-        for uuid, gpu_data in self.infrastructure[hostname]['GPU'].items():
-            if 'processes' in self.infrastructure[hostname]['GPU'][uuid]:
-                single_gpu_processes = self.infrastructure[hostname]['GPU'][uuid]['processes']
+        for uuid, gpu_data in infrastructure[hostname]['GPU'].items():
+            if 'processes' in gpu_data:
+                single_gpu_processes = gpu_data['processes']
                 if single_gpu_processes is not None:
                     node_processes[uuid] = [process for process in single_gpu_processes if process['command']
                                             not in self.ignored_processes]
@@ -59,12 +332,27 @@ class InfrastructureManager():
                     node_processes[uuid] = []
         return node_processes
 
-    def all_nodes_with_gpu_processes(self) -> Dict[str, Dict]:
-        return {node: self.node_gpu_processes(node) for node in self.infrastructure}
+    def process_index(self) -> ProcessIndex:
+        '''
+        GPU processes of the latest snapshot, indexed by node, PID, GPU and owner.
+        Built once per snapshot version (on first use) and shared by all services, returned index is never modified.
+        '''
+        snapshot = self._snapshot
+        index = self._process_index
+        if index.version != snapshot.version:
+            # Concurrent readers may build it twice, but both results are the same
+            index = ProcessIndex(snapshot.nodes, snapshot.version, self.ignored_processes)
+            self._process_index = index
+        return index
+
+    def all_nodes_with_gpu_processes(self, infrastructure: Optional[Dict] = None) -> Dict[str, Dict]:
+        if infrastructure is None:
+            infrastructure = self.snapshot.nodes
+        return {node: self.node_gpu_processes(node, infrastructure) for node in infrastructure}
 
     # TODO: this should become obsolete when gpu_uid becomes stored in Task model
-    def get_gpu_uid(self, hostname, gpu_id) -> str:
-        return list(self.infrastructure[hostname]['GPU'].keys())[gpu_id]
+    def get_gpu_uid(self, hostname, gpu_id) -> Optional[str]:
+        return self.gpu_uuid(hostname, gpu_id)
 
     @property
     def ignored_processes(self):
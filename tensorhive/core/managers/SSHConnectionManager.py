@@ -20,6 +20,10 @@ class SSHConnectionManager():
     @classmethod
     def new_parallel_ssh_client(cls, config, key_path=None) -> ParallelSSHClient:
         hostnames = config.keys()
+        if SSH.BACKEND == 'fake':
+            # Test backend, imported only when configured
+            from tensorhive.core.fake_ssh import FakeParallelSSHClient
+            return FakeParallelSSHClient(hosts=hostnames, host_config=config)
         try:
             if SSH.PROXY:
                 client = ParallelSSHClient(
@@ -59,15 +63,18 @@ class SSHConnectionManager():
         }
 
     def single_connection(self, hostname: str):
-        config = {hostname: SSH.AVAILABLE_NODES[hostname]}
-
         if not self._connection_container.get(hostname):
             # Create and store in cache
-            self._connection_container[hostname] = self.new_parallel_ssh_client(config, self.ssh_key_path)
+            self._connection_container[hostname] = self.new_single_connection(hostname)
 
         # Return cached object
         return self._connection_container[hostname]
 
+    def new_single_connection(self, hostname: str):
+        '''Creates a client for a single host which is not shared with other users of the manager'''
+        config = {hostname: SSH.AVAILABLE_NODES[hostname]}
+        return self.new_parallel_ssh_client(config, self.ssh_key_path)
+
     @property
     def connections(self):
         return self._connection_group
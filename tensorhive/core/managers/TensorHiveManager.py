@@ -6,15 +6,18 @@ from tensorhive.core.managers.ServiceManager import ServiceManager
 from tensorhive.core.services.Service import Service
 from typing import List, Dict
 from tensorhive.core.utils.decorators import override
-from tensorhive.config import (SSH, MONITORING_SERVICE, PROTECTION_SERVICE, USAGE_LOGGING_SERVICE,
+from tensorhive.config import (API, SSH, MONITORING_SERVICE, PROTECTION_SERVICE, USAGE_LOGGING_SERVICE,
                                JOB_SCHEDULING_SERVICE)
 from tensorhive.api.APIServer import APIServer
+from tensorhive.api.InfrastructureStream import InfrastructureStream
 from tensorhive.core.utils.StoppableThread import StoppableThread
 from tensorhive.core.utils.exceptions import ConfigurationException
 from tensorhive.core.monitors.Monitor import Monitor
 from tensorhive.core.monitors.GPUMonitor import GPUMonitor
 from tensorhive.core.monitors.CPUMonitor import CPUMonitor
+from tensorhive.core.monitors.CompositeMonitor import CompositeMonitor
 from tensorhive.core.services.MonitoringService import MonitoringService
+from tensorhive.core.services.StreamingMonitoringService import StreamingMonitoringService
 from tensorhive.core.services.ProtectionService import ProtectionService
 from tensorhive.core.services.UsageLoggingService import UsageLoggingService
 from tensorhive.core.services.JobSchedulingService import JobSchedulingService
@@ -27,6 +30,7 @@ from tensorhive.core.scheduling import GreedyScheduler
 from tensorhive.core import ssh
 from pathlib import PosixPath
 import logging
+import math
 log = logging.getLogger(__name__)
 
 
@@ -35,7 +39,12 @@ class TensorHiveManager(metaclass=Singleton):
 
     def __init__(self):
         super().__init__()
-        self.infrastructure_manager = InfrastructureManager(SSH.AVAILABLE_NODES)
+        self.infrastructure_manager = InfrastructureManager(SSH.AVAILABLE_NODES,
+                                                            history_capacity=self.metric_history_capacity())
+        if MONITORING_SERVICE.ENABLED and MONITORING_SERVICE.SNAPSHOT_FILE:
+            # Data from before restart is served by the API (as stale, without processes) until nodes are updated
+            self.infrastructure_manager.load_snapshot(MONITORING_SERVICE.SNAPSHOT_FILE)
+        self.infrastructure_stream = InfrastructureStream(self.infrastructure_manager, interval=API.STREAM_INTERVAL)
 
         self.dedicated_ssh_key = ssh.init_ssh_key(PosixPath(SSH.KEY_FILE).expanduser())
 
@@ -50,6 +59,22 @@ class TensorHiveManager(metaclass=Singleton):
         self.connection_manager = SSHConnectionManager(config=SSH.AVAILABLE_NODES, ssh_key_path=manager_ssh_key_path)
         self.service_manager = None
 
+    @staticmethod
+    def metric_history_capacity() -> int:
+        '''
+        Number of samples per resource needed to cover the retention period at the shortest update interval
+        (e.g. 3600 for 1 hour at the default busy_update_interval of 1s). It bounds memory usage of metric history,
+        nodes updated less often (e.g. idle ones) keep proportionally longer periods, see RingBuffer.
+        '''
+        if MONITORING_SERVICE.AGENT_MODE:
+            interval = MONITORING_SERVICE.AGENT_INTERVAL
+        else:
+            interval = min(MONITORING_SERVICE.UPDATE_INTERVAL, MONITORING_SERVICE.BUSY_UPDATE_INTERVAL,
+                           MONITORING_SERVICE.IDLE_UPDATE_INTERVAL)
+        if MONITORING_SERVICE.METRIC_HISTORY_RETENTION <= 0 or interval <= 0:
+            return 0
+        return math.ceil(MONITORING_SERVICE.METRIC_HISTORY_RETENTION / interval)
+
     @staticmethod
     def test_ssh():
         """
@@ -75,9 +100,28 @@ class TensorHiveManager(metaclass=Singleton):
         if MONITORING_SERVICE.ENABLED:
             monitors = [CPUMonitor()]  # type: List[Monitor]
             if MONITORING_SERVICE.ENABLE_GPU_MONITOR:
-                monitors.append(GPUMonitor())
+                monitors.append(GPUMonitor(
+                    process_discovery=MONITORING_SERVICE.GPU_PROCESS_DISCOVERY,
+                    inventory_refresh_interval=MONITORING_SERVICE.GPU_INVENTORY_REFRESH_INTERVAL))
             # TODO Add more monitors here
-            monitoring_service = MonitoringService(monitors=monitors, interval=MONITORING_SERVICE.UPDATE_INTERVAL)
+            if MONITORING_SERVICE.COMPOSITE_PROBE or MONITORING_SERVICE.AGENT_MODE:
+                monitors = [CompositeMonitor(monitors)]
+            if MONITORING_SERVICE.AGENT_MODE:
+                monitoring_service = StreamingMonitoringService(monitors=monitors,
+                                                                interval=MONITORING_SERVICE.AGENT_INTERVAL,
+                                                                deadline=MONITORING_SERVICE.UPDATE_DEADLINE,
+                                                                max_backoff=MONITORING_SERVICE.MAX_BACKOFF,
+                                                                snapshot_file=MONITORING_SERVICE.SNAPSHOT_FILE,
+                                                                snapshot_interval=MONITORING_SERVICE.SNAPSHOT_INTERVAL)
+            else:
+                monitoring_service = MonitoringService(monitors=monitors,
+                                                       interval=MONITORING_SERVICE.UPDATE_INTERVAL,
+                                                       deadline=MONITORING_SERVICE.UPDATE_DEADLINE,
+                                                       busy_interval=MONITORING_SERVICE.BUSY_UPDATE_INTERVAL,
+                                                       idle_interval=MONITORING_SERVICE.IDLE_UPDATE_INTERVAL,
+                                                       max_backoff=MONITORING_SERVICE.MAX_BACKOFF,
+                                                       snapshot_file=MONITORING_SERVICE.SNAPSHOT_FILE,
+                                                       snapshot_interval=MONITORING_SERVICE.SNAPSHOT_INTERVAL)
             services.append(monitoring_service)
         if JOB_SCHEDULING_SERVICE.ENABLED:
             job_scheduling_service = JobSchedulingService(
@@ -1,36 +1,117 @@
 from tensorhive.core.monitors.Monitor import Monitor
+from tensorhive.core.monitors.probe import SectionOutput
 from tensorhive.core.utils.decorators import override
+from tensorhive.core.utils.records import CPURecord, Metrics, MetricSchema
+from typing import Dict, List, Optional
 import logging
 log = logging.getLogger(__name__)
 
+# Raw counters of a single `cpu`/`cpuN` line from /proc/stat (jiffies)
+CPUTimes = List[int]
+
+cpu_schema = MetricSchema.get(('utilization', 'iowait', 'mem_total', 'mem_used', 'mem_free'),
+                              ('%', '%', 'MiB', 'MiB', 'MiB'))
+core_schema = MetricSchema.get(('utilization', 'iowait'), ('%', '%'))
+
 
 class CPUMonitor(Monitor):
+    '''
+    Reads raw /proc/stat and /proc/meminfo counters once per cycle.
+    Utilization is computed from the difference between samples of two consecutive cycles,
+    so there is no need to wait on the remote side, like `sleep 1` would do.
+    '''
+
+    def __init__(self):
+        # Last /proc/stat sample for each node, e.g. {'hostname': {'cpu': [...], 'cpu0': [...], ...}}
+        self._previous_samples = {}  # type: Dict[str, Dict[str, CPUTimes]]
+
+    @property  # type: ignore
+    @override
+    def probe_sections(self) -> Dict[str, str]:
+        return {
+            'cpu': 'grep \'^cpu\' /proc/stat && grep -E \'^(MemTotal|MemFree|Buffers|Cached|SReclaimable):\' '
+                   '/proc/meminfo'
+        }
 
     @override
-    def update(self, group_connection, infrastructure_manager):
-        cmd = 'awk \'{u=$2+$4; t=$2+$4+$5; if (NR==1){u1=u; t1=t;} else print ($2+$4-u1) * 100 / (t-t1); }\' \
-        <(grep \'cpu \' /proc/stat) <(sleep 1;grep \'cpu \' /proc/stat);free -m | awk \'NR==2\''
-        output = group_connection.run_command(cmd, stop_on_errors=False)
-        group_connection.join(output)
-
-        for host, host_out in output.items():
-            uuid = 'CPU_{}'.format(host)
-            metrics = {uuid: {'index': 0, 'metrics': dict()}}
-            if host_out.exit_code == 0:
-                # Command executed successfully
-                stdout_lines = list(host_out.stdout)
-                assert stdout_lines, 'stdout is empty!'
-                stdout_lines[0] = stdout_lines[0].replace(',', '.')
-                metrics[uuid]['metrics']['utilization'] = {'unit': '%', 'value': float(stdout_lines[0])}
-                mem = stdout_lines[1].split()
-                metrics[uuid]['metrics']['mem_total'] = {'unit': 'MiB', 'value': int(mem[1])}
-                metrics[uuid]['metrics']['mem_used'] = {'unit': 'MiB', 'value': int(mem[2])}
-                metrics[uuid]['metrics']['mem_free'] = {'unit': 'MiB', 'value': int(mem[3])}
+    def parse_probe(self, hostname: str, sections: Dict[str, SectionOutput], infrastructure_manager):
+        section = sections['cpu']
+        uuid = 'CPU_{}'.format(hostname)
+        if section.exit_code == 0:
+            # Command executed successfully
+            assert section.lines, 'stdout is empty!'
+            samples, meminfo = self._parse_stdout(section.lines)
+            previous_samples = self._previous_samples.get(hostname, {})
+            self._previous_samples[hostname] = samples
+
+            utilization, iowait = self._usage(previous_samples.get('cpu'), samples['cpu'])
+
+            cores = []
+            core_names = sorted((name for name in samples if name != 'cpu'), key=lambda name: int(name[3:]))
+            for core_name in core_names:
+                core_utilization, core_iowait = self._usage(previous_samples.get(core_name), samples[core_name])
+                cores.append(Metrics(core_schema, [core_utilization, core_iowait]))
+
+            # Same meaning as columns of `free -m`
+            mem_total = meminfo['MemTotal']
+            mem_free = meminfo['MemFree']
+            mem_cache = meminfo.get('Buffers', 0) + meminfo.get('Cached', 0) + meminfo.get('SReclaimable', 0)
+            metrics = Metrics(cpu_schema, [utilization, iowait, mem_total // 1024,
+                                           (mem_total - mem_free - mem_cache) // 1024, mem_free // 1024])
+            resources = {uuid: CPURecord(index=0, metrics=metrics, cores=cores)}
+            infrastructure_manager.infrastructure[hostname]['CPU'] = resources
+            infrastructure_manager.record_history(resources)
+        else:
+            # Command execution failed
+            log.error('cpu query failed with {} exit code on {}'.format(section.exit_code, hostname))
+            infrastructure_manager.infrastructure[hostname]['CPU'] = None
+
+    @override
+    def probe_failed(self, hostname: str, infrastructure_manager):
+        infrastructure_manager.infrastructure[hostname]['CPU'] = None
+
+    @staticmethod
+    def _parse_stdout(stdout_lines: List[str]):
+        '''
+        Example stdout:
+        cpu  4705 356 584 3699 23 23 0 0 0 0
+        cpu0 1393280 32966 572056 13343292 6130 0 17875 0 23933 0
+        MemTotal:       16303428 kB
+        MemFree:         2304152 kB
+
+        Example result:
+        (
+            {'cpu': [4705, 356, 584, 3699, 23, 23, 0, 0, 0, 0], 'cpu0': [1393280, ...]},
+            {'MemTotal': 16303428, 'MemFree': 2304152}  # kB
+        )
+        '''
+        samples = {}  # type: Dict[str, CPUTimes]
+        meminfo = {}  # type: Dict[str, int]
+        for line in stdout_lines:
+            columns = line.split()
+            if not columns:
+                continue
+            if columns[0].startswith('cpu'):
+                samples[columns[0]] = [int(value) for value in columns[1:]]
             else:
-                # Command execution failed
-                if host_out.exit_code:
-                    log.error('cpu query failed with {} exit code on {}'.format(host_out.exit_code, host))
-                elif host_out.exception:
-                    log.error('cpu query raised {} on {}'.format(host_out.exception.__class__.__name__, host))
-                metrics = None
-            infrastructure_manager.infrastructure[host]['CPU'] = metrics
+                meminfo[columns[0].rstrip(':')] = int(columns[1])
+        return samples, meminfo
+
+    @staticmethod
+    def _usage(previous: Optional[CPUTimes], current: CPUTimes):
+        '''
+        Calculates utilization and iowait (in %) between two samples of the same cpu line.
+        Returns (None, None) when there is no previous sample, e.g. in the first cycle or after node's reboot.
+        '''
+        if previous is None:
+            return None, None
+
+        # Columns: user nice system idle iowait irq softirq steal (guest time is already included in user)
+        deltas = [now - before for now, before in zip(current[:8], previous[:8])]
+        total = sum(deltas)
+        if total <= 0 or any(delta < 0 for delta in deltas):
+            return None, None
+
+        idle, iowait = deltas[3], deltas[4] if len(deltas) > 4 else 0
+        utilization = round((total - idle - iowait) * 100 / total, 2)
+        return utilization, round(iowait * 100 / total, 2)
@@ -0,0 +1,64 @@
+from tensorhive.core.monitors.Monitor import Monitor
+from tensorhive.core.monitors.probe import SectionOutput
+from tensorhive.core.utils.decorators import override
+from typing import Dict, List
+import logging
+log = logging.getLogger(__name__)
+
+
+class CompositeMonitor(Monitor):
+    '''
+    Combines probes of many monitors into one remote script,
+    so that each node is queried only once per monitoring cycle.
+    '''
+
+    def __init__(self, monitors: List[Monitor]):
+        self.monitors = monitors
+        self.refresh_section_names = frozenset(name for monitor in monitors for name in monitor.refresh_section_names)
+
+    @property  # type: ignore
+    @override
+    def probe_sections(self) -> Dict[str, str]:
+        sections = {}  # type: Dict[str, str]
+        for monitor in self.monitors:
+            sections.update(monitor.probe_sections)
+        return sections
+
+    @override
+    def parse_probe(self, hostname: str, sections: Dict[str, SectionOutput], infrastructure_manager):
+        for monitor in self.monitors:
+            # In agent mode sections replaced by streams (or refreshed separately) are not present
+            own_sections = {name: sections[name] for name in monitor.probe_sections if name in sections}
+            if not own_sections:
+                continue
+            try:
+                monitor.parse_probe(hostname, own_sections, infrastructure_manager)
+            except Exception as e:
+                # Single broken monitor must not prevent the others from updating
+                log.error('{} could not parse probe output from {}: {}'.format(
+                    monitor.__class__.__name__, hostname, e))
+                monitor.probe_failed(hostname, infrastructure_manager)
+
+    @override
+    def stream_sections(self, interval: float) -> Dict[str, str]:
+        sections = {}  # type: Dict[str, str]
+        for monitor in self.monitors:
+            sections.update(monitor.stream_sections(interval))
+        return sections
+
+    @override
+    def parse_stream_line(self, hostname: str, name: str, line: str, infrastructure_manager):
+        for monitor in self.monitors:
+            monitor.parse_stream_line(hostname, name, line, infrastructure_manager)
+
+    @override
+    def refresh_sections(self, hostname: str) -> Dict[str, str]:
+        sections = {}  # type: Dict[str, str]
+        for monitor in self.monitors:
+            sections.update(monitor.refresh_sections(hostname))
+        return sections
+
+    @override
+    def probe_failed(self, hostname: str, infrastructure_manager):
+        for monitor in self.monitors:
+            monitor.probe_failed(hostname, infrastructure_manager)
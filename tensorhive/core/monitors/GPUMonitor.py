@@ -1,39 +1,129 @@
 from tensorhive.core.monitors.Monitor import Monitor
+from tensorhive.core.monitors.probe import SectionOutput
 from tensorhive.core.utils.decorators import override
-from typing import Dict, List
+from typing import Dict, List, Optional, Set
 from tensorhive.core.utils.NvidiaSmiParser import NvidiaSmiParser
+from tensorhive.core.utils.records import GPUProcess, metric_value
 from pssh.exceptions import Timeout, UnknownHostException, ConnectionErrorException, AuthenticationException
 import logging
+import time
 log = logging.getLogger(__name__)
 
 
 class GPUMonitor(Monitor):
     '''Responsible for fetching data about installed GPUs within configured network'''
+    available_process_discovery_modes = ['compute_apps', 'pmon']
+    refresh_section_names = frozenset({'gpu_inventory'})
+
+    def __init__(self, process_discovery: str = 'compute_apps', inventory_refresh_interval: float = 600.0):
+        assert process_discovery in self.available_process_discovery_modes, \
+            'Unknown process discovery mode: {}'.format(process_discovery)
+        self.process_discovery = process_discovery
+        # Static GPU properties are queried again after that many seconds
+        self.inventory_refresh_interval = inventory_refresh_interval
+        self._inventory_refreshed_at = None  # type: Optional[float]
+        # When inventory of each node was queried last time (successfully or not)
+        self._inventory_queried_at = {}  # type: Dict[str, float]
+        # Nodes which have no valid inventory, e.g. GPU was swapped or node was unreachable
+        self._outdated_inventory_hosts = set()  # type: Set[str]
+        # Header of streamed nvidia-smi output for each node (agent mode)
+        self._stream_headers = {}  # type: Dict[str, str]
+
+    @property  # type: ignore
+    @override
+    def probe_sections(self) -> Dict[str, str]:
+        return {
+            'gpu_inventory': self.inventory_query_command if self.inventory_refresh_due else 'true',
+            'gpu_metrics': self.composed_query_command,
+            'gpu_processes': self.get_gpu_processes_command
+        }
+
+    @override
+    def parse_probe(self, hostname: str, sections: Dict[str, SectionOutput], infrastructure_manager):
+        # In agent mode inventory is queried by separate probes (see `refresh_sections`)
+        # and metrics are streamed instead (see `parse_stream_line`)
+        if 'gpu_inventory' in sections:
+            self._update_gpu_inventory(hostname, sections['gpu_inventory'], infrastructure_manager)
+        if 'gpu_metrics' in sections:
+            self._update_gpu_metrics(hostname, sections['gpu_metrics'], infrastructure_manager)
+        if 'gpu_processes' in sections:
+            processes = self._current_processes(hostname, sections['gpu_processes'])
+            self._update_processes(infrastructure_manager, {hostname: processes})
+
+    @override
+    def stream_sections(self, interval: float) -> Dict[str, str]:
+        # nvidia-smi keeps running and prints metrics of all GPUs every interval
+        return {'gpu_metrics': '{} --loop-ms={}'.format(self.composed_query_command, max(int(interval * 1000), 1))}
+
+    @override
+    def parse_stream_line(self, hostname: str, name: str, line: str, infrastructure_manager):
+        '''
+        Merges metrics of a single GPU printed by `nvidia-smi --query-gpu=... --loop-ms=...`
+
+        Example lines:
+        uuid, fan.speed [%], memory.free [MiB], ...
+        GPU-c6d01ed6-8240-2e11-efe9-1111111111111, 30, 10000, ...
+        '''
+        if name != 'gpu_metrics':
+            return
+        if line.startswith('uuid'):
+            self._stream_headers[hostname] = line
+            return
+
+        header = self._stream_headers.get(hostname)
+        if header is None or infrastructure_manager.gpu_inventory(hostname) is None:
+            # Nothing to merge with yet
+            return
+        metrics = NvidiaSmiParser.parse_gpu_metrics_stdout([header, line])
+        if infrastructure_manager.merge_gpu_metrics(hostname, metrics, partial=True):
+            log.info('Unknown GPU streamed from {}, inventory will be refreshed'.format(hostname))
+            self._outdated_inventory_hosts.add(hostname)
+
+    @override
+    def refresh_sections(self, hostname: str) -> Dict[str, str]:
+        queried_at = self._inventory_queried_at.get(hostname)
+        if queried_at is None or hostname in self._outdated_inventory_hosts \
+                or time.time() - queried_at >= self.inventory_refresh_interval:
+            return {'gpu_inventory': self.inventory_query_command}
+        return {}
 
     @override
-    def update(self, group_connection, infrastructure_manager):
-        self._update_gpu_metrics(group_connection, infrastructure_manager)
-        processes = self._current_processes(group_connection, infrastructure_manager)  # type: Dict
-        self._update_processes(infrastructure_manager, processes)
+    def probe_failed(self, hostname: str, infrastructure_manager):
+        infrastructure_manager.infrastructure[hostname]['GPU'] = None
+
+    @property
+    def inventory_refresh_due(self) -> bool:
+        if self._inventory_refreshed_at is None or self._outdated_inventory_hosts:
+            return True
+        return time.time() - self._inventory_refreshed_at >= self.inventory_refresh_interval
+
+    @property
+    def inventory_query_command(self) -> str:
+        '''
+        Query for GPU properties that change only when hardware is swapped,
+        they are cached in infrastructure manager in the meantime.
+
+        Example result:
+        nvidia-smi --query-gpu=uuid,name,index,memory.total --format=csv,nounits
+        '''
+        return 'nvidia-smi --query-gpu=uuid,name,index,memory.total --format=csv,nounits'
 
     @property
     def composed_query_command(self) -> str:
         '''
-        Builds a query command for nvidia-smi that can be executed on each node
+        Builds a query command for nvidia-smi that can be executed on each node.
+        Only dynamic metrics are queried, UUID is used to match them with the cached inventory.
 
         Example result:
-        nvidia-smi --query-gpu=temperature.gpu,utilization.gpu,utilization.memory --format=csv
+        nvidia-smi --query-gpu=uuid,temperature.gpu,utilization.gpu,utilization.memory --format=csv
         '''
         base_command = 'nvidia-smi --query-gpu='
         format_options = '--format=csv,nounits'
         available_queries = [
-            'name',
             'uuid',
-            'index',
             'fan.speed',
             'memory.free',
             'memory.used',
-            'memory.total',
             'utilization.gpu',
             'utilization.memory',
             'temperature.gpu',
@@ -47,10 +137,27 @@ class GPUMonitor(Monitor):
             format_options=format_options)
         return command
 
-    def _update_gpu_metrics(self, group_connection, infrastructure_manager):
+    def _update_gpu_inventory(self, hostname: str, section: SectionOutput, infrastructure_manager):
+        '''Stores static GPU properties of a single node, if they were queried in this cycle'''
+        if section.exit_code == 0 and not section.lines:
+            # Inventory was not queried (cached one is still valid)
+            return
+
+        self._inventory_queried_at[hostname] = time.time()
+        if section.exit_code == 0:
+            inventory = NvidiaSmiParser.parse_gpu_inventory_stdout(section.lines)
+            infrastructure_manager.set_gpu_inventory(hostname, inventory)
+            self._outdated_inventory_hosts.discard(hostname)
+            self._inventory_refreshed_at = time.time()
+        else:
+            # Not marked as outdated on purpose, nodes without nvidia-smi would force refresh on every cycle
+            log.error('nvidia-smi inventory query failed with {} exit code on {}'.format(section.exit_code, hostname))
+            infrastructure_manager.set_gpu_inventory(hostname, None)
+
+    def _update_gpu_metrics(self, hostname: str, section: SectionOutput, infrastructure_manager):
         '''
-        Executes a query on each node within group_connection, then
-        it returns gathered information as a dictionary.
+        Parses output of the nvidia-smi query executed on a single node, then
+        it merges gathered metrics with cached GPU records in the infrastructure.
 
         Example result:
         {
@@ -72,45 +179,88 @@ class GPUMonitor(Monitor):
             ...
         }
         '''
-        # stop_on_errors=False means that single host failure does not raise an exception,
-        # instead simply adds them to the output.
-        output = group_connection.run_command(self.composed_query_command, stop_on_errors=False)
-        group_connection.join(output)
-
-        for host, host_out in output.items():
-            if host_out.exit_code == 0:
-                # Command executed successfully
-                metrics = NvidiaSmiParser.parse_query_gpu_stdout(host_out.stdout)
-            else:
-                # Command execution failed
-                if host_out.exit_code:
-                    log.error('nvidia-smi failed with {} exit code on {}'.format(host_out.exit_code, host))
-                elif host_out.exception:
-                    log.error('nvidia-smi raised {} on {}'.format(host_out.exception.__class__.__name__, host))
-                metrics = None
-
-            infrastructure_manager.infrastructure[host]['GPU'] = metrics
-
-    def _get_process_owner(self, pid: int, hostname: str, connection) -> str:
-        '''Use single-host connection to acquire process owner using `ps`'''
-        command = 'ps --no-headers -o user {}'.format(pid)
-        connection = connection.host_clients[hostname]
-
-        output = connection.run_command(command)
-        _, hostname, stdout, stderr, _ = output
-
-        result = list(stdout)
-        if not result:
-            # Empty output -> Process with such pid does not exist
-            return None
-        # Unpack owner from the list (e.g. ['example_owner'])
-        return result[0]
+        if section.exit_code != 0:
+            # Command execution failed
+            log.error('nvidia-smi failed with {} exit code on {}'.format(section.exit_code, hostname))
+            infrastructure_manager.infrastructure[hostname]['GPU'] = None
+            return
+
+        if infrastructure_manager.gpu_inventory(hostname) is None:
+            # E.g. node was unreachable when inventory was queried last time
+            infrastructure_manager.infrastructure[hostname]['GPU'] = None
+            self._outdated_inventory_hosts.add(hostname)
+            return
+
+        # Command executed successfully
+        metrics = NvidiaSmiParser.parse_gpu_metrics_stdout(section.lines)
+        unknown_uuids = infrastructure_manager.merge_gpu_metrics(hostname, metrics)
+        if unknown_uuids:
+            log.info('Unknown GPUs {} on {}, inventory will be refreshed'.format(unknown_uuids, hostname))
+            self._outdated_inventory_hosts.add(hostname)
+        elif len(metrics) != len(infrastructure_manager.gpu_inventory(hostname)):
+            # Some GPU has disappeared
+            self._outdated_inventory_hosts.add(hostname)
 
     @property
     def get_gpu_processes_command(self):
         '''
         Returns short bash script that can be executed on each node.
-        Script tries to execute nvidia-smi pmon for each UUID separately.
+        Depending on `process_discovery`, script lists processes using either:
+        - a single `nvidia-smi --query-compute-apps` call (falls back to pmon when not supported),
+        - nvidia-smi pmon executed for each UUID separately (each call samples for about a second).
+        Finally, owners of all listed processes are resolved with a single `ps` call,
+        so it costs no additional round trips.
+
+        When executed, gives output, like:
+            [COMPUTE APPS]
+            GPU-c6d01ed6-8240-2e11-efe9-1111111111111, 1234, 1178, python
+            GPU-c6d01ed6-8240-2e11-efe9-2222222222222, 4567, 8000, python
+            [OWNERS]
+             1234 foo
+             4567 bar
+        or (see `pmon_processes_script`):
+            UUID=GPU-c6d01ed6-8240-2e11-efe9-1111111111111
+            # gpu        pid  type    sm   mem   enc   dec   command
+            # Idx          #   C/G     %     %     %     %   name
+                0       1979     G     0     3     0     0   X
+            [OWNERS]
+             1979 root
+        '''
+        if self.process_discovery == 'compute_apps':
+            discovery_script = '''
+            APPS=$(nvidia-smi --query-compute-apps=gpu_uuid,pid,used_memory,process_name \\
+                --format=csv,noheader,nounits)
+
+            if [ $? -eq 0 ]; then
+                echo "[COMPUTE APPS]"
+                echo "$APPS"
+                # Collect numeric PIDs (2nd column)
+                PIDS=$(echo "$APPS" | awk -F', ' '$2 ~ /^[0-9]+$/ {{print $2}}')
+            else
+                # Query is not supported (e.g. old driver), fall back to pmon
+                {pmon}
+            fi
+            '''.format(pmon=self.pmon_processes_script)
+        else:
+            discovery_script = self.pmon_processes_script
+
+        return '''
+            PIDS=""
+            {discovery}
+
+            # Resolve owners of all processes at once
+            echo "[OWNERS]"
+            PIDS=$(echo $PIDS | tr ' ' ',')
+            if [ -n "$PIDS" ]; then
+                ps --no-headers -o pid=,user:32= -p "$PIDS" || true
+            fi
+        '''.format(discovery=discovery_script)
+
+    @property
+    def pmon_processes_script(self):
+        '''
+        Tries to execute nvidia-smi pmon for each UUID separately,
+        numeric PIDs are collected into PIDS variable.
 
         Explanation for this is that GPUs' indexes are not fixed in time,
         hence UUID parameter.
@@ -132,14 +282,19 @@ class GPUMonitor(Monitor):
             [PMON NOT SUPPORTED]
         '''
         return '''
-            # Get a list of UUIDs of each installed GPU in the system
-            UUIDS=$(nvidia-smi --query-gpu=uuid --format=csv,noheader)
+                # Get a list of UUIDs of each installed GPU in the system
+                UUIDS=$(nvidia-smi --query-gpu=uuid --format=csv,noheader)
+
+                # Check exit code
+                STATUS=$?
+                if [ $STATUS -ne 0 ]; then
+                    # nvidia-smi failed
+                    exit $STATUS
+                fi
 
-            # Check exit code
-            if [ $? -eq 0 ]; then
                 # Success (nvidia-smi is installed)
                 # Read UUIDs, 1 line = 1 UUID
-                echo "$UUIDS" | while read line; do
+                while read line; do
                     echo "UUID=$line"
 
                     # Fetch a list of processes on this GPU
@@ -147,50 +302,48 @@ class GPUMonitor(Monitor):
 
                     if [ $? -eq 0 ]; then
                         echo "$PROCESSES"
+                        # Collect numeric PIDs (2nd column), skipping headers and idle GPU rows
+                        PIDS="$PIDS $(echo "$PROCESSES" | awk '!/^#/ && $2 ~ /^[0-9]+$/ {print $2}')"
                     else
                         echo "[PMON NOT SUPPORTED]"
                     fi
-                done
-            else
-                # nvidia-smi failed
-                exit $?
-            fi
+                done <<< "$UUIDS"
         '''
 
-    def _current_processes(self, group_connection, infrastructure_manager) -> Dict:
+    def _current_processes(self, hostname: str, section: SectionOutput) -> Optional[List[Dict]]:
         '''
-        Fetches the information about all active gpu processes using nvidia-smi pmon
+        Parses the information about all active gpu processes on a single node
+        gathered using nvidia-smi --query-compute-apps or nvidia-smi pmon
 
         Example result:
-        {
-            "pmon_capable_hostname": [
-                {
-                    "uuid": "GPU-c6d01ed6-8240-2e11-efe9-aa32794b8273",
-                    "pid": 1979,
-                    "command": "X",
-                    "owner": "root"
-                }
-            ],
-            "pmon_not_supported_hostname": null
-        }
+        [
+            {
+                "uuid": "GPU-c6d01ed6-8240-2e11-efe9-aa32794b8273",
+                "pid": 1979,
+                "command": "X",
+                "owner": "root",
+                "mem_used": {"value": 1178, "unit": "MiB"}  # missing when listed by pmon
+            }
+        ]
+        or None when nvidia-smi is not available on the node.
         '''
-        output = group_connection.run_command(self.get_gpu_processes_command, stop_on_errors=False)
-        group_connection.join(output)
-
-        result = {}
-        for host, host_out in output.items():
-            if host_out.exit_code == 0:
-                processes = NvidiaSmiParser.parse_pmon_stdout(host_out.stdout)
-                # Find process owner for each process
-                for process in processes:
-                    process['owner'] = self._get_process_owner(process['pid'], host, group_connection)
-            else:
-                # Possible reasons:
-                # - nvidia-smi not installed
-                # - could not connect to host
-                processes = None
-            result[host] = processes
-        return result
+        if section.exit_code != 0:
+            # Possible reasons:
+            # - nvidia-smi not installed
+            # - probe interrupted
+            return None
+
+        process_lines, owner_lines = NvidiaSmiParser.split_owners_block(section.lines)
+        if process_lines and process_lines[0] == NvidiaSmiParser.compute_apps_block_header:
+            processes = NvidiaSmiParser.parse_compute_apps_stdout(process_lines[1:])
+        else:
+            # pmon does not report memory used by the process
+            processes = NvidiaSmiParser.parse_pmon_stdout(process_lines)
+        owners = NvidiaSmiParser.parse_ps_owners_stdout(owner_lines)
+        for process in processes:
+            # Process could have finished before `ps` was called
+            process['owner'] = owners.get(process['pid'])
+        return processes
 
     def _update_processes(self, infrastructure_manager, processes: Dict):
         '''
@@ -228,15 +381,25 @@ class GPUMonitor(Monitor):
                 # Can't access any GPU right now, e.g. could not connect to host or nvidia-smi failure
                 continue
 
+            gpus = infrastructure_manager.infrastructure[hostname]['GPU']
             # Introduce new key - 'processes' with default value
-            for uuid, _ in infrastructure_manager.infrastructure[hostname]['GPU'].items():
-                infrastructure_manager.infrastructure[hostname]['GPU'][uuid]['processes'] = None
+            for gpu in gpus.values():
+                gpu['processes'] = None
+
+            if gpu_processes_on_node is None:
+                # Process listing failed on this node, e.g. nvidia-smi pmon failure
+                continue
 
             # Unpack every known process and move to the corresponding GPU
             for process in gpu_processes_on_node:
-                uuid = process.pop('uuid')
+                gpu = gpus.get(process['uuid'])
+                if gpu is None:
+                    # GPU was added or swapped since inventory was queried (its metrics were not merged either)
+                    self._outdated_inventory_hosts.add(hostname)
+                    continue
 
                 # Replace default value with an empty list, because we have a new process to append
-                if infrastructure_manager.infrastructure[hostname]['GPU'][uuid]['processes'] is None:
-                    infrastructure_manager.infrastructure[hostname]['GPU'][uuid]['processes'] = []
-                infrastructure_manager.infrastructure[hostname]['GPU'][uuid]['processes'].append(process)
+                if gpu['processes'] is None:
+                    gpu['processes'] = []
+                gpu['processes'].append(GPUProcess(process['pid'], process['command'], process['owner'],
+                                                   metric_value(process, 'mem_used')))
@@ -1,13 +1,53 @@
 from abc import ABC, abstractmethod
-from typing import Dict
+from typing import Dict, FrozenSet
+from tensorhive.core.monitors import probe
+from tensorhive.core.monitors.probe import SectionOutput
 
 
 class Monitor(ABC):
     '''
     Interface that needs to be implemented by concrete classes
     (Strategy pattern)
+
+    Monitors describe what should be executed on nodes as named shell fragments (probe sections),
+    so that fragments of many monitors can be sent to a node within a single remote execution.
     '''
+    # Names of probe sections which query rarely changing properties (e.g. hardware inventory)
+    refresh_section_names = frozenset()  # type: FrozenSet[str]
 
+    @property
     @abstractmethod
-    def update(self, connection, infrastructure_manager) -> None:
+    def probe_sections(self) -> Dict[str, str]:
+        '''Shell fragments that should be executed on each node, keyed by unique section name'''
+        pass
+
+    @abstractmethod
+    def parse_probe(self, hostname: str, sections: Dict[str, SectionOutput], infrastructure_manager) -> None:
+        '''Updates infrastructure with the output of own sections gathered from a single node'''
+        pass
+
+    @abstractmethod
+    def probe_failed(self, hostname: str, infrastructure_manager) -> None:
+        '''Called when node could not be probed at all (e.g. connection failure)'''
+        pass
+
+    def stream_sections(self, interval: float) -> Dict[str, str]:
+        '''
+        Long-running commands which print a record per line every `interval` seconds (used in agent mode),
+        keyed by names of probe sections which they replace. By default monitor does not stream anything.
+        '''
+        return {}
+
+    def parse_stream_line(self, hostname: str, name: str, line: str, infrastructure_manager) -> None:
+        '''Updates infrastructure with a single line printed by own stream section'''
         pass
+
+    def refresh_sections(self, hostname: str) -> Dict[str, str]:
+        '''
+        Sections of `refresh_section_names` which are due on given node. Agent mode leaves them out of agent scripts
+        and executes them as one-shot probes instead, so that agents do not have to be restarted to refresh them.
+        '''
+        return {}
+
+    def update(self, connection, infrastructure_manager) -> None:
+        probe.run(connection, [self], infrastructure_manager)
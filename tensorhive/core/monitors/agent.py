@@ -0,0 +1,90 @@
+"""
+Helpers for the agent mode of monitoring, where a single long-running script is started on each node
+over one SSH channel and its stdout is consumed as a stream.
+
+The script starts with a regular probe (see tensorhive.core.monitors.probe), then it launches
+stream sections of monitors in the background and keeps repeating remaining probe sections.
+Refresh sections (see Monitor.refresh_sections) are left out, they are executed by separate one-shot probes:
+
+    #TH_BEGIN cpu
+    cpu  4705 356 584 3699 23 23 0 0 0 0
+    #TH_END cpu 0
+    #TH_CYCLE
+    #TH_STREAM gpu_metrics GPU-c6d01ed6-8240-2e11-efe9-1111111111111, 30, 10000, ...
+    #TH_BEGIN cpu
+    ...
+"""
+from tensorhive.core.monitors import probe
+from typing import Dict, List
+import logging
+log = logging.getLogger(__name__)
+
+STREAM_MARKER = '#TH_STREAM'
+CYCLE_MARKER = '#TH_CYCLE'
+
+
+def build_script(monitors: List, interval: float) -> str:
+    '''Builds the agent script which samples all monitors every `interval` seconds'''
+    sections = {}  # type: Dict[str, str]
+    streams = {}  # type: Dict[str, str]
+    for monitor in monitors:
+        sections.update({name: command for name, command in monitor.probe_sections.items()
+                         if name not in monitor.refresh_section_names})
+        streams.update(monitor.stream_sections(interval))
+    periodic_sections = {name: command for name, command in sections.items() if name not in streams}
+
+    stream_commands = '\n'.join(
+        '(\n{command}\n) 2>/dev/null | while IFS= read -r line; do echo "{marker} {name} $line"; done &'.format(
+            command=command, marker=STREAM_MARKER, name=name)
+        for name, command in streams.items())
+    return '''
+# Background streams must not outlive the agent
+trap 'kill $(jobs -p) 2>/dev/null' EXIT
+
+# Agent runs under a pseudo-terminal, which merges stderr into stdout, so warnings would be parsed as data
+cycle() {{
+{{
+{cycle}
+}} 2>/dev/null
+echo "{cycle_marker}"
+}}
+
+cycle
+{streams}
+while sleep {interval}; do
+    cycle
+done
+'''.format(cycle=probe.build_script(periodic_sections), cycle_marker=CYCLE_MARKER,
+           streams=stream_commands, interval=interval)
+
+
+class AgentOutputParser():
+    '''Consumes stdout of the agent script running on a single node, line by line'''
+
+    def __init__(self, hostname: str, monitors: List, infrastructure_manager) -> None:
+        self.hostname = hostname
+        self.monitors = monitors
+        self.infrastructure_manager = infrastructure_manager
+        self._cycle_lines = []  # type: List[str]
+
+    def feed(self, line: str) -> bool:
+        '''Returns True when the line completes a cycle of periodic sections'''
+        if line.startswith(STREAM_MARKER + ' '):
+            _, name, *rest = line.split(' ', 2)
+            for monitor in self.monitors:
+                try:
+                    monitor.parse_stream_line(self.hostname, name, rest[0] if rest else '',
+                                              self.infrastructure_manager)
+                except Exception as e:
+                    log.error('{} could not parse streamed line from {}: {}'.format(
+                        monitor.__class__.__name__, self.hostname, e))
+            return False
+
+        if line == CYCLE_MARKER:
+            sections = probe.split_output(self._cycle_lines)
+            self._cycle_lines = []
+            probe.dispatch(self.hostname, sections, self.monitors, self.infrastructure_manager, fill_missing=False)
+            return True
+
+        self._cycle_lines.append(line)
+        return False
@@ -0,0 +1,140 @@
+"""
+Helpers for executing shell fragments contributed by monitors as a single remote script.
+
+Every fragment (section) is wrapped with markers, so that its stdout and exit code
+can be demultiplexed back after the whole script has been executed on a node:
+
+    #TH_BEGIN gpu_metrics
+    <stdout of section>
+    #TH_END gpu_metrics 0
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional
+import re
+import logging
+log = logging.getLogger(__name__)
+
+SectionOutput = NamedTuple('SectionOutput', [('exit_code', Optional[int]), ('lines', List[str])])
+
+BEGIN_MARKER = '#TH_BEGIN'
+END_MARKER = '#TH_END'
+
+_begin_regex = re.compile(r'^{} (\S+)$'.format(BEGIN_MARKER))
+# End marker may be glued to the last line of output when section does not print trailing newline
+_end_regex = re.compile(r'^(.*){} (\S+) (\d+)$'.format(END_MARKER))
+
+
+def build_script(sections: Dict[str, str]) -> str:
+    '''
+    Joins named shell fragments into a single script.
+    Each fragment runs in a subshell, so `exit` inside one of them does not affect the others.
+    '''
+    fragments = []
+    for name, command in sections.items():
+        assert re.match(r'^\S+$', name), 'Section name must not contain whitespaces: {}'.format(name)
+        fragments.append('echo "{begin} {name}"\n(\n{command}\n)\necho "{end} {name} $?"'.format(
+            begin=BEGIN_MARKER, end=END_MARKER, name=name, command=command))
+    return '\n'.join(fragments)
+
+
+def split_output(stdout: Iterable[str]) -> Dict[str, SectionOutput]:
+    '''
+    Reverses `build_script`: splits stdout of the whole script into per-section outputs.
+    Sections without the end marker (e.g. interrupted) have exit_code set to None.
+
+    Example result:
+    {
+        'cpu': SectionOutput(exit_code=0, lines=['12.5', 'Mem: 15923 4012 ...']),
+        'gpu_metrics': SectionOutput(exit_code=9, lines=[])
+    }
+    '''
+    result = {}  # type: Dict[str, SectionOutput]
+    current = None  # type: Optional[str]
+    for line in stdout:
+        begin_match = _begin_regex.match(line)
+        if begin_match:
+            current = begin_match.group(1)
+            result[current] = SectionOutput(exit_code=None, lines=[])
+            continue
+
+        end_match = _end_regex.match(line)
+        if end_match and end_match.group(2) == current:
+            remainder, exit_code = end_match.group(1), int(end_match.group(3))
+            if remainder:
+                result[current].lines.append(remainder)
+            result[current] = result[current]._replace(exit_code=exit_code)
+            current = None
+        elif current is not None:
+            result[current].lines.append(line)
+        else:
+            log.debug('Unexpected line outside of any probe section: {}'.format(line))
+    return result
+
+
+def run(connection, monitors: List, infrastructure_manager) -> None:
+    '''
+    Executes sections of all given monitors with a single `run_command` on each node,
+    then hands the demultiplexed output over to each monitor.
+    '''
+    output = execute(connection, monitors)
+    for host, host_out in output.items():
+        publish(host, host_out, monitors, infrastructure_manager)
+
+
+def execute(connection, monitors: List) -> Dict:
+    '''Runs combined sections of given monitors on all hosts of the connection, returns pssh output'''
+    sections = {}  # type: Dict[str, str]
+    for monitor in monitors:
+        for name, command in monitor.probe_sections.items():
+            assert name not in sections, 'Duplicated probe section name: {}'.format(name)
+            sections[name] = command
+    return execute_sections(connection, sections)
+
+
+def execute_sections(connection, sections: Dict[str, str]) -> Dict:
+    '''Runs given sections on all hosts of the connection, returns pssh output'''
+    # stop_on_errors=False means that single host failure does not raise an exception,
+    # instead simply adds them to the output.
+    output = connection.run_command(build_script(sections), stop_on_errors=False)
+    connection.join(output)
+    return output
+
+
+def publish(host: str, host_out, monitors: List, infrastructure_manager) -> bool:
+    '''
+    Hands output of the probe executed on a single node over to each monitor.
+    Returns False when the node could not be reached at all.
+    '''
+    if host_out.exception is None and host_out.exit_code == 0:
+        dispatch(host, split_output(host_out.stdout), monitors, infrastructure_manager)
+        return True
+    else:
+        if host_out.exception:
+            log.error('probe raised {} on {}'.format(host_out.exception.__class__.__name__, host))
+        else:
+            log.error('probe failed with {} exit code on {}'.format(host_out.exit_code, host))
+        for monitor in monitors:
+            monitor.probe_failed(host, infrastructure_manager)
+        return host_out.exception is None
+
+
+def dispatch(host: str, host_sections: Dict[str, SectionOutput], monitors: List, infrastructure_manager,
+             fill_missing: bool = True) -> None:
+    '''
+    Hands sections gathered from a single node over to the monitors which own them.
+    Missing sections are treated as interrupted, unless `fill_missing` is disabled
+    (then monitors get only the sections which are present, monitors without any are skipped).
+    '''
+    for monitor in monitors:
+        if fill_missing:
+            own_sections = {name: host_sections.get(name, SectionOutput(exit_code=None, lines=[]))
+                            for name in monitor.probe_sections}
+        else:
+            own_sections = {name: host_sections[name] for name in monitor.probe_sections if name in host_sections}
+            if not own_sections:
+                continue
+        try:
+            monitor.parse_probe(host, own_sections, infrastructure_manager)
+        except Exception as e:
+            log.error('{} could not parse probe output from {}: {}'.format(
+                monitor.__class__.__name__, host, e))
+            monitor.probe_failed(host, infrastructure_manager)
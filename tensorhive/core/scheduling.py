@@ -1,38 +1,53 @@
 from abc import ABC, abstractmethod
 from tensorhive.models.Job import Job
 from tensorhive.models.Task import Task
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from tensorhive.config import JOB_SCHEDULING_SERVICE as CONFIG
 
 
 class Scheduler(ABC):
     @abstractmethod
-    def schedule_jobs(self, jobs_to_eligible_resources, hardware_to_slots) -> List[Job]:
+    def schedule_jobs(self, jobs_to_eligible_resources, hardware_to_slots,
+                      gpu_uuids: Optional[Dict[Tuple[str, int], str]] = None) -> List[Job]:
         ''' Assign given jobs to be executed on specific hardware
         Given jobs to eligible resource UIDs and resource UIDs to free time slots,
         return a list of Jobs that should be executed.
+        GPU indexes of tasks are translated with gpu_uuids (see InfrastructureManager.gpu_uuids).
         '''
         pass
 
     @staticmethod
     # TODO: remove this dirty function when gpu_uid becomes stored in Task
-    def get_assigned_gpu_uid(task: Task, hardware_map: Dict[str, Dict]) -> str:
-        gpu_ids = list(hardware_map[task.hostname].keys())
+    def get_assigned_gpu_uid(task: Task, hardware_map: Dict[str, Dict],
+                             gpu_uuids: Optional[Dict[Tuple[str, int], str]] = None) -> Optional[str]:
+        '''
+        UUID of the GPU the task runs on, None if that GPU is not in hardware_map ({hostname: {uuid: ...}}).
+        With gpu_uuids ({(hostname, index): uuid}) it costs O(1), without it the task's GPU index
+        is the position of the GPU in hardware_map (which must not be filtered then).
+        '''
+        if task.gpu_id is None:
+            return None
+        gpus = hardware_map.get(task.hostname, {})
+        if gpu_uuids is not None:
+            gpu_uid = gpu_uuids.get((task.hostname, task.gpu_id))
+            return gpu_uid if gpu_uid in gpus else None
 
-        if task.gpu_id is None or task.gpu_id >= len(gpu_ids):
+        gpu_ids = list(gpus.keys())
+        if task.gpu_id >= len(gpu_ids):
             return None
         return gpu_ids[task.gpu_id]
 
 
 class GreedyScheduler(Scheduler):
-    def schedule_jobs(self, jobs_to_hardware, hardware_to_slots) -> List[Job]:
+    def schedule_jobs(self, jobs_to_hardware, hardware_to_slots,
+                      gpu_uuids: Optional[Dict[Tuple[str, int], str]] = None) -> List[Job]:
         scheduled_jobs = []
         for job in jobs_to_hardware:
             scheduled_tasks = 0
 
             for task in job.tasks:
                 # TODO: use stored gpu_uid when it becomes stored in Task
-                gpu_uid = Scheduler.get_assigned_gpu_uid(task, hardware_to_slots)
+                gpu_uid = Scheduler.get_assigned_gpu_uid(task, hardware_to_slots, gpu_uuids)
                 if not gpu_uid:
                     break
                 slot = hardware_to_slots[task.hostname][gpu_uid]
@@ -3,7 +3,7 @@ from tensorhive.core.utils.decorators import override
 from tensorhive.models.Job import Job
 from tensorhive.models.Task import TaskStatus
 from tensorhive.models.User import User
-from tensorhive.models.Reservation import Reservation
+from tensorhive.core.utils.ReservationIndex import ReservationIndex
 from sqlalchemy import or_, and_
 from tensorhive.controllers.job import business_execute, business_stop, JobId
 from tensorhive.config import JOB_SCHEDULING_SERVICE as CONFIG
@@ -11,7 +11,8 @@ from tensorhive.core.scheduling import Scheduler
 from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
 from tensorhive.core.managers.SSHConnectionManager import SSHConnectionManager
 from tensorhive.core import task_nursery
-from typing import List, Dict, Set
+from tensorhive.core.utils.AllowedGPUIndex import AllowedGPUIndex
+from typing import List, Dict, FrozenSet, Optional, Set, Tuple
 from datetime import datetime, timedelta
 from http import HTTPStatus
 from tensorhive.database import db_session  # pylint: disable=unused-import
@@ -82,6 +83,7 @@ class JobSchedulingService(Service):
         :returns: {hostname: {GPU_id: number_of_minutes until next occupation of the GPU}}
         '''
         ret = {}  # type: Dict[str, Dict[str, int]]
+        reservation_index = ReservationIndex()
 
         for host in hosts_with_gpu_occupation:
             ret[host] = {}
@@ -89,7 +91,7 @@ class JobSchedulingService(Service):
                 if hosts_with_gpu_occupation[host][gpu_id]:
                     ret[host][gpu_id] = 0
                 else:
-                    near_reservations = Reservation.upcoming_events_for_resource(gpu_id, self.considered_future_period)
+                    near_reservations = reservation_index.upcoming(gpu_id, self.considered_future_period)
                     if len(near_reservations):
                         nearest_reservation = near_reservations[0]
                         if nearest_reservation.start > datetime.utcnow():  # type: ignore
@@ -102,27 +104,30 @@ class JobSchedulingService(Service):
         return ret
 
     @staticmethod
-    def check_if_resources_available_for_job(job: Job, current_device_occupation: Dict[str, Dict[str, bool]]) -> bool:
+    def check_if_resources_available_for_job(job: Job, current_device_occupation: Dict[str, Dict[str, bool]],
+                                             gpu_uuids: Optional[Dict[Tuple[str, int], str]] = None) -> bool:
         for task in job.tasks:
             if not task.hostname:
                 return False
-            if not task.gpu_id:
+            gpu_uid = Scheduler.get_assigned_gpu_uid(task, current_device_occupation, gpu_uuids)
+            if gpu_uid is None:
                 return False
-            if current_device_occupation[task.hostname][task.gpu_id]:
+            if current_device_occupation[task.hostname][gpu_uid]:
                 return False
         return True
 
     @staticmethod
     def interferes_with_reservations(job: Job, available_hosts_with_gpu_occupation: Dict[str, Dict],
                                      considered_future_period: timedelta = timedelta(0),
-                                     allow_own: bool = True) -> bool:
+                                     allow_own: bool = True,
+                                     gpu_uuids: Optional[Dict[Tuple[str, int], str]] = None) -> bool:
         for task in job.tasks:
-            gpu_id = Scheduler.get_assigned_gpu_uid(task, available_hosts_with_gpu_occupation)
-            upcoming_reservations = Reservation.upcoming_events_for_resource(gpu_id, considered_future_period)
+            gpu_id = Scheduler.get_assigned_gpu_uid(task, available_hosts_with_gpu_occupation, gpu_uuids)
+            upcoming_reservations = ReservationIndex().upcoming(gpu_id, considered_future_period)
 
             if allow_own:
                 for reservation in upcoming_reservations:
-                    if reservation.user is not job.user:
+                    if reservation.user_id != job.user_id:
                         return True
             elif len(upcoming_reservations):
                 return True
@@ -136,14 +141,17 @@ class JobSchedulingService(Service):
         now = datetime.utcnow()
         user_scheduled_jobs = self.find_jobs_scheduled_for_date(now)
 
+        gpu_uuids = self._infrastructure_manager.gpu_uuids
         successfully_executed = False
         for user_scheduled_job in user_scheduled_jobs:
-            if not self.check_if_resources_available_for_job(user_scheduled_job, available_hosts_with_gpu_occupation):
+            if not self.check_if_resources_available_for_job(user_scheduled_job, available_hosts_with_gpu_occupation,
+                                                             gpu_uuids):
                 log.info(self._log_msg(now=now, action='Not executing scheduled job because resource occupied',
                                        id=user_scheduled_job.id, scheduled=user_scheduled_job._start_at))
                 continue
 
-            if self.interferes_with_reservations(user_scheduled_job, available_hosts_with_gpu_occupation):
+            if self.interferes_with_reservations(user_scheduled_job, available_hosts_with_gpu_occupation,
+                                                 gpu_uuids=gpu_uuids):
                 log.info(self._log_msg(now=now, action='Not executing scheduled job because Executing scheduled',
                                        id=user_scheduled_job.id, scheduled=user_scheduled_job._start_at))
                 continue
@@ -154,7 +162,6 @@ class JobSchedulingService(Service):
 
         return successfully_executed
 
-    # TODO: cache for user?
     def get_hosts_with_gpus_eligible_for_jobs(self, jobs: List[Job]) -> Dict[Job, Dict]:
         '''
         :param jobs: list of jobs
@@ -162,19 +169,19 @@ class JobSchedulingService(Service):
         '''
         ret = {}
 
-        current_infrastructure = self._infrastructure_manager.infrastructure
+        current_infrastructure = self._infrastructure_manager.snapshot.nodes
+        allowed_gpu_index = AllowedGPUIndex()
+        # Jobs of users with the same permissions share the result
+        eligible_gpus_by_permissions = {}  # type: Dict[Optional[FrozenSet[str]], Dict[str, List[str]]]
 
         for job in jobs:
-            owner = job.user  # type: User
-            user_filtered_infrastructure = owner.filter_infrastructure_by_user_restrictions(current_infrastructure)
-            user_filtered_hostname_gpus = {}
-            for hostname in user_filtered_infrastructure:
-                eligible_gpus_for_host = []
-                if 'GPU' in user_filtered_infrastructure[hostname]:
-                    for gpu in user_filtered_infrastructure[hostname]['GPU']:
-                        eligible_gpus_for_host.append(gpu)
-                user_filtered_hostname_gpus[hostname] = eligible_gpus_for_host
-            ret[job] = user_filtered_hostname_gpus
+            allowed_gpus = allowed_gpu_index.get(job.user_id)
+            if allowed_gpus not in eligible_gpus_by_permissions:
+                user_filtered_infrastructure = User.filter_infrastructure_by_gpus(current_infrastructure, allowed_gpus)
+                eligible_gpus_by_permissions[allowed_gpus] = {
+                    hostname: list(node.get('GPU') or {}) for hostname, node in user_filtered_infrastructure.items()
+                }
+            ret[job] = eligible_gpus_by_permissions[allowed_gpus]
 
         return ret
 
@@ -185,7 +192,8 @@ class JobSchedulingService(Service):
 
         available_slots = self.check_current_gpu_slots(available_hosts_with_gpu_occupation)
 
-        scheduled_jobs = self._scheduler.schedule_jobs(queued_jobs_to_eligible_gpus, available_slots)
+        scheduled_jobs = self._scheduler.schedule_jobs(queued_jobs_to_eligible_gpus, available_slots,
+                                                       self._infrastructure_manager.gpu_uuids)
 
         for scheduled_job in scheduled_jobs:
             log.info(self._log_msg(now=datetime.utcnow(), action='Executing queued', id=scheduled_job.id))
@@ -236,28 +244,25 @@ class JobSchedulingService(Service):
 
     def sync_running_from_queue(self, available_hosts_with_gpu_occupation: Dict[str, Dict[str, List]]):
         jobs_running_from_queue = Job.get_jobs_running_from_queue()
+        gpu_uuids = self._infrastructure_manager.gpu_uuids
+        process_index = self._infrastructure_manager.process_index()
 
         for job in jobs_running_from_queue:
             job_should_be_stopped = False
             for task in job.tasks:
-                gpu_uid = Scheduler.get_assigned_gpu_uid(task, available_hosts_with_gpu_occupation)
+                gpu_uid = Scheduler.get_assigned_gpu_uid(task, available_hosts_with_gpu_occupation, gpu_uuids)
 
                 if not gpu_uid or task.pid not in task_nursery.running(task.hostname, job.user.username):
                     task.status = TaskStatus.not_running
                     continue
 
-                current_processes_on_gpu = available_hosts_with_gpu_occupation[task.hostname][gpu_uid]
-                if current_processes_on_gpu is None:
-                    other_process_pids = []
-                else:
-                    other_process_pids = [process['pid'] for process in current_processes_on_gpu
-                                          if process['pid'] is not task.pid]
+                other_process_pids = [process.pid for process in process_index.others_on_gpu(gpu_uid, task.pid)]
 
                 considered_future_period = timedelta(minutes=CONFIG.SCHEDULE_QUEUED_JOBS_WHEN_FREE_MINS)
                 interferes = self.interferes_with_reservations(job, available_hosts_with_gpu_occupation,
                                                                considered_future_period=considered_future_period,
                                                                # Queued jobs should run only between reservations
-                                                               allow_own=False)
+                                                               allow_own=False, gpu_uuids=gpu_uuids)
 
                 if len(other_process_pids) or interferes:
                     job_should_be_stopped = True
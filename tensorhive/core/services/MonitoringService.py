@@ -1,8 +1,12 @@
-
 from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
 from tensorhive.core.managers.SSHConnectionManager import SSHConnectionManager
 from tensorhive.core.services.Service import Service
-from typing import List, Dict, Any
+from tensorhive.core.monitors import probe
+from tensorhive.core.utils.ReservationIndex import ReservationIndex
+from tensorhive.models.Resource import Resource
+from tensorhive.models.Task import Task, TaskStatus
+from typing import List, Dict, Any, Optional, Set, Tuple
+import random
 import time
 import gevent
 from tensorhive.core.utils.decorators import override
@@ -14,16 +18,56 @@ class MonitoringService(Service):
     '''
     Periodically updates infrastructure
     Can be configured to use multiple monitors against nodes with available connection
+
+    Each node is probed by each monitor in a separate greenlet, so results are published
+    as soon as they arrive. Nodes which do not answer before the deadline are marked as stale
+    (their previous data is kept) and are not probed again until the pending probe finishes.
+
+    Every node has its own schedule:
+    - busy nodes (with an active reservation or a running task) are probed every `busy_interval`,
+    - other nodes are probed every `idle_interval`,
+    - unreachable nodes are retried with exponential backoff (with jitter), up to `max_backoff`.
+
+    Whenever GPU inventory changes, newly discovered GPUs (and GPUs moved to another node)
+    are registered in the database as resources.
+
+    If `snapshot_file` is given, the latest snapshot is saved there every `snapshot_interval` seconds
+    (when it has changed), to be loaded as stale data on the next start (see InfrastructureManager.load_snapshot).
     '''
     monitors = []  # type: List
     connections = []  # type: List
     infrastructure_manager = None
     connection_manager = None
+    # How often (in seconds) busy nodes are determined from the database
+    busy_hosts_refresh_interval = 5.0
 
-    def __init__(self, monitors, interval=0.0):
+    def __init__(self, monitors, interval=0.0, deadline=None, busy_interval=None, idle_interval=None,
+                 max_backoff=300.0, snapshot_file=None, snapshot_interval=30.0):
         super().__init__()
         self.monitors = monitors
         self.interval = interval
+        self.busy_interval = busy_interval if busy_interval is not None else interval
+        self.idle_interval = idle_interval if idle_interval is not None else interval
+        self.max_backoff = max_backoff
+        # Max time (in seconds) a single probe is waited for before node is marked as stale, None means no limit
+        self.deadline = deadline
+        # Dedicated clients, so that connections are not shared with other services' threads
+        self._host_connections = {}  # type: Dict[str, Any]
+        # Probes which are still running and their start time, keyed by (hostname, monitor's position)
+        self._pending = {}  # type: Dict[Tuple[str, int], gevent.Greenlet]
+        self._started_at = {}  # type: Dict[Tuple[str, int], float]
+        # When each probe should be executed next time and how many times in a row node was unreachable
+        self._next_probe_at = {}  # type: Dict[Tuple[str, int], float]
+        self._failures = {}  # type: Dict[Tuple[str, int], int]
+        self._busy_hosts = set()  # type: Set[str]
+        self._busy_hosts_updated_at = None  # type: Optional[float]
+        # Hostname of each GPU as stored in the database and inventory version it comes from
+        self._registered_gpus = {}  # type: Dict[str, str]
+        self._registered_inventory_version = None  # type: Optional[int]
+        self.snapshot_file = snapshot_file
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_saved_at = time.time()
+        self._saved_snapshot_version = None  # type: Optional[int]
 
     @override
     def inject(self, injected_object):
@@ -32,24 +76,146 @@ class MonitoringService(Service):
         elif isinstance(injected_object, SSHConnectionManager):
             self.connection_manager = injected_object
 
+    def _connection(self, hostname: str):
+        if self._host_connections.get(hostname) is None:
+            self._host_connections[hostname] = self.connection_manager.new_single_connection(hostname)
+        return self._host_connections[hostname]
+
+    def busy_hosts(self) -> Set[str]:
+        '''Nodes with GPUs reserved at the moment or running TensorHive tasks'''
+        hosts = {task.hostname for task in Task.query.filter(Task._status == TaskStatus.running).all()}
+
+        reserved_uuids = {reservation.resource_id for reservation in ReservationIndex().current()}
+        if reserved_uuids:
+            for hostname, node in self.infrastructure_manager.infrastructure.items():
+                if not reserved_uuids.isdisjoint(node.get('GPU') or {}):
+                    hosts.add(hostname)
+        return hosts
+
+    def _refresh_busy_hosts(self) -> None:
+        now = time.time()
+        if self._busy_hosts_updated_at is not None \
+                and now - self._busy_hosts_updated_at < self.busy_hosts_refresh_interval:
+            return
+        self._busy_hosts_updated_at = now
+        try:
+            self._busy_hosts = self.busy_hosts()
+        except Exception as e:
+            log.warning('Could not determine busy nodes: {}'.format(e))
+
+    def register_resources(self) -> None:
+        '''Stores GPUs which are new or have been moved since the last inventory change as resources'''
+        inventory_version = self.infrastructure_manager.gpu_inventory_version
+        if inventory_version == self._registered_inventory_version:
+            return
+        changed_gpus = {uuid: (hostname, name)
+                        for uuid, (hostname, name) in self.infrastructure_manager.gpu_locations().items()
+                        if self._registered_gpus.get(uuid) != hostname}
+        if changed_gpus:
+            try:
+                Resource.upsert_discovered(changed_gpus)
+            except Exception as e:
+                # Retried with the next cycle
+                log.warning('Could not register discovered GPUs: {}'.format(e))
+                return
+            self._registered_gpus.update({uuid: hostname for uuid, (hostname, _) in changed_gpus.items()})
+        self._registered_inventory_version = inventory_version
+
+    def save_snapshot(self) -> None:
+        '''Saves the latest snapshot to `snapshot_file`, if it is due and there was any update since the last time'''
+        if not self.snapshot_file or self.snapshot_interval <= 0:
+            return
+        now = time.time()
+        version = self.infrastructure_manager.snapshot.version
+        if now - self._snapshot_saved_at < self.snapshot_interval or version == self._saved_snapshot_version:
+            return
+        self._snapshot_saved_at = now
+        try:
+            self.infrastructure_manager.save_snapshot(self.snapshot_file)
+            self._saved_snapshot_version = version
+        except Exception as e:
+            log.warning('Could not save infrastructure snapshot to {}: {}'.format(self.snapshot_file, e))
+
+    def _schedule_next_probe(self, key: Tuple[str, int], started_at: float, reachable: bool) -> None:
+        hostname, _ = key
+        if reachable:
+            self._failures[key] = 0
+            interval = self.busy_interval if hostname in self._busy_hosts else self.idle_interval
+        else:
+            self._failures[key] = self._failures.get(key, 0) + 1
+            backoff = min(self.max_backoff, max(self.idle_interval, 1.0) * 2 ** (self._failures[key] - 1))
+            # Jitter prevents unreachable nodes from being retried all at once
+            interval = backoff / 2 + random.uniform(0, backoff / 2)
+        self._next_probe_at[key] = started_at + interval
+
+    def _probe(self, key: Tuple[str, int], monitor) -> None:
+        '''Probes single node with single monitor and publishes the result immediately'''
+        hostname, _ = key
+        started_at = time.time()
+        try:
+            connection = self._connection(hostname)
+            assert connection is not None, 'Could not create SSH client'
+            output = probe.execute(connection, [monitor])
+            reachable = probe.publish(hostname, output[hostname], [monitor], self.infrastructure_manager)
+        except Exception as e:
+            log.warning('Exception in monitor {} on {}: {}'.format(monitor, hostname, e))
+            monitor.probe_failed(hostname, self.infrastructure_manager)
+            reachable = False
+        self.infrastructure_manager.mark_updated(hostname)
+        self._schedule_next_probe(key, started_at, reachable)
+        self._started_at.pop(key, None)
+
+    def update_all(self) -> None:
+        '''Spawns probes which are due and marks nodes with overdue probes as stale'''
+        self._refresh_busy_hosts()
+        self.register_resources()
+        self.save_snapshot()
+        now = time.time()
+        self._pending = {key: greenlet for key, greenlet in self._pending.items() if not greenlet.ready()}
+        for hostname in self.infrastructure_manager.infrastructure:
+            for monitor_id, monitor in enumerate(self.monitors):
+                key = (hostname, monitor_id)
+                if key in self._pending:
+                    started_at = self._started_at.get(key)
+                    if self.deadline is not None and started_at is not None and now - started_at > self.deadline:
+                        # Reported once per hanging probe
+                        log.warning('{} did not answer in {}s, its data is stale'.format(hostname, self.deadline))
+                        self.infrastructure_manager.mark_stale(hostname)
+                        del self._started_at[key]
+                    continue
+                if now < self._next_probe_at.get(key, 0):
+                    continue
+                self._started_at[key] = now
+                self._pending[key] = gevent.spawn(self._probe, key, monitor)
+
+    def seconds_until_next_probe(self) -> float:
+        '''Time until the earliest scheduled probe, pending probes are checked at least every `interval`'''
+        now = time.time()
+        waiting_times = [self._next_probe_at.get(key, now) - now
+                         for hostname in self.infrastructure_manager.infrastructure
+                         for key in ((hostname, monitor_id) for monitor_id in range(len(self.monitors)))
+                         if key not in self._pending]
+        if self._pending:
+            waiting_times.append(min(self.busy_interval, self.idle_interval))
+        if self.deadline is not None:
+            waiting_times.extend(self._started_at[key] + self.deadline - now for key in self._started_at
+                                 if key in self._pending)
+        # Lower bound gives the hub a chance to run probes even when interval is 0
+        return max(min(waiting_times, default=self.interval), 0.01)
+
     @override
     def do_run(self):
         # FIXME Time measurements can be abandoned in the future
         time_func = time.perf_counter
         start_time = time_func()
 
-        for monitor in self.monitors:
-            try:
-                monitor.update(self.connection_manager.connections, self.infrastructure_manager)
-            except Exception as e:
-                log.warning('Exception in monitor {}: {}'.format(monitor, e))
+        self.update_all()
 
         end_time = time_func()
         execution_time = end_time - start_time
 
-        # Hold on until next interval
-        if execution_time < self.interval:
-            gevent.sleep(self.interval - execution_time)
+        # Hold on until some probe is due
+        gevent.sleep(self.seconds_until_next_probe())
         waiting_time = time_func() - end_time
         total_time = execution_time + waiting_time
         log.debug('MonitoringService loop took: {:.2f}s (waiting {:.2f}) = {:.2f}'.format(
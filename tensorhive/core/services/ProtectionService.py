@@ -1,11 +1,12 @@
 from tensorhive.core.services.Service import Service
-from tensorhive.models.Reservation import Reservation
 from tensorhive.models.User import User
 from tensorhive.database import db_session  # pylint: disable=unused-import
 from tensorhive.core.utils.decorators import override
 from tensorhive.core.utils.time import utc2local
 from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
 from tensorhive.core.managers.SSHConnectionManager import SSHConnectionManager
+from tensorhive.core.utils.ProcessIndex import ProcessEntry
+from tensorhive.core.utils.ReservationIndex import ReservationEntry, ReservationIndex
 from typing import Set, List, Optional, Dict
 import time
 import gevent
@@ -37,28 +38,27 @@ class ProtectionService(Service):
             self.connection_manager = injected_object
 
     def find_hostname(self, uuid: str) -> Optional[str]:
-        '''Seeks the hostname of node which has GPU with given UUID'''
-        infrastructure = self.infrastructure_manager.infrastructure
-        for hostname, node_data in infrastructure.items():
-            if node_data.get('GPU', {}).get(uuid):
-                return hostname
-        log.warning('GPU with UUID="{}" was not found'.format(uuid))
-        return None
+        '''Hostname of node which has GPU with given UUID'''
+        location = self.infrastructure_manager.gpu_location(uuid)
+        if location is None:
+            log.warning('GPU with UUID="{}" was not found'.format(uuid))
+            return None
+        return location[0]
 
     def gpu_attr(self, hostname: str, uuid: str, attribute='name') -> str:
         '''Fetches the value of 'name' or 'index' attributes for GPU with specific UUID'''
-        infrastructure = self.infrastructure_manager.infrastructure
+        infrastructure = self.infrastructure_manager.snapshot.nodes
         all_gpus = infrastructure.get(hostname, {}).get('GPU', {})
         gpu = all_gpus.get(uuid, {})
         return gpu.get(attribute, '<not available>')
 
-    def store_violation(self, storage: Dict[str, Dict], process: Dict, hostname: str,
-                        reservation: Reservation, gpu_id: str):
-        intruder = process['owner']
+    def store_violation(self, storage: Dict[str, Dict], process: ProcessEntry, hostname: str,
+                        reservation: Optional[ReservationEntry], gpu_id: str):
+        intruder = process.owner
 
         reservation_data = {
-            'OWNER_USERNAME': reservation.user.username if reservation else None,
-            'OWNER_EMAIL': reservation.user.email if reservation else None,
+            'OWNER_USERNAME': reservation.username if reservation else None,
+            'OWNER_EMAIL': reservation.email if reservation else None,
             'END': utc2local(reservation.end) if reservation else None,  # type: ignore
             'GPU_UUID': gpu_id,
             'GPU_NAME': self.gpu_attr(hostname, gpu_id, attribute='name'),
@@ -70,32 +70,30 @@ class ProtectionService(Service):
             storage[intruder] = {
                 'INTRUDER_USERNAME': intruder,
                 'RESERVATIONS': [reservation_data],
-                'VIOLATION_PIDS': {hostname: set([process['pid']])},
+                'VIOLATION_PIDS': {hostname: set([process.pid])},
             }
         else:
             storage[intruder]['RESERVATIONS'].append(reservation_data)
-            storage[intruder]['VIOLATION_PIDS'][hostname].add(process['pid'])
+            storage[intruder]['VIOLATION_PIDS'][hostname].add(process.pid)
 
     @override
     def do_run(self):
         time_func = time.perf_counter
         start_time = time_func()
 
-        current_infrastructure = self.infrastructure_manager.all_nodes_with_gpu_processes()
-        for hostname in current_infrastructure:
+        process_index = self.infrastructure_manager.process_index()
+        reservation_index = ReservationIndex()
+        for hostname in process_index.hostnames:
             violations = {}  # type: Dict[str, Dict]
-            for gpu_id in current_infrastructure[hostname]:
-                processes = current_infrastructure[hostname][gpu_id]
-                if self.strict_reservations or (processes is not None and len(processes)):
-                    current_gpu_reservations = Reservation.current_events(gpu_id)
-                    reservation = None
-                    if len(current_gpu_reservations):
-                        reservation = current_gpu_reservations[0]
-                        if hostname is None or reservation.user is None:
+            for gpu_id, processes in process_index.gpus(hostname).items():
+                if self.strict_reservations or len(processes):
+                    reservation = reservation_index.active(gpu_id)
+                    if reservation is not None:
+                        if hostname is None or reservation.username is None:
                             continue
 
                         for process in processes:
-                            if process['owner'] != reservation.user.username:
+                            if process.owner != reservation.username:
                                 self.store_violation(violations, process, hostname, reservation, gpu_id)
                     elif self.strict_reservations:
                         for process in processes:
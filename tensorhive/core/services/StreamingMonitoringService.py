@@ -0,0 +1,136 @@
+from tensorhive.core.services.MonitoringService import MonitoringService
+from tensorhive.core.monitors import agent, probe
+from typing import Dict, Tuple
+import time
+import gevent
+from tensorhive.core.utils.decorators import override
+import logging
+log = logging.getLogger(__name__)
+
+
+class StreamingMonitoringService(MonitoringService):
+    '''
+    Agent mode of monitoring: instead of executing probes periodically, a long-running agent script
+    is started on each node over one SSH channel. Its stdout is consumed as a stream,
+    so infrastructure is updated incrementally, as soon as new samples arrive.
+
+    Agents are restarted only when the script changes (i.e. monitors do) and reconnected when the channel
+    is lost (with backoff for unreachable nodes). Rarely changing properties (e.g. GPU inventory) are not
+    part of the script, they are queried by one-shot probes on nodes which need them (see Monitor.refresh_sections).
+    Nodes which have not completed any cycle within `interval` + `deadline` are marked as stale.
+    '''
+
+    def __init__(self, monitors, interval=1.0, deadline=None, max_backoff=300.0, snapshot_file=None,
+                 snapshot_interval=30.0):
+        super().__init__(monitors, interval=interval, deadline=deadline, max_backoff=max_backoff,
+                         snapshot_file=snapshot_file, snapshot_interval=snapshot_interval)
+        # Running agents and the scripts they were started with
+        self._agents = {}  # type: Dict[str, gevent.Greenlet]
+        self._agent_scripts = {}  # type: Dict[str, str]
+        # Running one-shot probes of refresh sections
+        self._refreshes = {}  # type: Dict[str, gevent.Greenlet]
+
+    def _run_agent(self, hostname: str, script: str) -> None:
+        '''Consumes agent's output until the channel is closed'''
+        key = (hostname, 0)  # type: Tuple[str, int]
+        started_at = time.time()
+        completed_cycles = 0
+        connection = host_out = None
+        parser = agent.AgentOutputParser(hostname, self.monitors, self.infrastructure_manager)
+        try:
+            connection = self._connection(hostname)
+            assert connection is not None, 'Could not create SSH client'
+            # Pseudo-terminal makes the remote side kill the agent when channel gets closed
+            host_out = connection.run_command(script, stop_on_errors=False, use_pty=True)[hostname]
+            if host_out.exception is not None:
+                raise host_out.exception
+            for line in host_out.stdout:
+                if parser.feed(line):
+                    completed_cycles += 1
+                    self.infrastructure_manager.mark_updated(hostname)
+            log.warning('Monitoring agent on {} has stopped (exit code: {})'.format(hostname, host_out.exit_code))
+        except gevent.GreenletExit:
+            # Restart requested
+            completed_cycles = max(completed_cycles, 1)
+        except Exception as e:
+            log.warning('Monitoring agent on {} failed: {}'.format(hostname, e))
+        finally:
+            if host_out is not None and host_out.channel is not None:
+                try:
+                    connection.host_clients[hostname].close_channel(host_out.channel)
+                except Exception as e:
+                    log.debug('Could not close agent channel on {}: {}'.format(hostname, e))
+            if completed_cycles == 0:
+                for monitor in self.monitors:
+                    monitor.probe_failed(hostname, self.infrastructure_manager)
+                self.infrastructure_manager.mark_updated(hostname)
+            if completed_cycles > 0:
+                # Agent which has been working is reconnected immediately
+                self._failures[key] = 0
+                self._next_probe_at[key] = time.time()
+            else:
+                # Unreachable node backs off
+                self._schedule_next_probe(key, started_at, reachable=False)
+
+    def _refresh(self, hostname: str, sections: Dict[str, str]) -> None:
+        '''Executes refresh sections on a node, its agent keeps running meanwhile'''
+        key = (hostname, 1)  # type: Tuple[str, int]
+        started_at = time.time()
+        try:
+            connection = self._connection(hostname)
+            assert connection is not None, 'Could not create SSH client'
+            host_out = probe.execute_sections(connection, sections)[hostname]
+            if host_out.exception is not None:
+                raise host_out.exception
+            monitors = [monitor for monitor in self.monitors if monitor.refresh_section_names & set(sections)]
+            probe.dispatch(hostname, probe.split_output(host_out.stdout), monitors, self.infrastructure_manager,
+                           fill_missing=False)
+            # Node's liveness is reported by its agent only
+            self.infrastructure_manager.publish([hostname])
+            reachable = True
+        except Exception as e:
+            log.warning('Could not refresh {} on {}: {}'.format(', '.join(sections), hostname, e))
+            reachable = False
+        self._schedule_next_probe(key, started_at, reachable)
+
+    def _start_refresh(self, hostname: str, now: float) -> None:
+        running_refresh = self._refreshes.get(hostname)
+        if running_refresh is not None and not running_refresh.ready():
+            return
+        if now < self._next_probe_at.get((hostname, 1), 0):
+            return
+        sections = {}  # type: Dict[str, str]
+        for monitor in self.monitors:
+            sections.update(monitor.refresh_sections(hostname))
+        if sections:
+            self._refreshes[hostname] = gevent.spawn(self._refresh, hostname, sections)
+
+    @override
+    def update_all(self) -> None:
+        '''Starts missing agents and due refreshes, restarts outdated agents and marks silent nodes as stale'''
+        self.register_resources()
+        self.save_snapshot()
+        script = agent.build_script(self.monitors, self.interval)
+        now = time.time()
+        node_status = self.infrastructure_manager.node_status()
+        for hostname in self.infrastructure_manager.infrastructure:
+            self._start_refresh(hostname, now)
+            running_agent = self._agents.get(hostname)
+            if running_agent is not None and not running_agent.ready():
+                if self._agent_scripts[hostname] != script:
+                    log.debug('Restarting monitoring agent on {}'.format(hostname))
+                    running_agent.kill(block=True)
+                else:
+                    age = node_status.get(hostname, {}).get('age')
+                    if self.deadline is not None and age is not None and age > self.interval + self.deadline:
+                        self.infrastructure_manager.mark_stale(hostname)
+                    continue
+
+            if now < self._next_probe_at.get((hostname, 0), 0):
+                continue
+            self._agent_scripts[hostname] = script
+            self._agents[hostname] = gevent.spawn(self._run_agent, hostname, script)
+
+    @override
+    def seconds_until_next_probe(self) -> float:
+        return max(self.interval, 0.01)
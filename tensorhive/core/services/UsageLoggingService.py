@@ -1,6 +1,8 @@
 from sqlalchemy.orm.exc import NoResultFound
 from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
 from tensorhive.core.utils.decorators import override
+from tensorhive.core.utils.records import metric_value
+from tensorhive.core.utils.ReservationIndex import ReservationIndex
 from tensorhive.core.services.Service import Service
 from tensorhive.models.Reservation import Reservation
 from typing import Dict, List, Optional, Union
@@ -89,8 +91,8 @@ class Log:
         log['name'] = self.data['name']
         log['index'] = self.data['index']
 
-        mem_util = self.data['metrics']['mem_util']['value']
-        gpu_util = self.data['metrics']['utilization']['value']
+        mem_util = metric_value(self.data['metrics'], 'mem_util')
+        gpu_util = metric_value(self.data['metrics'], 'utilization')
 
         if gpu_util is not None and mem_util is not None:
             log['timestamps'].append(datetime.datetime.utcnow())
@@ -158,9 +160,14 @@ class UsageLoggingService(Service):
 
     def log_current_usage(self):
         '''Updates log files related to current reservations'''
-        current_reservations = Reservation.current_events()
-        infrastructure = self.infrastructure_manager.infrastructure
+        current_reservations = ReservationIndex().current()
+        infrastructure = self.infrastructure_manager.snapshot.nodes
+        node_status = self.infrastructure_manager.node_status()
         for reservation in current_reservations:
+            # Data of stale nodes (e.g. restored from a snapshot) is not current, so there is nothing to log
+            location = self.infrastructure_manager.gpu_location(reservation.resource_id)
+            if location is not None and node_status.get(location[0], {}).get('stale'):
+                continue
             filename = '{id}.json'.format(id=reservation.id)
             log_file_path = self.log_dir / filename
             try:
@@ -199,6 +206,7 @@ class UsageLoggingService(Service):
         It creates very simple summary (avg) and fills in existing reservation database record.
         '''
         time_now = datetime.datetime.utcnow()
+        reservation_index = ReservationIndex()
 
         # Get all files within given directory
         # Accept only files like: 10.json
@@ -207,6 +215,10 @@ class UsageLoggingService(Service):
                 try:
                     log.debug('Processing file: {}'.format(item))
                     id_from_filename = int(item.stem)
+                    indexed_reservation = reservation_index.get(id_from_filename)
+                    if indexed_reservation is not None and indexed_reservation.end >= time_now:
+                        # Still lasts, no need to load it
+                        continue
                     reservation = Reservation.get(id=id_from_filename)
                     reservation_expired = reservation.end < time_now
 
@@ -229,12 +241,13 @@ class UsageLoggingService(Service):
                     log.debug(e)
 
     def extract_specific_gpu_data(self, uuid: str, infrastructure: Dict) -> Dict:
-        '''Returns whole right-hand side value (dictionary) for given key (uuid)'''
+        '''Returns whole right-hand side value (GPU record) for given key (uuid)'''
         assert isinstance(infrastructure, dict)
         assert isinstance(uuid, str) and len(uuid) == 40
 
-        for hostname in infrastructure.keys():
-            gpu_data = infrastructure[hostname].get('GPU').get(uuid)
+        location = self.infrastructure_manager.gpu_location(uuid)
+        if location is not None:
+            gpu_data = (infrastructure.get(location[0], {}).get('GPU') or {}).get(uuid)
             if gpu_data:
                 return gpu_data
         raise KeyError(uuid + ' has not been found!')
@@ -55,6 +55,11 @@ def get_client(config: HostsConfig, pconfig: Optional[ProxyConfig] = None, **kwa
 
     Client is fetched directly from cache if identical arguments were used recently.
     """
+    if SSH.BACKEND == 'fake':
+        # Test backend, imported only when configured
+        from tensorhive.core.fake_ssh import FakeParallelSSHClient
+        return FakeParallelSSHClient(hosts=config.keys(), host_config=config)
+
     if pconfig is None:
         pconfig = {}
 
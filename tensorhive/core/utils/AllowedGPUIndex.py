@@ -0,0 +1,78 @@
+from tensorhive.core.utils.Singleton import Singleton
+from tensorhive.database import db_session
+from tensorhive.models.User import User
+from sqlalchemy import event
+from datetime import datetime
+from typing import Dict, FrozenSet, Optional, Tuple
+import itertools
+import threading
+
+# (index version, when the entry expires, allowed GPUs - None means all)
+Entry = Tuple[int, Optional[datetime], Optional[FrozenSet[str]]]
+
+
+class AllowedGPUIndex(metaclass=Singleton):
+    '''
+    UUIDs of GPUs each user is allowed to use (see User.get_allowed_gpu_ids), shared by the API and services.
+
+    Entries are computed once and reused until restrictions, their assignments (to users, groups and resources)
+    or group memberships are committed to the database, which invalidates the whole index.
+    An entry also expires when the earliest of restrictions it was computed from ends.
+    '''
+    watched_tables = {'users', 'groups', 'user2group', 'resources', 'restrictions', 'restriction2assignee',
+                      'restriction2resource'}
+
+    def __init__(self) -> None:
+        self._version = 0
+        self._entries = {}  # type: Dict[int, Entry]
+        self._lock = threading.Lock()
+        event.listen(db_session, 'after_flush', self._after_flush)
+        event.listen(db_session, 'after_commit', self._after_commit)
+        event.listen(db_session, 'after_soft_rollback', self._after_soft_rollback)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries = {}
+
+    def _after_flush(self, session, flush_context) -> None:
+        # Other threads read committed data only, so the index is invalidated when changes are committed
+        for instance in itertools.chain(session.new, session.dirty, session.deleted):
+            if getattr(instance, '__tablename__', None) in self.watched_tables:
+                session.info['allowed_gpu_index_changed'] = True
+                return
+
+    def _after_commit(self, session) -> None:
+        if session.info.pop('allowed_gpu_index_changed', False):
+            self.invalidate()
+
+    def _after_soft_rollback(self, session, previous_transaction) -> None:
+        session.info.pop('allowed_gpu_index_changed', None)
+
+    def get(self, user_id: int, session=None) -> Optional[FrozenSet[str]]:
+        '''
+        Allowed GPUs of given user, None if the user is not restricted at all (global restriction).
+        User is loaded from the database only when the entry is missing or outdated (raises NoResultFound),
+        within given session (the thread's scoped session by default).
+        '''
+        entry = self._entries.get(user_id)
+        now = datetime.utcnow()
+        if entry is not None:
+            version, valid_until, allowed_gpus = entry
+            if version == self._version and (valid_until is None or now < valid_until):
+                return allowed_gpus
+
+        # Version is taken before reading restrictions, so that changes made meanwhile invalidate the entry
+        version = self._version
+        user = User.get(user_id) if session is None else session.query(User).filter_by(id=user_id).one()
+        ends = [restriction.ends_at for restriction in user.get_restrictions(include_expired=False, include_group=True)
+                if restriction.ends_at is not None]
+        allowed_gpus = user.get_allowed_gpu_ids()
+        if allowed_gpus is not None:
+            allowed_gpus = frozenset(allowed_gpus)
+        self._entries[user_id] = (version, min(ends, default=None), allowed_gpus)
+        return allowed_gpus
@@ -0,0 +1,195 @@
+from tensorhive.core.utils.AllowedGPUIndex import AllowedGPUIndex
+from tensorhive.core.utils.Singleton import Singleton
+from tensorhive.database import db_session
+from tensorhive.models.Resource import Resource
+from sqlalchemy import event
+from sqlalchemy.orm.exc import NoResultFound
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import bisect
+import itertools
+import threading
+
+WEEK = timedelta(days=7)
+# Weekly patterns are expressed as offsets from (any) Monday midnight
+MONDAY = datetime(2018, 1, 1)
+
+# Sorted, merged (start, end) offsets within a week, None means the whole week
+WeeklyPattern = Optional[Tuple[Tuple[timedelta, timedelta], ...]]
+# (start, end - None if indefinite, weekly pattern)
+Period = Tuple[datetime, Optional[datetime], WeeklyPattern]
+
+
+def merge(intervals: List[Tuple[timedelta, timedelta]]) -> List[Tuple[timedelta, timedelta]]:
+    '''Joins overlapping and adjacent intervals'''
+    merged = []  # type: List[Tuple[timedelta, timedelta]]
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def as_pattern(intervals: List[Tuple[timedelta, timedelta]]) -> WeeklyPattern:
+    pattern = tuple(merge(intervals))
+    return None if pattern == ((timedelta(), WEEK),) else pattern
+
+
+def weekly_pattern(schedules) -> WeeklyPattern:
+    '''Time within a week covered by any of given schedules'''
+    windows = []
+    for schedule in schedules:
+        hour_start, hour_end = schedule.hour_start, schedule.hour_end
+        if hour_start == hour_end:
+            continue
+        start = timedelta(hours=hour_start.hour, minutes=hour_start.minute, seconds=hour_start.second)
+        end = timedelta(hours=hour_end.hour, minutes=hour_end.minute)
+        # Schedules ending at HH:59 (e.g. 23:59) last until the full hour
+        if hour_end.minute == 59:
+            end += timedelta(minutes=1)
+        # Schedule lasts overnight
+        if hour_start > hour_end:
+            end += timedelta(days=1)
+        for day in schedule.schedule_days:
+            day_offset = timedelta(days=int(day) - 1)
+            if day_offset + end > WEEK:
+                # Sunday night continues on Monday
+                windows += [(day_offset + start, WEEK), (timedelta(), day_offset + end - WEEK)]
+            else:
+                windows.append((day_offset + start, day_offset + end))
+    return as_pattern(windows)
+
+
+def pattern_covers(pattern: WeeklyPattern, start: datetime, end: datetime) -> bool:
+    if pattern is None:
+        return True
+    if end - start >= WEEK:
+        return False
+    offset = (start - MONDAY) % WEEK
+    end_offset = offset + (end - start)
+    if end_offset > WEEK:
+        return _offsets_covered(pattern, offset, WEEK) and _offsets_covered(pattern, timedelta(), end_offset - WEEK)
+    return _offsets_covered(pattern, offset, end_offset)
+
+
+def _offsets_covered(pattern: Tuple[Tuple[timedelta, timedelta], ...], start: timedelta, end: timedelta) -> bool:
+    # Intervals are merged, so a single one has to cover the whole range
+    position = bisect.bisect_right(pattern, (start, timedelta.max)) - 1
+    return position >= 0 and end <= pattern[position][1]
+
+
+class Availability:
+    '''
+    Time when a user is allowed to reserve a resource, compiled from restrictions applying to both.
+
+    Timeline is split into periods between consecutive starts and ends of restrictions. Within a period
+    the same restrictions apply, so their schedules are merged into a single weekly pattern. Periods when
+    no restriction applies are left out. Checking a reservation only looks up the periods it spans.
+    '''
+
+    def __init__(self, restrictions) -> None:
+        patterns = [(restriction.starts_at, restriction.ends_at,
+                     weekly_pattern(restriction.schedules) if restriction.schedules else None)
+                    for restriction in restrictions]
+        bounds = sorted({start for start, _, _ in patterns} | {end for _, end, _ in patterns if end is not None})
+        periods = []  # type: List[Period]
+        for period_start, period_end in itertools.zip_longest(bounds, bounds[1:]):
+            applying = [pattern for start, end, pattern in patterns
+                        if start <= period_start and (end is None or period_start < end)]
+            if not applying:
+                continue
+            if None in applying:
+                # Some restriction has no schedules
+                pattern = None  # type: WeeklyPattern
+            else:
+                pattern = as_pattern([interval for windows in applying for interval in windows])  # type: ignore
+            if periods and periods[-1][1] == period_start and periods[-1][2] == pattern:
+                periods[-1] = (periods[-1][0], period_end, pattern)
+            else:
+                periods.append((period_start, period_end, pattern))
+        self.periods = periods
+        self._starts = [period[0] for period in periods]
+
+    def covers(self, start: datetime, end: datetime) -> bool:
+        '''Whether the whole <start, end) time is allowed'''
+        position = bisect.bisect_right(self._starts, start) - 1
+        if position < 0:
+            return False
+        while start < end:
+            if position == len(self.periods):
+                return False
+            period_start, period_end, pattern = self.periods[position]
+            # Nothing is allowed between periods
+            if start < period_start or (period_end is not None and start >= period_end):
+                return False
+            covered_until = end if period_end is None else min(end, period_end)
+            if not pattern_covers(pattern, start, covered_until):
+                return False
+            start = covered_until
+            position += 1
+        return True
+
+
+# (index version, when the entry expires, availability - None if there is no such resource)
+Entry = Tuple[int, Optional[datetime], Optional[Availability]]
+
+
+class AvailabilityIndex(metaclass=Singleton):
+    '''
+    Compiled availability (see Availability) of resources for users, shared by all reservation verifications.
+
+    Entries are computed once and reused until restrictions, their schedules, assignments (to users, groups
+    and resources) or group memberships are committed to the database, which invalidates the whole index.
+    An entry also expires when the earliest of restrictions it was computed from ends.
+    '''
+    watched_tables = AllowedGPUIndex.watched_tables | {'restriction_schedules', 'restriction2schedule'}
+
+    def __init__(self) -> None:
+        self._version = 0
+        self._entries = {}  # type: Dict[Tuple[int, str], Entry]
+        self._lock = threading.Lock()
+        event.listen(db_session, 'after_flush', self._after_flush)
+        event.listen(db_session, 'after_commit', self._after_commit)
+        event.listen(db_session, 'after_soft_rollback', self._after_soft_rollback)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries = {}
+
+    def _after_flush(self, session, flush_context) -> None:
+        # Other threads read committed data only, so the index is invalidated when changes are committed
+        for instance in itertools.chain(session.new, session.dirty, session.deleted):
+            if getattr(instance, '__tablename__', None) in self.watched_tables:
+                session.info['availability_index_changed'] = True
+                return
+
+    def _after_commit(self, session) -> None:
+        if session.info.pop('availability_index_changed', False):
+            self.invalidate()
+
+    def _after_soft_rollback(self, session, previous_transaction) -> None:
+        session.info.pop('availability_index_changed', None)
+
+    def get(self, user, resource_id: str) -> Optional[Availability]:
+        '''Availability of the resource for given user, None if there is no such resource'''
+        entry = self._entries.get((user.id, resource_id))
+        if entry is not None:
+            version, valid_until, availability = entry
+            if version == self._version and (valid_until is None or datetime.utcnow() < valid_until):
+                return availability
+
+        # Version is taken before reading restrictions, so that changes made meanwhile invalidate the entry
+        version = self._version
+        restrictions = user.get_restrictions(include_group=True)
+        try:
+            resource = Resource.get(resource_id)
+        except NoResultFound:
+            availability = None
+        else:
+            # Global restrictions or applied to selected resource
+            availability = Availability([r for r in restrictions if r.is_global or resource in r.resources])
+        ends = [restriction.ends_at for restriction in restrictions if restriction.ends_at is not None]
+        self._entries[(user.id, resource_id)] = (version, min(ends, default=None), availability)
+        return availability
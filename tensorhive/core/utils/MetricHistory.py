@@ -0,0 +1,141 @@
+from tensorhive.core.utils.records import metric_item
+from typing import Dict, List, Mapping, Optional, Tuple
+import math
+import threading
+import numpy as np
+
+
+class RingBuffer():
+    '''
+    Fixed-size history of samples of a single resource (GPU or CPU), one row per sample.
+    Timestamps and values are kept in preallocated NumPy arrays, so memory usage does not grow
+    and appending a sample costs O(1). Missing values (e.g. [Not Supported]) are stored as NaN.
+    Metrics are added as columns when they first appear, which is the only time arrays are reallocated.
+
+    Memory usage: capacity * 8 * (1 + number of metrics) bytes, e.g. 3600 samples (1 hour at the default
+    busy_update_interval of 1s, see TensorHiveManager.metric_history_capacity) of 8 GPU metrics take about 250 KiB.
+    Capacity is a number of samples, so resources updated less often keep a longer period of history.
+    '''
+
+    def __init__(self, capacity: int) -> None:
+        assert capacity > 0, 'Capacity must be positive'
+        self.metrics = []  # type: List[str]
+        self.units = []  # type: List[Optional[str]]
+        # Whether all values of a metric have been integers so far (so they are served as such)
+        self.integral = []  # type: List[bool]
+        self.positions = {}  # type: Dict[str, int]
+        self.capacity = capacity
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._values = np.full((capacity, 0), np.nan, dtype=np.float64)
+        # Position of the next sample and number of stored samples
+        self._next = 0
+        self._size = 0
+
+    def add_metric(self, name: str, unit: Optional[str]) -> None:
+        '''Adds a column of the metric, its values in samples stored so far are missing'''
+        self.positions[name] = len(self.metrics)
+        self.metrics.append(name)
+        self.units.append(unit)
+        self.integral.append(True)
+        self._values = np.hstack([self._values, np.full((self.capacity, 1), np.nan, dtype=np.float64)])
+
+    def clear_next(self) -> None:
+        '''Marks all values of the next sample as missing, before they are written into its row'''
+        self._values[self._next].fill(np.nan)
+
+    def advance(self, timestamp: float) -> None:
+        '''Stores the sample written into the next row'''
+        self._timestamps[self._next] = timestamp
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def window(self, since: Optional[float] = None, until: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        '''Samples from given time window in chronological order, as (timestamps, values) copies'''
+        order = np.arange(self._next - self._size, self._next) % self.capacity
+        timestamps = self._timestamps[order]
+        selected = np.ones(len(order), dtype=bool)
+        if since is not None:
+            selected &= timestamps >= since
+        if until is not None:
+            selected &= timestamps <= until
+        return timestamps[selected], self._values[order[selected]]
+
+
+class MetricHistory():
+    '''Ring buffers of recent metrics, keyed by resource UUID'''
+
+    def __init__(self, capacity: int) -> None:
+        # 0 disables history
+        self.capacity = capacity
+        self._buffers = {}  # type: Dict[str, RingBuffer]
+        # Appending and reading happen in different threads (services vs API)
+        self._lock = threading.Lock()
+
+    def append(self, uuid: str, metrics: Mapping, timestamp: float) -> None:
+        '''
+        Stores numeric metrics of a single resource (Metrics or a dict in the same format), e.g.
+        {'utilization': {'value': 45, 'unit': '%'}, 'temp': 50, 'power': {'value': 80.5, 'unit': 'W'}}
+
+        Every metric present in the sample gets a column, even if its value is missing (stored as NaN).
+        Metrics which appear later (e.g. CPU utilization, known from the second sample) are added then.
+        '''
+        if not self.capacity:
+            return
+        with self._lock:
+            buffer = self._buffers.get(uuid)
+            if buffer is None:
+                buffer = self._buffers[uuid] = RingBuffer(self.capacity)
+            buffer.clear_next()
+            for name in metrics:
+                value, unit = metric_item(metrics, name)
+                position = buffer.positions.get(name)
+                if position is None:
+                    buffer.add_metric(name, unit)
+                    position = buffer.positions[name]
+                elif unit is not None:
+                    buffer.units[position] = unit
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    # Written in place, arrays are reallocated only by `add_metric` above
+                    buffer._values[buffer._next, position] = value
+                    if isinstance(value, float):
+                        buffer.integral[position] = False
+            buffer.advance(timestamp)
+
+    def window(self, uuid: str, since: Optional[float] = None, until: Optional[float] = None,
+               metric_type: Optional[str] = None) -> Optional[Dict]:
+        '''
+        Columnar history of a single resource, None if nothing was recorded.
+        Missing values are null.
+
+        Example result:
+        {
+            "timestamps": [1577836800.0, 1577836805.0],
+            "metrics": {
+                "utilization": {"values": [45, null], "unit": "%"},
+                "temp": {"values": [50, 51], "unit": null}
+            }
+        }
+        '''
+        with self._lock:
+            buffer = self._buffers.get(uuid)
+            if buffer is None:
+                return None
+            timestamps, values = buffer.window(since, until)
+            # Columns may be added by `append` as soon as the lock is released
+            columns = list(zip(buffer.metrics, buffer.units, buffer.integral))
+
+        metrics = {}
+        for position, (name, unit, integral) in enumerate(columns):
+            if metric_type is not None and name != metric_type:
+                continue
+            column = values[:, position]
+            metrics[name] = {
+                'values': [None if math.isnan(value) else int(value) if integral else value
+                           for value in column.tolist()],
+                'unit': unit
+            }
+        return {'timestamps': timestamps.tolist(), 'metrics': metrics}
+
+    def forget(self, uuid: str) -> None:
+        with self._lock:
+            self._buffers.pop(uuid, None)
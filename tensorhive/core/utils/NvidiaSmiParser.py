@@ -1,12 +1,22 @@
-from typing import Generator, Dict, List
+from tensorhive.core.utils.records import Metrics, MetricSchema
+from typing import Any, Callable, Generator, Dict, List, NamedTuple, Optional, Tuple
 import re
 import logging
 log = logging.getLogger(__name__)
 
+# How a single column of `nvidia-smi --query-gpu` output is parsed
+Column = NamedTuple('Column', [('key', str), ('unit', Optional[str]), ('convert', Callable[[str], Any])])
+
+# Regex that matches: [W], [%], [MiB], etc. at the end of string
+_unit_regex = re.compile(r'\[(.*)\]$')
+_pmon_uuid_regex = re.compile('^UUID=(.*)$')
+
 
 class NvidiaSmiParser():
     '''Responsible for parsing output from commands executed by pssh'''
     include_units = True
+    owners_block_separator = '[OWNERS]'
+    compute_apps_block_header = '[COMPUTE APPS]'
     key_mapping = {
         # keys: original nvidia-smi parameter names
         # values: simpler and shorter form
@@ -23,6 +33,13 @@ class NvidiaSmiParser():
         'power.draw [W]': 'power'
     }
 
+    # Columns which hold text, all other columns are converted to numbers
+    text_keys = {'uuid', 'name'}
+    # Placeholders printed by nvidia-smi instead of unavailable values
+    missing_values = {'[Not Supported]', '[N/A]', 'N/A', '[Unknown Error]', '[GPU is lost]'}
+    # Compiled column plans, keyed by (header, include_units), see `column_plan`
+    _column_plans = {}  # type: Dict[Tuple[str, bool], List[Column]]
+
     @classmethod
     def make_dict(cls, keys: List[str], values: List[str]) -> Dict:
         '''
@@ -51,42 +68,69 @@ class NvidiaSmiParser():
         }
         '''
         assert len(keys) == len(values), 'List sizes does not match.'
-        values = cls._format_values(values)
+        return cls._parse_row(cls.column_plan(', '.join(keys)), values)
 
-        # Regex that matches: [W], [%], [MiB], etc. at the end of string
-        unit_regex = re.compile(r'\[(.*)\]$')
-        result = {}
+    @classmethod
+    def column_plan(cls, header: str) -> List[Column]:
+        '''
+        Compiles how each column of `nvidia-smi --query-gpu=... --format=csv,nounits` output is parsed:
+        short key name, unit (None when units are disabled or there is no unit) and value converter.
+        Header of a query does not change between cycles, so the plan is compiled only once.
 
-        for (long_key_name, value) in zip(keys, values):
-            short_key_name = cls._shorter_key_name(long_key_name)
-            # Tries to find the unit inside original key name
-            unit_found = unit_regex.search(long_key_name)
+        Example header:
+        'uuid, fan.speed [%], power.draw [W]'
 
-            if unit_found and cls.include_units is True:
+        Example result:
+        [Column(key='uuid', unit=None, convert=str),
+         Column(key='fan_speed', unit='%', convert=format_value),
+         Column(key='power', unit='W', convert=format_value)]
+        '''
+        cache_key = (header, cls.include_units)
+        plan = cls._column_plans.get(cache_key)
+        if plan is None:
+            plan = []
+            for long_key_name in header.split(', '):
+                short_key_name = cls._shorter_key_name(long_key_name)
                 # Matches % from [%], etc.
-                unit = unit_found.group(1)
-                result[short_key_name] = {'value': value, 'unit': unit}
+                unit_found = _unit_regex.search(long_key_name)
+                unit = unit_found.group(1) if unit_found and cls.include_units else None
+                convert = str if short_key_name in cls.text_keys else cls.format_value
+                plan.append(Column(short_key_name, unit, convert))
+            cls._column_plans[cache_key] = plan
+        return plan
+
+    @staticmethod
+    def _parse_row(plan: List[Column], values: List[str]) -> Dict:
+        result = {}  # type: Dict
+        for column, value in zip(plan, values):
+            if column.unit is None:
+                result[column.key] = column.convert(value)
             else:
-                # If there's no unit provided, just assign the value
-                result[short_key_name] = value  # type: ignore
+                result[column.key] = {'value': column.convert(value), 'unit': column.unit}
         return result
 
+    @classmethod
+    def format_value(cls, value: str):
+        '''
+        Casts a single value printed by nvidia-smi to int or float when possible,
+        placeholders like [Not Supported] or [N/A] become None, other text is returned as is.
+        '''
+        if value.isdecimal():
+            return int(value)
+        if value in cls.missing_values:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
     @classmethod
     def _format_values(cls, values: List[str]) -> List:
         '''
         Replaces string values returned by `nvidia-smi --query-gpu=...`
         Main goal is to handle [Not Supported] and when possible, cast str to int/float
         '''
-        def formatted_value(value):
-            if value == '[Not Supported]':
-                return None
-            # TODO May want to handle floats also (currently they remain as strings)
-            elif str.isdecimal(value):
-                return int(value)
-            else:
-                return value
-
-        return [formatted_value(v) for v in values]
+        return [cls.format_value(value) for value in values]
 
     @classmethod
     def _shorter_key_name(cls, original_key: str):
@@ -115,37 +159,88 @@ class NvidiaSmiParser():
             }
         }
         '''
-        stdout_lines = list(stdout)  # type: List[str]
-        assert stdout_lines, 'stdout is empty!'
-        assert len(stdout_lines) > 1, 'stdout query result contains header only!'
+        result = {}  # type:Dict[str, Dict]
+        for uuid, query_results_for_single_gpu in cls._parse_query_gpu_rows(stdout).items():
+            # Separate some keys that are not metrics
+            result[uuid] = {}
+            result[uuid]['name'] = query_results_for_single_gpu.pop('name')
+            result[uuid]['index'] = query_results_for_single_gpu.pop('index')
+            result[uuid]['metrics'] = query_results_for_single_gpu
+        return result
 
-        # Extract keys from nvidia-smi query result header
-        header = stdout_lines[0]  # type: str
-        gpu_parameters_keys = header.split(', ')  # type: List[str]
+    @classmethod
+    def parse_gpu_inventory_stdout(cls, stdout: Generator) -> Dict[str, Metrics]:
+        '''
+        Parses query for static GPU properties, which change only when hardware is swapped.
 
-        # Extract stdout lines, where:  1 line = 1 GPU
-        all_gpus_stdout_lines = stdout_lines[1:]  # type: List[str]
+        Example stdout:
+        $ nvidia-smi --query-gpu=uuid,name,index,memory.total --format=csv,nounits
+        uuid, name, index, memory.total [MiB]
+        GPU-d38d4de3-85ee-e837-3d87-e8e2faeb6a63, GeForce GTX 660, 0, 1993
 
-        result = {}  # type:Dict[str, Dict]
+        Example result (Metrics rendered as dicts):
+        {
+            "GPU-d38d4de3-85ee-e837-3d87-e8e2faeb6a63": {
+                "name": "GeForce GTX 660",
+                "index": 0,
+                "mem_total": {'value': 1993, 'unit': 'MiB'}
+            }
+        }
+        '''
+        return cls._parse_query_gpu_rows(stdout)
 
-        # Transform each line (corresponding to a single GPU) and append to the accumulator
-        for single_gpu_result_line in all_gpus_stdout_lines:
-            # Split by commas
-            gpu_parameters_values = single_gpu_result_line.split(', ')  # type: List[str]
-            query_results_for_single_gpu = cls.make_dict(
-                gpu_parameters_keys, gpu_parameters_values)
+    @classmethod
+    def parse_gpu_metrics_stdout(cls, stdout: Generator) -> Dict[str, Metrics]:
+        '''
+        Parses query for dynamic GPU metrics, keyed by UUID.
 
-            # Separate some keys that are not metrics
-            uuid = query_results_for_single_gpu.pop('uuid')  # type: str
-            name = query_results_for_single_gpu.pop('name')
-            index = query_results_for_single_gpu.pop('index')
+        Example stdout:
+        $ nvidia-smi --query-gpu=uuid,fan.speed,utilization.gpu --format=csv,nounits
+        uuid, fan.speed [%], utilization.gpu [%]
+        GPU-d38d4de3-85ee-e837-3d87-e8e2faeb6a63, 35, [Not Supported]
 
-            result[uuid] = {}
-            result[uuid]['name'] = name
-            result[uuid]['index'] = index
-            result[uuid]['metrics'] = query_results_for_single_gpu
+        Example result (Metrics rendered as dicts):
+        {
+            "GPU-d38d4de3-85ee-e837-3d87-e8e2faeb6a63": {
+                "fan_speed": {'value': 35, 'unit': '%'},
+                "utilization": {'value': null, 'unit': '%'}
+            }
+        }
+        '''
+        return cls._parse_query_gpu_rows(stdout)
 
-        return result
+    @classmethod
+    def _parse_query_gpu_rows(cls, stdout: Generator) -> Dict[str, Metrics]:
+        '''
+        Transforms each line of `nvidia-smi --query-gpu=uuid,...` (1 line = 1 GPU) into Metrics keyed by UUID.
+        Values are kept in flat lists, all rows share a single schema with names and units of the columns.
+        '''
+        stdout_lines = list(stdout)  # type: List[str]
+        assert stdout_lines, 'stdout is empty!'
+        assert len(stdout_lines) > 1, 'stdout query result contains header only!'
+
+        # Columns are described by nvidia-smi query result header
+        plan = cls.column_plan(stdout_lines[0])
+        rows = [line.split(', ') for line in stdout_lines[1:]]
+        for row in rows:
+            assert len(row) == len(plan), 'List sizes does not match.'
+
+        # Each column is converted at once, then columns are zipped back into rows keyed by UUID
+        uuids = []  # type: List[str]
+        keys = []  # type: List[str]
+        units = []  # type: List[Optional[str]]
+        columns = []  # type: List[List]
+        for column, values in zip(plan, zip(*rows)):
+            converted = list(map(column.convert, values))
+            if column.key == 'uuid':
+                uuids = converted
+            else:
+                keys.append(column.key)
+                units.append(column.unit)
+                columns.append(converted)
+        assert uuids, 'uuid column is missing!'
+        schema = MetricSchema.get(tuple(keys), tuple(units))
+        return {uuid: Metrics(schema, list(values)) for uuid, values in zip(uuids, zip(*columns))}
 
     @classmethod
     def parse_pmon_stdout(cls, stdout: Generator) -> List[Dict]:
@@ -191,10 +286,9 @@ class NvidiaSmiParser():
         # Parse whole stdout and split it into chunks.
         # Each chunk is transformed into a dictionary.
         # key=UUID, value=pmon's stdout lines corresponding GPU witch such UUID
-        uuid_regex = re.compile('^UUID=(.*)$')
         stdout_of_all_gpus = {}  # type: Dict
         for line in list(stdout_lines):
-            uuid_match = uuid_regex.match(line)
+            uuid_match = _pmon_uuid_regex.match(line)
             if uuid_match:
                 uuid = uuid_match.group(1)
                 # Initialize with default value
@@ -243,3 +337,67 @@ class NvidiaSmiParser():
                 processes.append(process)
 
         return processes
+
+    @classmethod
+    def parse_compute_apps_stdout(cls, stdout: Generator) -> List[Dict]:
+        '''
+        Example of expected stdout
+        (`nvidia-smi --query-compute-apps=gpu_uuid,pid,used_memory,process_name --format=csv,noheader,nounits`):
+            GPU-c6d01ed6-8240-2e11-efe9-1111111111111, 1234, 1178, python
+            GPU-c6d01ed6-8240-2e11-efe9-2222222222222, 4567, [Not Supported], /usr/bin/python3
+
+        Example result:
+        [
+            {
+                'uuid': '<UUID>',
+                'pid': 1234,
+                'command': 'python',
+                'mem_used': {'value': 1178, 'unit': 'MiB'}
+            },
+            ...
+        ]
+        '''
+        processes = []
+        for line in stdout:
+            if not line.strip():
+                # Empty output means no processes
+                continue
+            # Process name is the last column, so it may contain separators itself
+            uuid, pid, used_memory, command = cls._format_values(line.split(', ', 3))
+            processes.append({
+                'uuid': uuid,
+                'pid': pid,
+                'command': command,
+                'mem_used': {'value': used_memory if isinstance(used_memory, int) else None, 'unit': 'MiB'}
+            })
+        return processes
+
+    @classmethod
+    def split_owners_block(cls, stdout: Generator) -> Tuple[List[str], List[str]]:
+        '''
+        Separates output of nvidia-smi pmon from the process owners block appended after [OWNERS] line.
+        Returns (pmon_lines, owner_lines)
+        '''
+        stdout_lines = list(stdout)
+        try:
+            separator_index = stdout_lines.index(cls.owners_block_separator)
+        except ValueError:
+            return stdout_lines, []
+        return stdout_lines[:separator_index], stdout_lines[separator_index + 1:]
+
+    @classmethod
+    def parse_ps_owners_stdout(cls, stdout: Generator) -> Dict[int, str]:
+        '''
+        Example of expected stdout (`ps --no-headers -o pid=,user= -p 1979,1234`):
+             1979 root
+             1234 foo
+
+        Example result:
+        {1979: 'root', 1234: 'foo'}
+        '''
+        owners = {}
+        for line in stdout:
+            columns = line.split()
+            if len(columns) == 2 and columns[0].isdecimal():
+                owners[int(columns[0])] = columns[1]
+        return owners
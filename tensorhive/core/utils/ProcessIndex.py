@@ -0,0 +1,73 @@
+from tensorhive.core.utils.records import metric_value
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# A process running on a single GPU (a process using several GPUs has an entry for each of them)
+ProcessEntry = NamedTuple('ProcessEntry', [('hostname', str), ('pid', int), ('uuid', str), ('owner', Optional[str]),
+                                           ('command', str), ('mem_used', Optional[int])])
+
+
+class ProcessIndex():
+    '''
+    Flat, read-only index of GPU processes of the whole infrastructure (usually of a published snapshot),
+    so that services answer questions like "is this pid running on its GPU" or "who else uses this GPU"
+    with dict lookups instead of walking nodes and process lists every time.
+
+    GPUs without any (or without listed) processes have empty lists, processes with ignored commands
+    (e.g. Xorg, see InfrastructureManager.ignored_processes) are skipped.
+    '''
+
+    def __init__(self, nodes: Dict[str, Dict], version: int = 0, ignored_commands: Iterable[str] = ()) -> None:
+        # Version of the snapshot the index was built from
+        self.version = version
+        ignored_commands = set(ignored_commands)
+        self._by_host = {}  # type: Dict[str, Dict[str, List[ProcessEntry]]]
+        self._by_gpu = {}  # type: Dict[str, List[ProcessEntry]]
+        self._by_pid = {}  # type: Dict[Tuple[str, int], List[ProcessEntry]]
+        self._by_owner = {}  # type: Dict[Optional[str], List[ProcessEntry]]
+
+        for hostname, node in nodes.items():
+            gpus = node.get('GPU')
+            if gpus is None:
+                # No GPU data, e.g. node is unreachable or nvidia-smi failed
+                continue
+            host_gpus = self._by_host[hostname] = {}
+            for uuid, gpu in gpus.items():
+                entries = host_gpus[uuid] = self._by_gpu[uuid] = []
+                for process in gpu.get('processes') or []:
+                    if process['command'] in ignored_commands:
+                        continue
+                    entry = ProcessEntry(hostname, process['pid'], uuid, process.get('owner'), process['command'],
+                                         metric_value(process, 'mem_used'))
+                    entries.append(entry)
+                    self._by_pid.setdefault((hostname, entry.pid), []).append(entry)
+                    self._by_owner.setdefault(entry.owner, []).append(entry)
+
+    @property
+    def hostnames(self) -> List[str]:
+        '''Nodes with GPU data'''
+        return list(self._by_host)
+
+    def gpus(self, hostname: str) -> Dict[str, List[ProcessEntry]]:
+        '''Processes of each GPU of given node, keyed by UUID (empty if there is no GPU data)'''
+        return self._by_host.get(hostname, {})
+
+    def on_host(self, hostname: str) -> List[ProcessEntry]:
+        return [entry for entries in self.gpus(hostname).values() for entry in entries]
+
+    def on_gpu(self, uuid: str) -> List[ProcessEntry]:
+        return self._by_gpu.get(uuid, [])
+
+    def owned_by(self, owner: str) -> List[ProcessEntry]:
+        return self._by_owner.get(owner, [])
+
+    def get(self, hostname: str, pid: int) -> List[ProcessEntry]:
+        '''Entries of a single process, one for each GPU it uses (empty if it does not use any)'''
+        return self._by_pid.get((hostname, pid), [])
+
+    def is_running(self, hostname: str, pid: int, uuid: Optional[str] = None) -> bool:
+        '''Whether the process uses any GPU of the node, or given GPU only'''
+        return any(uuid is None or entry.uuid == uuid for entry in self.get(hostname, pid))
+
+    def others_on_gpu(self, uuid: str, pid: int) -> List[ProcessEntry]:
+        '''Processes other than given one, which use the same GPU'''
+        return [entry for entry in self.on_gpu(uuid) if entry.pid != pid]
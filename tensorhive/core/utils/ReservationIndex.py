@@ -0,0 +1,201 @@
+from tensorhive.core.utils.Singleton import Singleton
+from tensorhive.database import db_session
+from tensorhive.models.Reservation import Reservation
+from sqlalchemy import event
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+import bisect
+import itertools
+import threading
+
+# Copy of a reservation (with its owner's data), safe to use in any thread without touching the database
+ReservationEntry = NamedTuple('ReservationEntry', [('id', int), ('resource_id', str), ('user_id', int),
+                                                   ('username', Optional[str]), ('email', Optional[str]),
+                                                   ('start', datetime), ('end', datetime)])
+
+# Reservations of a single resource sorted by start, along with their start times (for bisection)
+Timeline = Tuple[Tuple[datetime, ...], Tuple[ReservationEntry, ...]]
+
+
+class ReservationIndex(metaclass=Singleton):
+    '''
+    Reservations which have not ended yet (cancelled ones are skipped), kept in memory for each resource
+    as intervals sorted by start, so that services check them every cycle without querying the database.
+    Non-cancelled reservations of a resource never overlap (see Reservation.would_interfere).
+
+    Reservations are loaded on first use. Afterwards, only those which have been added, modified or deleted
+    in committed transactions are loaded again (before the next lookup). Changes of users (e.g. of username,
+    or deleted users with all their reservations) reload the whole index. Reservations are read in a separate,
+    short-lived session, so objects held by the calling thread's session (possibly outdated) are never reused.
+    Reservations which have ended are dropped.
+    '''
+
+    def __init__(self) -> None:
+        self._timelines = {}  # type: Dict[str, Timeline]
+        # Resource of each indexed reservation
+        self._resources = {}  # type: Dict[int, str]
+        self._loaded = False
+        # IDs of reservations changed since the last lookup
+        self._changed_ids = set()  # type: Set[int]
+        self._lock = threading.Lock()
+        event.listen(db_session, 'after_flush', self._after_flush)
+        event.listen(db_session, 'after_commit', self._after_commit)
+        event.listen(db_session, 'after_soft_rollback', self._after_soft_rollback)
+
+    def invalidate(self) -> None:
+        '''Makes the next lookup load all reservations again'''
+        with self._lock:
+            self._loaded = False
+
+    def _after_flush(self, session, flush_context) -> None:
+        # Changes are applied only when committed, there is no SQL to query for them before
+        changes = session.info.setdefault('reservation_index_changes', set())
+        for instance in itertools.chain(session.new, session.dirty, session.deleted):
+            if isinstance(instance, Reservation):
+                changes.add(instance.id)
+            elif getattr(instance, '__tablename__', None) == 'users':
+                changes.add(None)
+
+    def _after_commit(self, session) -> None:
+        changes = session.info.pop('reservation_index_changes', None)
+        if not changes:
+            return
+        with self._lock:
+            if None in changes:
+                self._loaded = False
+            self._changed_ids.update(reservation_id for reservation_id in changes if reservation_id is not None)
+
+    def _after_soft_rollback(self, session, previous_transaction) -> None:
+        session.info.pop('reservation_index_changes', None)
+
+    @staticmethod
+    def _entry(reservation: Reservation) -> ReservationEntry:
+        user = reservation.user
+        return ReservationEntry(reservation.id, reservation.resource_id, reservation.user_id,
+                                user.username if user is not None else None, user.email if user is not None else None,
+                                reservation.start, reservation.end)
+
+    def _refresh(self) -> None:
+        '''Brings the index up to date, queries the database only if something has changed'''
+        if self._loaded and not self._changed_ids:
+            return
+        with self._lock:
+            session = db_session.session_factory()
+            try:
+                self._load(session)
+            finally:
+                session.close()
+            self._changed_ids = set()
+
+    def _load(self, session) -> None:
+        '''Loads all reservations (if not loaded yet) or the changed ones, within given session'''
+        if not self._loaded:
+            reservations = session.query(Reservation).filter(Reservation.end >= datetime.utcnow()).all()
+            entries = sorted((self._entry(reservation) for reservation in reservations
+                              if not reservation.is_cancelled), key=lambda entry: entry.start)
+            timelines = {}  # type: Dict[str, Timeline]
+            for resource_id, group in itertools.groupby(sorted(entries, key=lambda entry: entry.resource_id),
+                                                        key=lambda entry: entry.resource_id):
+                group_entries = tuple(group)
+                timelines[resource_id] = (tuple(entry.start for entry in group_entries), group_entries)
+            self._resources = {entry.id: entry.resource_id for entry in entries}
+            self._timelines = timelines
+            self._loaded = True
+        elif self._changed_ids:
+            changed_ids = self._changed_ids
+            reservations = session.query(Reservation).filter(Reservation.id.in_(changed_ids)).all()
+            # Deleted reservations are not found, so they are only removed
+            changed_resources = {}  # type: Dict[str, List[ReservationEntry]]
+            for reservation_id in changed_ids:
+                resource_id = self._resources.get(reservation_id)
+                if resource_id is not None:
+                    changed_resources[resource_id] = [entry for entry in self._timelines[resource_id][1]
+                                                      if entry.id not in changed_ids]
+            for reservation in reservations:
+                resource_id = reservation.resource_id
+                if resource_id not in changed_resources:
+                    changed_resources[resource_id] = [entry for entry in self.timeline(resource_id)[1]
+                                                      if entry.id not in changed_ids]
+                if not reservation.is_cancelled:
+                    changed_resources[resource_id].append(self._entry(reservation))
+            for resource_id, entries in changed_resources.items():
+                self._set_timeline(resource_id, entries)
+
+    def _set_timeline(self, resource_id: str, entries: List[ReservationEntry]) -> None:
+        # Timelines are replaced (never modified), so lookups need no lock
+        for entry in self._timelines.get(resource_id, ((), ()))[1]:
+            self._resources.pop(entry.id, None)
+        now = datetime.utcnow()
+        entries = sorted((entry for entry in entries if entry.end >= now), key=lambda entry: entry.start)
+        if entries:
+            self._timelines[resource_id] = (tuple(entry.start for entry in entries), tuple(entries))
+        else:
+            self._timelines.pop(resource_id, None)
+        for entry in entries:
+            self._resources[entry.id] = resource_id
+
+    def timeline(self, resource_id: str) -> Timeline:
+        return self._timelines.get(resource_id, ((), ()))
+
+    def _active(self, resource_id: str, time: datetime) -> Optional[ReservationEntry]:
+        starts, entries = self.timeline(resource_id)
+        position = bisect.bisect_right(starts, time) - 1
+        if position >= 0 and time <= entries[position].end:
+            return entries[position]
+        return None
+
+    def active(self, resource_id: str, time: Optional[datetime] = None) -> Optional[ReservationEntry]:
+        '''Reservation of the resource which lasts at given time (now by default)'''
+        self._refresh()
+        return self._active(resource_id, time or datetime.utcnow())
+
+    def next(self, resource_id: str, time: Optional[datetime] = None) -> Optional[ReservationEntry]:
+        '''The first reservation of the resource which starts after given time (now by default)'''
+        self._refresh()
+        starts, entries = self.timeline(resource_id)
+        position = bisect.bisect_right(starts, time or datetime.utcnow())
+        return entries[position] if position < len(entries) else None
+
+    def upcoming(self, resource_id: str, period_after: timedelta,
+                 time: Optional[datetime] = None) -> List[ReservationEntry]:
+        '''
+        Reservations of the resource which last at given time (now by default) or start within `period_after`,
+        sorted by start (same as Reservation.upcoming_events_for_resource)
+        '''
+        self._refresh()
+        time = time or datetime.utcnow()
+        starts, entries = self.timeline(resource_id)
+        first = bisect.bisect_right(starts, time)
+        if first > 0 and time < entries[first - 1].end:
+            first -= 1
+        return list(entries[first:bisect.bisect_right(starts, time + period_after)])
+
+    def _prune(self) -> None:
+        '''Drops reservations which have ended'''
+        now = datetime.utcnow()
+        # Reservations of a resource do not overlap, so ended ones are always the first
+        ended = [resource_id for resource_id, (_, entries) in list(self._timelines.items()) if entries[0].end < now]
+        if ended:
+            with self._lock:
+                for resource_id in ended:
+                    self._set_timeline(resource_id, list(self.timeline(resource_id)[1]))
+
+    def current(self, time: Optional[datetime] = None) -> List[ReservationEntry]:
+        '''Reservations of all resources which last at given time (now by default)'''
+        self._refresh()
+        # Called by services every cycle, so it takes care of dropping ended reservations
+        self._prune()
+        time = time or datetime.utcnow()
+        entries = (self._active(resource_id, time) for resource_id in list(self._timelines))
+        return [entry for entry in entries if entry is not None]
+
+    def get(self, reservation_id: int) -> Optional[ReservationEntry]:
+        '''Indexed reservation with given ID, None if it has ended (before the index was loaded) or is cancelled'''
+        self._refresh()
+        resource_id = self._resources.get(reservation_id)
+        if resource_id is None:
+            return None
+        for entry in self.timeline(resource_id)[1]:
+            if entry.id == reservation_id:
+                return entry
+        return None
@@ -0,0 +1,343 @@
+from collections.abc import ItemsView, KeysView, Mapping, MutableMapping, ValuesView
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import threading
+
+
+class MetricSchema():
+    '''
+    Names and units of metrics, shared by all records which hold the same metrics.
+    Schemas are interned (see `get`), so a unit is stored once for all GPUs and cycles, not in every value.
+    '''
+    __slots__ = ('names', 'units', 'positions', '_extensions')
+    _interned = {}  # type: Dict[Tuple[Tuple[str, ...], Tuple[Optional[str], ...]], MetricSchema]
+    _intern_lock = threading.Lock()
+
+    def __init__(self, names: Tuple[str, ...], units: Tuple[Optional[str], ...]) -> None:
+        assert len(names) == len(units), 'List sizes does not match.'
+        self.names = names
+        self.units = units
+        self.positions = {name: position for position, name in enumerate(names)}
+        # Schemas returned by `with_metric`, keyed by (name, unit)
+        self._extensions = {}  # type: Dict[Tuple[str, Optional[str]], MetricSchema]
+
+    @classmethod
+    def get(cls, names: Tuple[str, ...], units: Tuple[Optional[str], ...]) -> 'MetricSchema':
+        key = (tuple(names), tuple(units))
+        schema = cls._interned.get(key)
+        if schema is None:
+            with cls._intern_lock:
+                schema = cls._interned.setdefault(key, cls(*key))
+        return schema
+
+    def with_metric(self, name: str, unit: Optional[str]) -> 'MetricSchema':
+        '''Schema extended with given metric (or with its unit replaced)'''
+        schema = self._extensions.get((name, unit))
+        if schema is None:
+            position = self.positions.get(name)
+            if position is None:
+                schema = self.get(self.names + (name,), self.units + (unit,))
+            else:
+                schema = self.get(self.names, self.units[:position] + (unit,) + self.units[position + 1:])
+            self._extensions[(name, unit)] = schema
+        return schema
+
+    def starts_with(self, other: 'MetricSchema') -> bool:
+        '''Whether metrics of the other schema are the first metrics of this one (e.g. it was extended)'''
+        size = len(other.names)
+        return self.names[:size] == other.names and self.units[:size] == other.units
+
+    def without_metric(self, name: str) -> 'MetricSchema':
+        position = self.positions[name]
+        return self.get(self.names[:position] + self.names[position + 1:],
+                        self.units[:position] + self.units[position + 1:])
+
+    def __repr__(self) -> str:
+        return 'MetricSchema({})'.format(', '.join('{} [{}]'.format(name, unit) if unit else name
+                                                   for name, unit in zip(self.names, self.units)))
+
+
+def _split(metric) -> Tuple[Any, Optional[str]]:
+    # Metric given in the rendered form, e.g. {'value': 45, 'unit': '%'} or 50
+    if isinstance(metric, dict):
+        return metric.get('value'), metric.get('unit')
+    return metric, None
+
+
+def _render(value, unit: Optional[str]):
+    return value if unit is None else {'value': value, 'unit': unit}
+
+
+class Metrics():
+    '''
+    Metrics of a single resource: a flat list of values and a shared schema.
+    As a mapping, it behaves like the dict used previously, i.e. metrics with a unit are rendered as
+    {'value': 45, 'unit': '%'} and metrics without one (e.g. temp) as plain values.
+
+    Example:
+    Metrics(MetricSchema.get(('utilization', 'temp'), ('%', None)), [45, 50])
+    renders as {'utilization': {'value': 45, 'unit': '%'}, 'temp': 50}
+    '''
+    __slots__ = ('schema', '_values')
+
+    def __init__(self, schema: Optional[MetricSchema] = None, values: Optional[List] = None) -> None:
+        self.schema = schema if schema is not None else MetricSchema.get((), ())
+        self._values = values if values is not None else []  # type: List
+
+    def item(self, name: str) -> Tuple[Any, Optional[str]]:
+        '''(value, unit) of given metric, raises KeyError'''
+        position = self.schema.positions[name]
+        return self._values[position], self.schema.units[position]
+
+    def set(self, name: str, value, unit: Optional[str] = None) -> None:
+        position = self.schema.positions.get(name)
+        if position is None or self.schema.units[position] != unit:
+            self.schema = self.schema.with_metric(name, unit)
+            position = self.schema.positions[name]
+            if position == len(self._values):
+                self._values.append(value)
+                return
+        self._values[position] = value
+
+    def __getitem__(self, name: str):
+        return _render(*self.item(name))
+
+    def __setitem__(self, name: str, metric) -> None:
+        self.set(name, *_split(metric))
+
+    def __delitem__(self, name: str) -> None:
+        position = self.schema.positions[name]
+        self.schema = self.schema.without_metric(name)
+        del self._values[position]
+
+    def __contains__(self, name) -> bool:
+        return name in self.schema.positions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.schema.names)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Metrics):
+            if self.schema is other.schema:
+                return self._values == other._values
+            return self.as_dict() == other.as_dict()
+        if isinstance(other, Mapping):
+            return self.as_dict() == render(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def get(self, name: str, default=None):
+        return self[name] if name in self.schema.positions else default
+
+    def keys(self) -> KeysView:
+        return KeysView(self)
+
+    def items(self) -> ItemsView:
+        return ItemsView(self)
+
+    def values(self) -> ValuesView:
+        return ValuesView(self)
+
+    def pop(self, name: str, *default):
+        if name not in self.schema.positions and default:
+            return default[0]
+        metric = self[name]
+        del self[name]
+        return metric
+
+    def update(self, other=(), **kwargs) -> None:
+        if isinstance(other, Metrics):
+            if other.schema is self.schema or self.schema.starts_with(other.schema):
+                # Usually values of the same metrics are updated every cycle, so they replace the old ones at once
+                self._values[:len(other._values)] = other._values
+                return
+            for name, value, unit in zip(other.schema.names, other._values, other.schema.units):
+                self.set(name, value, unit)
+            return
+        for name, metric in dict(other, **kwargs).items():
+            self[name] = metric
+
+    def copy(self) -> 'Metrics':
+        return Metrics(self.schema, list(self._values))
+
+    @classmethod
+    def from_dict(cls, metrics: Mapping) -> 'Metrics':
+        '''Inverse of `as_dict`, metrics in the same order get the same (interned) schema'''
+        names, units, values = [], [], []
+        for name, metric in metrics.items():
+            value, unit = _split(metric)
+            names.append(name)
+            units.append(unit)
+            values.append(value)
+        return cls(MetricSchema.get(tuple(names), tuple(units)), values)
+
+    def as_dict(self) -> Dict[str, Any]:
+        schema = self.schema
+        return {name: _render(value, unit) for name, value, unit in zip(schema.names, self._values, schema.units)}
+
+    def __repr__(self) -> str:
+        return 'Metrics({})'.format(self.as_dict())
+
+
+def metric_item(metrics: Mapping, name: str) -> Tuple[Any, Optional[str]]:
+    '''(value, unit) of a metric kept either in Metrics or in a dict, (None, None) if it is missing'''
+    if isinstance(metrics, Metrics):
+        position = metrics.schema.positions.get(name)
+        if position is None:
+            return None, None
+        return metrics._values[position], metrics.schema.units[position]
+    return _split(metrics.get(name))
+
+
+def metric_value(metrics: Mapping, name: str):
+    return metric_item(metrics, name)[0]
+
+
+class Record():
+    '''
+    Base for fixed-field records of the infrastructure, fields are declared with `__slots__`.
+    Records can be read (and fields assigned) like the dicts used previously, values of fields listed
+    in `units` are rendered as {'value': ..., 'unit': ...}.
+    '''
+    __slots__ = ()
+    units = {}  # type: Dict[str, str]
+
+    def __getitem__(self, field: str):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        return _render(getattr(self, field), self.units.get(field))
+
+    def __setitem__(self, field: str, value) -> None:
+        if field not in self.__slots__:
+            raise KeyError(field)
+        if field in self.units:
+            value = _split(value)[0]
+        setattr(self, field, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __contains__(self, field) -> bool:
+        return field in self.__slots__
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Mapping):
+            return self.as_dict() == render(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def get(self, field: str, default=None):
+        return self[field] if field in self.__slots__ else default
+
+    def keys(self) -> KeysView:
+        return KeysView(self)
+
+    def items(self) -> ItemsView:
+        return ItemsView(self)
+
+    def values(self) -> ValuesView:
+        return ValuesView(self)
+
+    def copy(self) -> 'Record':
+        '''Copies containers which monitors modify in place (metrics and lists), other values are shared'''
+        record = object.__new__(type(self))
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if isinstance(value, Metrics):
+                value = value.copy()
+            elif isinstance(value, list):
+                value = list(value)
+            setattr(record, field, value)
+        return record
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> 'Record':
+        '''Inverse of `as_dict`, missing fields are set to None'''
+        record = object.__new__(cls)
+        for field in cls.__slots__:
+            record[field] = data.get(field)
+        return record
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {field: render(self[field]) for field in self.__slots__}
+
+    def __repr__(self) -> str:
+        fields = ', '.join('{}={!r}'.format(field, getattr(self, field)) for field in self.__slots__)
+        return '{}({})'.format(type(self).__name__, fields)
+
+
+class GPURecord(Record):
+    __slots__ = ('name', 'index', 'metrics', 'processes')
+
+    def __init__(self, name: Optional[str] = None, index: Optional[int] = None, metrics: Optional[Metrics] = None,
+                 processes: Optional[List['GPUProcess']] = None) -> None:
+        self.name = name
+        self.index = index
+        self.metrics = metrics if metrics is not None else Metrics()
+        # None when processes could not be listed
+        self.processes = processes
+
+    def copy(self) -> 'GPURecord':
+        processes = list(self.processes) if self.processes is not None else None
+        return GPURecord(self.name, self.index, self.metrics.copy(), processes)
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> 'GPURecord':
+        processes = data.get('processes')
+        if processes is not None:
+            processes = [GPUProcess.from_dict(process) for process in processes]
+        return cls(data.get('name'), data.get('index'), Metrics.from_dict(data.get('metrics') or {}), processes)
+
+
+class CPURecord(Record):
+    __slots__ = ('index', 'metrics', 'cores')
+
+    def __init__(self, index: int, metrics: Metrics, cores: List[Metrics]) -> None:
+        self.index = index
+        self.metrics = metrics
+        self.cores = cores
+
+    def copy(self) -> 'CPURecord':
+        return CPURecord(self.index, self.metrics.copy(), list(self.cores))
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> 'CPURecord':
+        return cls(data.get('index'), Metrics.from_dict(data.get('metrics') or {}),
+                   [Metrics.from_dict(core) for core in data.get('cores') or []])
+
+
+class GPUProcess(Record):
+    __slots__ = ('pid', 'command', 'owner', 'mem_used')
+    units = {'mem_used': 'MiB'}
+
+    def __init__(self, pid: int, command: str, owner: Optional[str] = None, mem_used: Optional[int] = None) -> None:
+        self.pid = pid
+        self.command = command
+        self.owner = owner
+        # None when not reported (e.g. by nvidia-smi pmon)
+        self.mem_used = mem_used
+
+
+MutableMapping.register(Metrics)
+Mapping.register(Record)
+
+
+def render(value):
+    '''
+    JSON-compatible form of the infrastructure (or any part of it) in the format served by the API,
+    records and metrics become dicts. Plain containers are rendered recursively (and copied).
+    '''
+    if isinstance(value, (Metrics, Record)):
+        return value.as_dict()
+    if isinstance(value, dict):
+        return {key: render(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render(item) for item in value]
+    return value
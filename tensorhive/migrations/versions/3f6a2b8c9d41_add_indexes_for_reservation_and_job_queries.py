@@ -0,0 +1,33 @@
+"""Add indexes for reservation and job queries
+
+Revision ID: 3f6a2b8c9d41
+Revises: 0a7b011e7b39
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a2b8c9d41'
+down_revision = '0a7b011e7b39'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_reservations_resource_id_end', 'reservations', ['resource_id', '_end', '_start'])
+    op.create_index('ix_reservations_end', 'reservations', ['_end', '_start'])
+    op.create_index('ix_jobs_is_queued_status', 'jobs', ['is_queued', '_status'])
+    op.create_index('ix_jobs_stop_at', 'jobs', ['_stop_at', '_start_at'])
+    op.create_index('ix_jobs_user_id', 'jobs', ['user_id'])
+    op.create_index('ix_tasks_job_id', 'tasks', ['job_id'])
+
+
+def downgrade():
+    op.drop_index('ix_tasks_job_id', table_name='tasks')
+    op.drop_index('ix_jobs_user_id', table_name='jobs')
+    op.drop_index('ix_jobs_stop_at', table_name='jobs')
+    op.drop_index('ix_jobs_is_queued_status', table_name='jobs')
+    op.drop_index('ix_reservations_end', table_name='reservations')
+    op.drop_index('ix_reservations_resource_id_end', table_name='reservations')
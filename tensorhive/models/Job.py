@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime, Text, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime, Text, Boolean, Index
 from datetime import datetime, timedelta
 from tensorhive.database import Base
 from sqlalchemy.orm import relationship, backref
@@ -23,13 +23,20 @@ class JobStatus(enum.Enum):
 
 class Job(CRUDModel, Base):  # type: ignore
     __tablename__ = 'jobs'
-    __table_args__ = {'sqlite_autoincrement': True}
+    __table_args__ = (
+        # Queue of jobs (see `get_job_queue`)
+        Index('ix_jobs_is_queued_status', 'is_queued', '_status'),
+        # Jobs scheduled to run or stop around now, these conditions always limit `_stop_at`
+        Index('ix_jobs_stop_at', '_stop_at', '_start_at'),
+        {'sqlite_autoincrement': True}
+    )
     __public__ = ['id', 'name', 'description', 'user_id', 'start_at', 'stop_at']
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(40), nullable=False)
     description = Column(Text)
-    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    # Jobs (and their tasks) are eagerly loaded with users, e.g. owners of reservations
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), index=True)
     user = relationship("User", back_populates="_jobs")
     _status = Column(Enum(JobStatus), default=JobStatus.not_running, nullable=False)
     _start_at = Column(DateTime)
@@ -150,8 +157,9 @@ class Job(CRUDModel, Base):  # type: ignore
 
     @staticmethod
     def get_job_queue() -> List['Job']:
-        return Job.query.filter(Job.is_queued).filter(Job.status != JobStatus.running).all()
+        # `IS 1` instead of a bare boolean column, which would not use the index
+        return Job.query.filter(Job.is_queued.is_(True)).filter(Job.status != JobStatus.running).all()
 
     @staticmethod
     def get_jobs_running_from_queue() -> List['Job']:
-        return Job.query.filter(Job.is_queued).filter(Job.status == JobStatus.running).all()
+        return Job.query.filter(Job.is_queued.is_(True)).filter(Job.status == JobStatus.running).all()
@@ -1,10 +1,11 @@
-from sqlalchemy import Column, Boolean, Integer, String, DateTime, ForeignKey, and_, not_, or_, event
+from sqlalchemy import Column, Boolean, Integer, String, DateTime, ForeignKey, Index, and_, not_, or_, event
 from tensorhive.database import db_session, Base
 from tensorhive.models.CRUDModel import CRUDModel
 from tensorhive.utils.DateUtils import DateUtils
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import relationship, backref
-from typing import List
+from sqlalchemy.orm import relationship, backref, subqueryload
+from typing import Dict, List, Optional, Set, Tuple
 import datetime
 from datetime import timedelta
 import logging
@@ -13,7 +14,14 @@ log = logging.getLogger(__name__)
 
 class Reservation(CRUDModel, Base):  # type: ignore
     __tablename__ = 'reservations'
-    __table_args__ = {'sqlite_autoincrement': True}
+    __table_args__ = (
+        # Hot queries look for reservations which have not ended yet (of given resources), `_start` is included
+        # so that overlap conditions are checked within the index. Finished reservations, which make up most
+        # of the table, are skipped.
+        Index('ix_reservations_resource_id_end', 'resource_id', '_end', '_start'),
+        Index('ix_reservations_end', '_end', '_start'),
+        {'sqlite_autoincrement': True}
+    )
     __public__ = ['id', 'title', 'description', 'resource_id', 'user_id', 'gpu_util_avg', 'mem_util_avg', 'start',
                   'end', 'created_at', 'is_cancelled']
 
@@ -39,7 +47,7 @@ class Reservation(CRUDModel, Base):  # type: ignore
     __min_reservation_time = datetime.timedelta(minutes=30)
     __max_reservation_time = datetime.timedelta(days=8)
 
-    def check_assertions(self):
+    def check_assertions(self, check_interference=True):
         assert self.user_id, 'Reservation owner must be given!'
         assert self.resource_id, 'Reservation must be related with a resource!'
         assert self.start, 'Reservation start time is invalid!'
@@ -51,8 +59,30 @@ class Reservation(CRUDModel, Base):  # type: ignore
         assert len(self.description) < 200, 'Reservation description has incorrect length!'
         assert len(self.resource_id) == 40, 'Protected resource UUID has incorrect length!'
 
-        collision = self.would_interfere()
-        assert not collision, 'Reservation would interfere with some other reservation!'
+        if check_interference:
+            collision = self.would_interfere()
+            assert not collision, 'Reservation would interfere with some other reservation!'
+
+    @classmethod
+    def save_all(cls, reservations: List['Reservation']) -> List['Reservation']:
+        '''
+        Validates given reservations (checking conflicts with each other and with the stored ones in bulk)
+        and saves all of them in a single transaction, none of them is saved if any is invalid
+        '''
+        for reservation in reservations:
+            reservation.check_assertions(check_interference=False)
+        interfering = cls.find_interfering(reservations)
+        assert not interfering, 'Reservations at positions {} would interfere with some other reservation!'.format(
+            ', '.join(str(position) for position in sorted(interfering)))
+        try:
+            db_session.add_all(reservations)
+            db_session.commit()
+        except SQLAlchemyError as e:
+            db_session.rollback()
+            log.error('{cause} with {count} reservations'.format(cause=e.__cause__, count=len(reservations)))
+            raise
+        log.debug('Saved {} reservations'.format(len(reservations)))
+        return reservations
 
     @hybrid_property
     def duration(self):
@@ -86,6 +116,11 @@ class Reservation(CRUDModel, Base):  # type: ignore
     def is_cancelled(self, value):
         self._is_cancelled = value
 
+    @classmethod
+    def _query_with_owners(cls):
+        '''Owners are loaded along with reservations (as usual), but their jobs only when accessed'''
+        return cls.query.options(subqueryload(cls.user).lazyload('_jobs'))
+
     @classmethod
     def current_events(cls, resource_id: str = None):
         '''Returns only those events that should be currently respected by users
@@ -99,16 +134,18 @@ class Reservation(CRUDModel, Base):  # type: ignore
         if resource_id is not None:
             query = and_(query, cls.resource_id == resource_id)
 
-        events = cls.query.filter(query).all()
+        events = cls._query_with_owners().filter(query).all()
 
         return [e for e in events if not e.is_cancelled]
 
     @classmethod
     def upcoming_events_for_resource(cls, resource_id: str, period_after: timedelta) -> List['Reservation']:
         current_time = datetime.datetime.utcnow()
-        events = cls.query.filter(
+        events = cls._query_with_owners().filter(
             and_(
                 cls.resource_id == resource_id,
+                # Implied by the conditions below, lets the index skip finished reservations
+                cls.end > current_time,  # type: ignore
                 or_(and_(cls.start < current_time,  # type: ignore
                          cls.end > current_time),  # type: ignore
                     and_(cls.start >= current_time,  # type: ignore
@@ -117,17 +154,62 @@ class Reservation(CRUDModel, Base):  # type: ignore
         ).order_by(Reservation.start).all()
         return [e for e in events if not e.is_cancelled]
 
+    @classmethod
+    def _not_cancelled(cls):
+        # NULL means not cancelled as well
+        return cls._is_cancelled.isnot(True)
+
     def would_interfere(self):
+        '''Whether any other (not cancelled) reservation of the same resource overlaps with this one'''
         conflicting_reservations = Reservation.query.filter(
-            # Two events overlap in time domain
-            and_(
-                self.start < Reservation.end,
-                self.end > Reservation.start
-            ),
             # Case concerns the same resource
-        ).filter(Reservation.id != self.id)\
-         .filter(Reservation.resource_id == self.resource_id).all()
-        return any(not r.is_cancelled for r in conflicting_reservations)
+            Reservation.resource_id == self.resource_id,
+            # Two events overlap in time domain
+            self.start < Reservation.end,
+            self.end > Reservation.start,
+            Reservation.id != self.id,
+            Reservation._not_cancelled())
+        return db_session.query(conflicting_reservations.exists()).scalar()
+
+    @classmethod
+    def find_interfering(cls, reservations: List['Reservation']) -> Set[int]:
+        '''
+        Positions of given (not yet saved or modified) reservations which would interfere with each other
+        or with other reservations stored in the database. Cancelled reservations are not taken into account.
+
+        Stored reservations of the involved resources within the whole time span are fetched with a single query
+        (only columns included in the index), then every resource is checked in one pass over its sorted intervals.
+        '''
+        candidates = [(position, reservation) for position, reservation in enumerate(reservations)
+                      if not reservation.is_cancelled]
+        if not candidates:
+            return set()
+        candidate_ids = {reservation.id for _, reservation in candidates if reservation.id is not None}
+        stored_reservations = db_session.query(cls.id, cls.resource_id, cls._start, cls._end).filter(
+            cls.resource_id.in_({reservation.resource_id for _, reservation in candidates}),
+            cls.end > min(reservation.start for _, reservation in candidates),  # type: ignore
+            cls.start < max(reservation.end for _, reservation in candidates),  # type: ignore
+            cls._not_cancelled()).all()
+
+        # (start, end, position of the candidate or None for stored reservations) of each resource
+        timelines = {}  # type: Dict[str, List[Tuple[datetime.datetime, datetime.datetime, Optional[int]]]]
+        for reservation_id, resource_id, start, end in stored_reservations:
+            if reservation_id not in candidate_ids:
+                timelines.setdefault(resource_id, []).append((start, end, None))
+        for position, reservation in candidates:
+            timelines.setdefault(reservation.resource_id, []).append((reservation.start, reservation.end, position))
+
+        interfering = set()  # type: Set[int]
+        for intervals in timelines.values():
+            intervals.sort(key=lambda interval: interval[0])
+            # Interval which ends the latest among those processed so far
+            latest_end, latest_position = None, None
+            for start, end, position in intervals:
+                if latest_end is not None and start < latest_end:
+                    interfering.update(p for p in (position, latest_position) if p is not None)
+                if latest_end is None or end > latest_end:
+                    latest_end, latest_position = end, position
+        return interfering
 
     @classmethod
     def filter_by_uuids_and_time_range(cls, uuids: List[str], start: datetime.datetime, end: datetime.datetime):
@@ -145,7 +227,7 @@ class Reservation(CRUDModel, Base):  # type: ignore
         after_start_filter = cls.start <= end  # type: ignore
         before_end_filter = start <= cls.end  # type: ignore
         matching_conditions = and_(uuid_filter, after_start_filter, before_end_filter)
-        return cls.query.filter(matching_conditions).all()
+        return cls._query_with_owners().filter(matching_conditions).all()
 
     def __repr__(self):
         return '''
@@ -1,8 +1,12 @@
 from sqlalchemy import Column, String
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import relationship
 from tensorhive.database import db_session
 from tensorhive.models.CRUDModel import CRUDModel
 from tensorhive.models.RestrictionAssignee import RestrictionAssignee
+from typing import Dict, Optional, Tuple
+import logging
+log = logging.getLogger(__name__)
 
 
 class Resource(CRUDModel, RestrictionAssignee):  # type: ignore
@@ -59,3 +63,36 @@ class Resource(CRUDModel, RestrictionAssignee):  # type: ignore
     @classmethod
     def get_by_hostname(cls, hostname):
         return db_session.query(Resource).filter(Resource.hostname == hostname).all()
+
+    @classmethod
+    def upsert_discovered(cls, gpus: Dict[str, Tuple[str, Optional[str]]]) -> int:
+        """
+        Registers GPUs discovered by monitoring and updates hostnames of GPUs which have been moved,
+        all in a single transaction. Names of already registered GPUs are left as they are.
+        :param gpus: Hostname and name of each GPU, keyed by UUID
+        :return: Number of inserted or updated resources
+        """
+        # Keeps the number of bound parameters below SQLite's limit
+        chunk_size = 500
+        uuids = list(gpus)
+        changed = 0
+        try:
+            existing = {}
+            for start in range(0, len(uuids), chunk_size):
+                chunk = uuids[start:start + chunk_size]
+                existing.update({resource.id: resource
+                                 for resource in db_session.query(Resource).filter(Resource.id.in_(chunk))})
+            for uuid, (hostname, name) in gpus.items():
+                resource = existing.get(uuid)
+                if resource is None:
+                    db_session.add(Resource(id=uuid, name=name, hostname=hostname))
+                    changed += 1
+                elif resource.hostname != hostname:
+                    resource.hostname = hostname
+                    changed += 1
+            db_session.commit()
+        except SQLAlchemyError as e:
+            db_session.rollback()
+            log.error('Could not register discovered GPUs: {}'.format(e))
+            raise
+        return changed
@@ -22,7 +22,7 @@ class Task(CRUDModel, Base):  # type: ignore
     __public__ = ['id', 'job_id', 'hostname', 'pid', 'command']
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    job_id = Column(Integer, ForeignKey('jobs.id', ondelete='CASCADE'))
+    job_id = Column(Integer, ForeignKey('jobs.id', ondelete='CASCADE'), index=True)
     job = relationship("Job", back_populates="_tasks")
     hostname = Column(String(40), nullable=False)
     pid = Column(Integer)
@@ -10,6 +10,7 @@ from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from sqlalchemy.orm import validates
 from usernames import is_safe_username
 from sqlalchemy.ext.hybrid import hybrid_property
+from typing import Optional, Set
 import safe
 import logging
 import re
@@ -163,24 +164,34 @@ class User(CRUDModel, RestrictionAssignee):  # type: ignore
     def get_reservations(self, include_cancelled=False):
         return self._reservations if include_cancelled else [r for r in self._reservations if not r.is_cancelled]
 
-    def filter_infrastructure_by_user_restrictions(self, infrastructure):
-        not_allowed_hostnames = []
-        allowed_gpus = []
+    def get_allowed_gpu_ids(self) -> Optional[Set[str]]:
+        '''UUIDs of GPUs the user is allowed to use, None if the user is not restricted at all'''
+        allowed_gpus = set()  # type: Set[str]
         for restriction in self.get_restrictions(include_expired=False, include_group=True):
             # If restriction is global user has permissions to all resources
             if restriction.is_global:
-                return infrastructure
-            allowed_gpus.extend([resource.id for resource in restriction.resources])
-        allowed_gpus = set(allowed_gpus)
+                return None
+            allowed_gpus.update(resource.id for resource in restriction.resources)
+        return allowed_gpus
+
+    @staticmethod
+    def filter_infrastructure_by_gpus(infrastructure, allowed_gpus: Optional[Set[str]]):
+        '''
+        Returns infrastructure limited to given GPUs (and nodes having them), None means no limit.
+        Given infrastructure (e.g. a published snapshot) is not modified, filtered nodes are new dicts.
+        '''
+        if allowed_gpus is None:
+            return infrastructure
+        filtered_infrastructure = {}
         for hostname, value in infrastructure.items():
             gpu_list = value.get('GPU')
-            if gpu_list is not None:
-                all_gpus = set(gpu_list.keys())
-                not_allowed_gpus = all_gpus - allowed_gpus
-                for key in not_allowed_gpus:
-                    del gpu_list[key]
-            if gpu_list is None or len(gpu_list) == 0:
-                not_allowed_hostnames.append(hostname)
-        for hostname in not_allowed_hostnames:
-            del infrastructure[hostname]
-        return infrastructure
+            if gpu_list is None:
+                continue
+            allowed_gpu_list = {uuid: gpu for uuid, gpu in gpu_list.items() if uuid in allowed_gpus}
+            if allowed_gpu_list:
+                filtered_infrastructure[hostname] = dict(value, GPU=allowed_gpu_list)
+        return filtered_infrastructure
+
+    def filter_infrastructure_by_user_restrictions(self, infrastructure):
+        '''Returns infrastructure limited to GPUs (and nodes having them) the user is allowed to use'''
+        return self.filter_infrastructure_by_gpus(infrastructure, self.get_allowed_gpu_ids())
@@ -0,0 +1,59 @@
+from tensorhive.api.InfrastructureStream import InfrastructureStream
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+from tensorhive.core.utils.AllowedGPUIndex import AllowedGPUIndex
+from tensorhive.database import db_session
+from fixtures.controllers import API_URI as BASE_URI, HEADERS
+from http import HTTPStatus
+from importlib import reload
+from types import SimpleNamespace
+from unittest.mock import patch
+import tensorhive.controllers.nodes as nodes
+import auth_patcher
+import json
+import pytest
+
+ENDPOINT = BASE_URI + '/nodes'
+
+
+def setup_module(_):
+    auth_patches = auth_patcher.get_patches(superuser=False)
+    for auth_patch in auth_patches:
+        auth_patch.start()
+    reload(nodes)
+    for auth_patch in auth_patches:
+        auth_patch.stop()
+
+
+@pytest.fixture
+def infrastructure_manager():
+    infrastructure_manager = InfrastructureManager({'node0': {}})
+    infrastructure_manager.infrastructure['node0']['GPU'] = {
+        'GPU-0': {'name': 'GeForce', 'index': 0, 'metrics': {'temp': 40}, 'processes': []}
+    }
+    infrastructure_manager.publish()
+    tensorhive_manager = SimpleNamespace(infrastructure_manager=infrastructure_manager,
+                                         infrastructure_stream=InfrastructureStream(infrastructure_manager))
+    with patch.object(nodes, 'TensorHiveManager', lambda: tensorhive_manager):
+        yield infrastructure_manager
+
+
+# GET /nodes/metrics
+def test_deleted_user_sees_no_gpus(tables, client, infrastructure_manager):
+    # Token's identity does not match any user in the database
+    AllowedGPUIndex().invalidate()
+    resp = client.get(ENDPOINT + '/metrics', headers=HEADERS)
+    assert resp.status_code == HTTPStatus.OK
+    assert 'GPU-0' not in resp.data.decode('utf-8')
+    etag = resp.headers['ETag']
+
+    resp = client.get(ENDPOINT + '/metrics', headers=dict(HEADERS, **{'If-None-Match': etag}))
+    assert resp.status_code == HTTPStatus.NOT_MODIFIED
+
+
+def test_stream_rechecks_permissions_without_touching_scoped_session(tables, new_user):
+    new_user.save()
+    AllowedGPUIndex().invalidate()
+    session = db_session()
+    assert nodes.stream_allowed_gpus(new_user.id) == frozenset()
+    assert nodes.stream_allowed_gpus(new_user.id + 1) == frozenset()
+    assert db_session() is session
@@ -0,0 +1,110 @@
+from tensorhive.api.InfrastructureStream import InfrastructureStream
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+from fixtures.controllers import API_URI as BASE_URI, HEADERS
+from http import HTTPStatus
+from importlib import reload
+from types import SimpleNamespace
+from unittest.mock import patch
+import tensorhive.controllers.nodes as nodes
+import auth_patcher
+import json
+import pytest
+
+ENDPOINT = BASE_URI + '/nodes'
+
+
+def setup_module(_):
+    auth_patches = auth_patcher.get_patches(superuser=True)
+    for auth_patch in auth_patches:
+        auth_patch.start()
+    reload(nodes)
+    for auth_patch in auth_patches:
+        auth_patch.stop()
+
+
+@pytest.fixture
+def infrastructure_manager():
+    infrastructure_manager = InfrastructureManager({'node0': {}, 'node1': {}}, history_capacity=10)
+    for index, hostname in enumerate(['node0', 'node1']):
+        infrastructure_manager.infrastructure[hostname]['GPU'] = {
+            'GPU-{}'.format(index): {'name': 'GeForce', 'index': 0, 'metrics': {'temp': 40}, 'processes': []}
+        }
+    infrastructure_manager.publish()
+    tensorhive_manager = SimpleNamespace(infrastructure_manager=infrastructure_manager,
+                                         infrastructure_stream=InfrastructureStream(infrastructure_manager))
+    with patch.object(nodes, 'TensorHiveManager', lambda: tensorhive_manager):
+        yield infrastructure_manager
+
+
+def get(client, url, etag=None):
+    headers = dict(HEADERS, **{'If-None-Match': etag}) if etag else HEADERS
+    return client.get(url, headers=headers)
+
+
+# GET /nodes/metrics
+def test_unchanged_infrastructure_is_not_sent_again(client, infrastructure_manager):
+    resp = get(client, ENDPOINT + '/metrics')
+    assert resp.status_code == HTTPStatus.OK
+    assert set(json.loads(resp.data.decode('utf-8'))) == {'node0', 'node1'}
+    etag = resp.headers['ETag']
+
+    resp = get(client, ENDPOINT + '/metrics', etag)
+    assert resp.status_code == HTTPStatus.NOT_MODIFIED
+    assert resp.data == b''
+
+    infrastructure_manager.mark_updated('node1')
+    resp = get(client, ENDPOINT + '/metrics', etag)
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.headers['ETag'] != etag
+
+
+# GET /nodes/metrics?since_version=
+def test_only_nodes_changed_since_version_are_returned(client, infrastructure_manager):
+    version = int(get(client, ENDPOINT + '/metrics').headers['X-Infrastructure-Version'])
+    infrastructure_manager.infrastructure['node1']['GPU']['GPU-1']['metrics']['temp'] = 50
+    infrastructure_manager.mark_updated('node1')
+
+    resp = get(client, ENDPOINT + '/metrics?since_version={}'.format(version))
+    assert resp.status_code == HTTPStatus.OK
+    assert json.loads(resp.data.decode('utf-8'))['node1']['GPU']['GPU-1']['metrics'] == {'temp': 50}
+    assert list(json.loads(resp.data.decode('utf-8'))) == ['node1']
+    assert int(resp.headers['X-Infrastructure-Version']) == version + 1
+
+
+# GET /nodes/{hostname}/gpu/info
+def test_node_tag_does_not_change_when_other_node_is_updated(client, infrastructure_manager):
+    etag = get(client, ENDPOINT + '/node0/gpu/info').headers['ETag']
+    infrastructure_manager.mark_updated('node1')
+    assert get(client, ENDPOINT + '/node0/gpu/info', etag).status_code == HTTPStatus.NOT_MODIFIED
+
+    infrastructure_manager.mark_updated('node0')
+    assert get(client, ENDPOINT + '/node0/gpu/info', etag).status_code == HTTPStatus.OK
+
+
+# GET /nodes/{hostname}/cpu/metrics/history
+def test_cpu_metrics_history_is_served(client, infrastructure_manager):
+    for utilization in [None, 12.5]:
+        metrics = {'utilization': {'value': utilization, 'unit': '%'}, 'mem_used': {'value': 2048, 'unit': 'MiB'}}
+        cpu = {'CPU_node0': {'index': 0, 'metrics': metrics}}
+        infrastructure_manager.infrastructure['node0']['CPU'] = cpu
+        infrastructure_manager.record_history(cpu)
+    infrastructure_manager.mark_updated('node0')
+
+    resp = get(client, ENDPOINT + '/node0/cpu/metrics/history')
+    assert resp.status_code == HTTPStatus.OK
+    metrics = json.loads(resp.data.decode('utf-8'))['CPU_node0']['metrics']
+    assert metrics == {'utilization': {'values': [None, 12.5], 'unit': '%'},
+                       'mem_used': {'values': [2048, 2048], 'unit': 'MiB'}}
+    assert get(client, ENDPOINT + '/node1/cpu/metrics/history').status_code == HTTPStatus.NOT_FOUND
+
+
+# GET /nodes/metrics/stream
+def test_stream_starts_with_all_nodes(client, infrastructure_manager):
+    resp = client.get(ENDPOINT + '/metrics/stream', headers=HEADERS, buffered=False)
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.mimetype == 'text/event-stream'
+
+    event = next(resp.response).decode('utf-8')
+    assert event.startswith('id: {}\nevent: snapshot\ndata: '.format(infrastructure_manager.snapshot.version))
+    assert set(json.loads(event.split('data: ')[1])) == {'node0', 'node1'}
+    resp.close()
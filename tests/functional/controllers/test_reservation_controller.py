@@ -283,3 +283,52 @@ def test_delete_active_reservation_forbidden(tables, client, active_reservation,
     resp = client.delete(ENDPOINT + '/' + str(active_reservation.id), headers=HEADERS)
 
     assert resp.status_code == HTTPStatus.FORBIDDEN
+
+
+def batch_data(user, resource_ids, days, first_day='2101-01-01'):
+    start = DateUtils.parse_string(first_day + 'T00:00:00.000Z')
+    return [{
+        'title': 'Test reservation',
+        'description': 'Test reservation',
+        'resourceId': resource_id,
+        'userId': user.id,
+        'start': DateUtils.stringify_datetime_to_api_format(start + timedelta(days=day)),
+        'end': DateUtils.stringify_datetime_to_api_format(start + timedelta(days=day + 1))
+    } for resource_id in resource_ids for day in range(days)]
+
+
+def test_create_reservations_batch(tables, client, new_user, permissive_restriction):
+    new_user.save()
+    resource_ids = ['{:040d}'.format(index) for index in range(4)]
+    for resource_id in resource_ids:
+        Resource(id=resource_id).save()
+
+    resp = client.post(ENDPOINT + '/batch', headers=HEADERS, data=json.dumps(batch_data(new_user, resource_ids, 5)))
+    resp_json = json.loads(resp.data.decode('utf-8'))
+
+    assert resp.status_code == HTTPStatus.CREATED
+    assert len(resp_json['reservations']) == 20
+    assert len(Reservation.all()) == 20
+
+
+def test_create_reservations_batch_is_atomic(tables, client, new_user, restriction):
+    new_user.save()
+    restriction.starts_at = '2101-01-01T00:00:00.000Z'
+    restriction.ends_at = '2101-01-03T00:00:00.000Z'
+    restriction.apply_to_user(new_user)
+    resource_ids = ['{:040d}'.format(index) for index in range(2)]
+    for resource_id in resource_ids:
+        Resource(id=resource_id).save()
+        restriction.apply_to_resource(Resource.get(resource_id))
+
+    # The third day is not covered by the restriction
+    resp = client.post(ENDPOINT + '/batch', headers=HEADERS, data=json.dumps(batch_data(new_user, resource_ids, 3)))
+    assert resp.status_code == HTTPStatus.FORBIDDEN
+
+    # Reservations within the batch overlap
+    data = batch_data(new_user, resource_ids, 2)
+    data[1]['start'] = data[0]['start']
+    resp = client.post(ENDPOINT + '/batch', headers=HEADERS, data=json.dumps(data))
+    assert resp.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert 'positions 0, 1 would interfere' in json.loads(resp.data.decode('utf-8'))['msg']
+    assert Reservation.all() == []
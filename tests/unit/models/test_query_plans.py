@@ -0,0 +1,67 @@
+from tensorhive.core.services.JobSchedulingService import JobSchedulingService
+from tensorhive.database import engine
+from tensorhive.models.Job import Job
+from tensorhive.models.Reservation import Reservation
+from sqlalchemy import event
+from contextlib import closing
+from datetime import datetime, timedelta
+import pytest
+import re
+
+
+def query_plans(function, *args):
+    '''`EXPLAIN QUERY PLAN` of every statement executed by the function'''
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        function(*args)
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    with closing(engine.raw_connection()) as connection, closing(connection.cursor()) as cursor:
+        return [' '.join(row[-1] for row in cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall())
+                for statement, parameters in statements]
+
+
+def scans_table(plan):
+    return re.search(r'SCAN (reservations|jobs|tasks)\b', plan) is not None
+
+
+def assert_uses_index(plans, index_name):
+    assert plans, 'No query was executed'
+    for plan in plans:
+        assert re.search(r'INDEX {}\b'.format(index_name), plan) and not scans_table(plan), plan
+
+
+@pytest.mark.parametrize('function, args, index_name', [
+    (Reservation.current_events, (), 'ix_reservations_end'),
+    (Reservation.current_events, ('GPU-' + '0' * 36,), 'ix_reservations_resource_id_end'),
+    (Reservation.upcoming_events_for_resource, ('GPU-' + '0' * 36, timedelta(minutes=30)),
+     'ix_reservations_resource_id_end'),
+    (Reservation.filter_by_uuids_and_time_range, (['GPU-' + '0' * 36, 'GPU-' + '1' * 36], datetime.utcnow(),
+                                                  datetime.utcnow() + timedelta(hours=1)),
+     'ix_reservations_resource_id_end'),
+    (lambda: Reservation.query.filter(Reservation.end >= datetime.utcnow()).all(), (), 'ix_reservations_end')
+])
+def test_reservation_queries_skip_finished_reservations(tables, function, args, index_name):
+    assert_uses_index(query_plans(function, *args), index_name)
+
+
+def test_interference_checks_use_index(tables, new_reservation):
+    assert_uses_index(query_plans(new_reservation.would_interfere), 'ix_reservations_resource_id_end')
+    assert_uses_index(query_plans(Reservation.find_interfering, [new_reservation]), 'ix_reservations_resource_id_end')
+
+
+@pytest.mark.parametrize('function', [Job.get_job_queue, Job.get_jobs_running_from_queue])
+def test_queue_queries_use_index(tables, function):
+    assert_uses_index(query_plans(function), 'ix_jobs_is_queued_status')
+
+
+def test_scheduled_job_queries_use_index(tables):
+    service = JobSchedulingService(interval=0, stop_attempts_after=5)
+    assert_uses_index(query_plans(service.find_jobs_scheduled_for_date, datetime.utcnow()), 'ix_jobs_stop_at')
+    assert_uses_index(query_plans(service.stop_scheduled), 'ix_jobs_stop_at')
@@ -123,3 +123,32 @@ def test_current_events_will_only_return_non_cancelled_reservations(tables, new_
     current_events = Reservation.current_events()
     assert new_reservation not in current_events
     assert new_reservation_2 in current_events
+
+
+def test_batch_interference_check(tables, new_user, resource1, resource2, new_reservation):
+    new_reservation.save()
+    start = new_reservation.end
+
+    def reservation(resource, hours, duration=1):
+        return Reservation(user_id=new_user.id, title='Batch', description='', resource_id=resource.id,
+                           start=start + timedelta(hours=hours), end=start + timedelta(hours=hours + duration))
+
+    candidates = [
+        reservation(resource1, 0),
+        # Overlaps with the stored one only
+        reservation(resource1, -0.5, duration=0.5),
+        reservation(resource2, 0, duration=3),
+        # Overlaps with the previous candidate
+        reservation(resource2, 2),
+        reservation(resource2, 3),
+    ]
+    assert Reservation.find_interfering(candidates) == {1, 2, 3}
+
+    candidates[2].is_cancelled = True
+    assert Reservation.find_interfering(candidates) == {1}
+
+    # Stored reservation moved within the batch does not interfere with its previous version
+    new_reservation.start = new_reservation.start + timedelta(minutes=30)
+    new_reservation.end = new_reservation.end - timedelta(minutes=30)
+    assert Reservation.find_interfering([new_reservation]) == set()
+    assert Reservation.find_interfering([new_reservation, reservation(resource1, -1)]) == {0, 1}
@@ -6,3 +6,16 @@ def test_resource_creation(tables):
     new_resource.save()
 
     assert Resource.get(new_resource.id) is not None
+
+
+def test_upsert_discovered_inserts_new_and_moves_existing_resources(tables, resource1, resource2):
+    changed = Resource.upsert_discovered({
+        resource1.id: ('node0', 'GeForce'),
+        resource2.id: (resource2.hostname, 'GeForce'),
+        'GPU-new': ('node1', 'Tesla')
+    })
+
+    assert changed == 2
+    assert Resource.get(resource1.id).hostname == 'node0'
+    assert Resource.get(resource2.id).name == 'Custom name'
+    assert (Resource.get('GPU-new').hostname, Resource.get('GPU-new').name) == ('node1', 'Tesla')
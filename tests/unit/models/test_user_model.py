@@ -55,3 +55,20 @@ def test_get_users_reservations_does_not_include_cancelled_reservations_by_defau
     new_reservation.save()
     assert new_reservation not in new_user.get_reservations()
     assert new_reservation in new_user.get_reservations(include_cancelled=True)
+
+
+def test_filter_infrastructure_by_user_restrictions_does_not_modify_infrastructure(tables, new_user, restriction,
+                                                                                   resource1, resource2):
+    restriction.apply_to_user(new_user)
+    restriction.apply_to_resource(resource1)
+    infrastructure = {
+        'node0': {'GPU': {resource1.id: {'index': 0}, resource2.id: {'index': 1}}, 'CPU': {}},
+        'node1': {'GPU': {resource2.id: {'index': 0}}},
+        'node2': {'GPU': None}
+    }
+
+    filtered = new_user.filter_infrastructure_by_user_restrictions(infrastructure)
+
+    assert filtered == {'node0': {'GPU': {resource1.id: {'index': 0}}, 'CPU': {}}}
+    assert set(infrastructure) == {'node0', 'node1', 'node2'}
+    assert set(infrastructure['node0']['GPU']) == {resource1.id, resource2.id}
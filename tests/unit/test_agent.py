@@ -0,0 +1,178 @@
+from tensorhive.core.monitors import agent
+from tensorhive.core.monitors.Monitor import Monitor
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+from tensorhive.core.services.StreamingMonitoringService import StreamingMonitoringService
+import gevent
+import subprocess
+import time
+
+
+class CounterMonitor(Monitor):
+    probe_sections = {'counter': 'echo tick', 'numbers': 'echo replaced by stream'}
+
+    def stream_sections(self, interval):
+        return {'numbers': 'seq 3'}
+
+    def parse_probe(self, hostname, sections, infrastructure_manager):
+        assert 'numbers' not in sections
+        node = infrastructure_manager.infrastructure[hostname]
+        node['ticks'] = node.get('ticks', 0) + len(sections['counter'].lines)
+
+    def parse_stream_line(self, hostname, name, line, infrastructure_manager):
+        infrastructure_manager.infrastructure[hostname].setdefault(name, []).append(line)
+
+    def probe_failed(self, hostname, infrastructure_manager):
+        infrastructure_manager.infrastructure[hostname]['ticks'] = None
+
+
+def test_agent_script_output_is_parsed_incrementally():
+    script = agent.build_script([CounterMonitor()], interval=0.1)
+    process = subprocess.Popen(['bash', '-c', script], stdout=subprocess.PIPE, universal_newlines=True)
+    time.sleep(0.5)
+    process.terminate()
+    stdout, _ = process.communicate()
+
+    infrastructure_manager = InfrastructureManager({'host': {}})
+    parser = agent.AgentOutputParser('host', [CounterMonitor()], infrastructure_manager)
+    completed_cycles = sum(parser.feed(line) for line in stdout.splitlines())
+
+    assert completed_cycles >= 2
+    assert infrastructure_manager.infrastructure['host']['ticks'] == completed_cycles
+    assert infrastructure_manager.infrastructure['host']['numbers'] == ['1', '2', '3']
+
+
+class NoisyMonitor(CounterMonitor):
+    probe_sections = {'counter': 'echo warning >&2; echo tick; echo another warning >&2',
+                      'numbers': 'echo replaced by stream'}
+
+
+def test_stderr_of_sections_is_not_parsed_as_data():
+    script = agent.build_script([NoisyMonitor()], interval=0.1)
+    # Same as with a pseudo-terminal
+    process = subprocess.Popen(['bash', '-c', script], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               universal_newlines=True)
+    time.sleep(0.3)
+    process.terminate()
+    stdout, _ = process.communicate()
+
+    infrastructure_manager = InfrastructureManager({'host': {}})
+    parser = agent.AgentOutputParser('host', [NoisyMonitor()], infrastructure_manager)
+    completed_cycles = sum(parser.feed(line) for line in stdout.splitlines())
+
+    assert 'warning' not in stdout
+    assert completed_cycles >= 1
+    assert infrastructure_manager.infrastructure['host']['ticks'] == completed_cycles
+
+
+class HostOutput:
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.exit_code = None
+        self.exception = None
+        self.channel = None
+
+
+class Connection:
+    def __init__(self):
+        self.scripts = []
+
+    def run_command(self, command, stop_on_errors=True, use_pty=False):
+        self.scripts.append(command)
+
+        def stdout():
+            for _ in range(2):
+                gevent.sleep(0.01)
+                yield '#TH_BEGIN counter'
+                yield 'tick'
+                yield '#TH_END counter 0'
+                yield agent.CYCLE_MARKER
+            yield '{} numbers 7'.format(agent.STREAM_MARKER)
+        return {'host': HostOutput(stdout())}
+
+
+class ConnectionManager:
+    def __init__(self):
+        self.connection = Connection()
+
+    def new_single_connection(self, hostname):
+        return self.connection
+
+
+def test_agent_is_reconnected_after_channel_loss():
+    connection_manager = ConnectionManager()
+    infrastructure_manager = InfrastructureManager({'host': {}})
+    service = StreamingMonitoringService(monitors=[CounterMonitor()], interval=0.01, deadline=1.0)
+    service.infrastructure_manager = infrastructure_manager
+    service.connection_manager = connection_manager
+
+    service.update_all()
+    gevent.sleep(0.1)
+    assert infrastructure_manager.infrastructure['host'] == {'ticks': 2, 'numbers': ['7']}
+    assert infrastructure_manager.node_status()['host']['stale'] is False
+
+    service.update_all()
+    gevent.sleep(0.1)
+    assert len(connection_manager.connection.scripts) == 2
+    assert infrastructure_manager.infrastructure['host'] == {'ticks': 4, 'numbers': ['7', '7']}
+
+
+class RefreshingMonitor(CounterMonitor):
+    refresh_section_names = frozenset({'inventory'})
+    probe_sections = dict(CounterMonitor.probe_sections, inventory='echo inventory')
+
+    def __init__(self):
+        self.refresh_due = True
+
+    def refresh_sections(self, hostname):
+        return {'inventory': self.probe_sections['inventory']} if self.refresh_due else {}
+
+    def parse_probe(self, hostname, sections, infrastructure_manager):
+        if 'inventory' in sections:
+            self.refresh_due = False
+            infrastructure_manager.infrastructure[hostname]['inventory'] = sections['inventory'].lines
+        if 'counter' in sections:
+            super().parse_probe(hostname, sections, infrastructure_manager)
+
+
+class LongRunningConnection(Connection):
+    def run_command(self, command, stop_on_errors=True, use_pty=False):
+        self.scripts.append(command)
+        if not use_pty:
+            # One-shot probe
+            return {'host': HostOutput(['#TH_BEGIN inventory', 'GPU-0', '#TH_END inventory 0'])}
+
+        def stdout():
+            while True:
+                gevent.sleep(0.01)
+                yield '#TH_BEGIN counter'
+                yield 'tick'
+                yield '#TH_END counter 0'
+                yield agent.CYCLE_MARKER
+        return {'host': HostOutput(stdout())}
+
+    def join(self, output):
+        pass
+
+
+def test_refresh_sections_do_not_restart_agent():
+    connection_manager = ConnectionManager()
+    connection = connection_manager.connection = LongRunningConnection()
+    infrastructure_manager = InfrastructureManager({'host': {}})
+    monitor = RefreshingMonitor()
+    service = StreamingMonitoringService(monitors=[monitor], interval=0.01, deadline=1.0)
+    service.infrastructure_manager = infrastructure_manager
+    service.connection_manager = connection_manager
+
+    service.update_all()
+    gevent.sleep(0.05)
+    running_agent = service._agents['host']
+    assert infrastructure_manager.infrastructure['host']['inventory'] == ['GPU-0']
+    assert len(connection.scripts) == 2
+    assert 'echo inventory' not in connection.scripts[1]
+
+    monitor.refresh_due = True
+    service.update_all()
+    gevent.sleep(0.05)
+    assert len(connection.scripts) == 3
+    assert service._agents['host'] is running_agent and not running_agent.ready()
+    running_agent.kill()
@@ -0,0 +1,77 @@
+from tensorhive.core.utils.AllowedGPUIndex import AllowedGPUIndex
+from tensorhive.database import db_session
+from tensorhive.models.Restriction import Restriction
+from datetime import datetime, timedelta
+import pytest
+
+
+@pytest.fixture
+def index():
+    index = AllowedGPUIndex()
+    # Tables are recreated by each test, entries of users from previous tests must not be reused
+    index.invalidate()
+    return index
+
+
+def test_allowed_gpus_are_cached_until_restrictions_change(tables, index, new_user, restriction, resource1,
+                                                           resource2):
+    new_user.save()
+    restriction.apply_to_user(new_user)
+    restriction.apply_to_resource(resource1)
+
+    allowed_gpus = index.get(new_user.id)
+    assert allowed_gpus == {resource1.id}
+    assert index.get(new_user.id) is allowed_gpus
+
+    restriction.apply_to_resource(resource2)
+    assert index.get(new_user.id) == {resource1.id, resource2.id}
+
+
+def test_group_membership_and_global_restrictions_are_taken_into_account(tables, index, new_group_with_member,
+                                                                         new_user, restriction, resource1):
+    restriction.apply_to_group(new_group_with_member)
+    restriction.apply_to_resource(resource1)
+    assert index.get(new_user.id) == {resource1.id}
+
+    new_group_with_member.remove_user(new_user)
+    assert index.get(new_user.id) == set()
+
+    Restriction(name='Everything', starts_at=datetime.utcnow(), is_global=True).apply_to_user(new_user)
+    assert index.get(new_user.id) is None
+
+
+def test_entry_expires_with_restriction(tables, index, new_user, resource1):
+    new_user.save()
+    restriction = Restriction(name='Short', starts_at=datetime.utcnow() - timedelta(hours=1),
+                              ends_at=datetime.utcnow() + timedelta(hours=1), is_global=False)
+    restriction.apply_to_user(new_user)
+    restriction.apply_to_resource(resource1)
+    assert index.get(new_user.id) == {resource1.id}
+
+    # Restriction has ended in the meantime
+    version, _, allowed_gpus = index._entries[new_user.id]
+    index._entries[new_user.id] = (version, datetime.utcnow() - timedelta(seconds=1), allowed_gpus)
+    restriction._ends_at = datetime.utcnow() - timedelta(seconds=1)
+    assert index.get(new_user.id) == set()
+
+
+def test_index_is_invalidated_when_changes_are_committed(tables, index, new_user, restriction, resource1, resource2):
+    new_user.save()
+    restriction.apply_to_user(new_user)
+    restriction.apply_to_resource(resource1)
+    assert index.get(new_user.id) == {resource1.id}
+    version = index.version
+
+    restriction.resources.append(resource2)
+    db_session.flush()
+    # Other threads would still read the previous state
+    assert index.version == version
+
+    db_session.commit()
+    assert index.version != version
+    assert index.get(new_user.id) == {resource1.id, resource2.id}
+
+    restriction.resources.remove(resource2)
+    db_session.flush()
+    db_session.rollback()
+    assert index.get(new_user.id) == {resource1.id, resource2.id}
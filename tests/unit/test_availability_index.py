@@ -0,0 +1,75 @@
+from tensorhive.core.utils.AvailabilityIndex import Availability, AvailabilityIndex
+from tensorhive.database import db_session
+from tensorhive.models.Restriction import Restriction
+from tensorhive.models.RestrictionSchedule import RestrictionSchedule
+from datetime import datetime, time, timedelta
+import pytest
+
+MONDAY = datetime(2101, 1, 3)
+
+
+@pytest.fixture
+def index():
+    index = AvailabilityIndex()
+    # Tables are recreated by each test, entries of users from previous tests must not be reused
+    index.invalidate()
+    return index
+
+
+def restriction(starts_at, ends_at=None, schedules=()):
+    restriction = Restriction(name='Test', starts_at=starts_at, ends_at=ends_at, is_global=True)
+    for days, hour_start, hour_end in schedules:
+        restriction.schedules.append(RestrictionSchedule(schedule_days=days, hour_start=hour_start, hour_end=hour_end))
+    return restriction
+
+
+def hours(offset):
+    return MONDAY + timedelta(hours=offset)
+
+
+def test_schedules_are_compiled_into_weekly_patterns():
+    availability = Availability([restriction(MONDAY, schedules=[('7', time(22), time(6)),
+                                                                ('1', time(8), time(23, 59))])])
+    # Sunday night lasts until Monday morning
+    assert availability.covers(hours(7 * 24 - 1), hours(7 * 24 + 5))
+    assert not availability.covers(hours(7 * 24 + 5), hours(7 * 24 + 7))
+    assert availability.covers(hours(8), hours(24))
+    assert availability.covers(hours(7 * 24 + 8), hours(8 * 24))
+    assert not availability.covers(hours(24), hours(25))
+    assert not availability.covers(hours(-1), hours(1))
+
+
+def test_restrictions_are_merged_and_clipped():
+    availability = Availability([
+        restriction(hours(0), hours(12), schedules=[('1234567', time(8), time(16))]),
+        restriction(hours(24), hours(48)),
+        restriction(hours(48))
+    ])
+    assert availability.covers(hours(9), hours(12))
+    # Schedule lasts longer than its restriction
+    assert not availability.covers(hours(10), hours(13))
+    assert availability.covers(hours(30), hours(100))
+    assert not availability.covers(hours(20), hours(30))
+
+
+def test_availability_is_cached_until_schedules_change(tables, index, new_user, permissive_restriction, resource1):
+    availability = index.get(new_user, resource1.id)
+    assert index.get(new_user, resource1.id) is availability
+    assert availability.covers(hours(0), hours(2))
+    assert index.get(new_user, 'GPU-unknown') is None
+
+    permissive_restriction.add_schedule(RestrictionSchedule(schedule_days='1', hour_start=time(0), hour_end=time(1)))
+    assert index.get(new_user, resource1.id) is not availability
+    assert not index.get(new_user, resource1.id).covers(hours(0), hours(2))
+
+
+def test_availability_is_invalidated_when_changes_are_committed(tables, index, new_user, permissive_restriction,
+                                                                resource1):
+    availability = index.get(new_user, resource1.id)
+    permissive_restriction.schedules.append(RestrictionSchedule(schedule_days='1', hour_start=time(0),
+                                                                hour_end=time(1)))
+    db_session.flush()
+    assert index.get(new_user, resource1.id) is availability
+
+    db_session.commit()
+    assert not index.get(new_user, resource1.id).covers(hours(0), hours(2))
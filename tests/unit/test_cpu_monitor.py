@@ -0,0 +1,57 @@
+from tensorhive.core.monitors.CPUMonitor import CPUMonitor
+from tensorhive.core.monitors.probe import SectionOutput
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+
+MEMINFO = [
+    'MemTotal:       16384000 kB',
+    'MemFree:         4096000 kB',
+    'Buffers:          102400 kB',
+    'Cached:          1024000 kB',
+    'SReclaimable:     102400 kB',
+]
+
+
+def probe(monitor, infrastructure_manager, stat_lines):
+    sections = {'cpu': SectionOutput(exit_code=0, lines=stat_lines + MEMINFO)}
+    monitor.parse_probe('host', sections, infrastructure_manager)
+    return infrastructure_manager.infrastructure['host']['CPU']['CPU_host']
+
+
+def test_utilization_is_computed_from_consecutive_samples():
+    monitor = CPUMonitor()
+    infrastructure_manager = InfrastructureManager({'host': {}}, history_capacity=10)
+
+    first = probe(monitor, infrastructure_manager, [
+        'cpu  100 0 100 700 100 0 0 0 0 0',
+        'cpu0 50 0 50 350 50 0 0 0 0 0',
+        'cpu1 50 0 50 350 50 0 0 0 0 0',
+    ])
+    # There is nothing to compare with in the first cycle
+    assert first['metrics']['utilization']['value'] is None
+    assert first['metrics']['mem_total'] == {'unit': 'MiB', 'value': 16000}
+    assert first['metrics']['mem_free'] == {'unit': 'MiB', 'value': 4000}
+    assert first['metrics']['mem_used'] == {'unit': 'MiB', 'value': 10800}
+
+    second = probe(monitor, infrastructure_manager, [
+        'cpu  200 0 200 850 150 0 0 0 0 0',
+        'cpu0 150 0 100 400 50 0 0 0 0 0',
+        'cpu1 50 0 100 450 100 0 0 0 0 0',
+    ])
+    assert second['metrics']['utilization'] == {'unit': '%', 'value': 50.0}
+    assert second['metrics']['iowait'] == {'unit': '%', 'value': 12.5}
+    assert [core['utilization']['value'] for core in second['cores']] == [75.0, 25.0]
+    assert [core['iowait']['value'] for core in second['cores']] == [0.0, 25.0]
+
+    # Utilization missing in the first cycle is recorded from the second one on
+    history = infrastructure_manager.metric_history('CPU_host')['metrics']
+    assert history['utilization'] == {'values': [None, 50.0], 'unit': '%'}
+    assert history['mem_total'] == {'values': [16000, 16000], 'unit': 'MiB'}
+
+
+def test_counter_reset_does_not_produce_negative_utilization():
+    monitor = CPUMonitor()
+    infrastructure_manager = InfrastructureManager({'host': {}})
+
+    probe(monitor, infrastructure_manager, ['cpu  500 0 500 5000 0 0 0 0 0 0'])
+    after_reboot = probe(monitor, infrastructure_manager, ['cpu  10 0 10 100 0 0 0 0 0 0'])
+    assert after_reboot['metrics']['utilization']['value'] is None
@@ -0,0 +1,103 @@
+from tensorhive.core.fake_ssh import FakeCluster, FakeParallelSSHClient
+from tensorhive.core.monitors import agent, probe
+from tensorhive.core.monitors.CompositeMonitor import CompositeMonitor
+from tensorhive.core.monitors.CPUMonitor import CPUMonitor
+from tensorhive.core.monitors.GPUMonitor import GPUMonitor
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+from tensorhive.core.task_nursery import ScreenCommandBuilder
+from pssh.exceptions import ConnectionErrorException
+import pytest
+
+
+@pytest.fixture
+def cluster():
+    return FakeCluster(['node0', 'node1'], gpus_per_node=2)
+
+
+def client(cluster, hosts=('node0', 'node1'), user='alice'):
+    return FakeParallelSSHClient(hosts, host_config={host: {'user': user} for host in hosts}, cluster=cluster)
+
+
+@pytest.mark.parametrize('process_discovery', ['compute_apps', 'pmon'])
+def test_probe_output_is_understood_by_monitors(cluster, process_discovery):
+    pid = cluster.node('node0').spawn('bob', 'python train.py', gpu_index=1, mem_used=1500)
+    infrastructure_manager = InfrastructureManager({'node0': {}, 'node1': {}})
+    monitor = CompositeMonitor([CPUMonitor(), GPUMonitor(process_discovery=process_discovery)])
+
+    monitor.update(client(cluster), infrastructure_manager)
+
+    gpus = infrastructure_manager.infrastructure['node0']['GPU']
+    assert [gpu['index'] for gpu in gpus.values()] == [0, 1]
+    busy_gpu = next(gpu for gpu in gpus.values() if gpu['index'] == 1)
+    assert busy_gpu['metrics']['mem_total']['value'] == 11178
+    assert busy_gpu['metrics']['utilization']['value'] > 0
+    assert [(process['pid'], process['owner']) for process in busy_gpu['processes']] == [(pid, 'bob')]
+    assert infrastructure_manager.infrastructure['node1']['GPU']
+    assert 'utilization' in infrastructure_manager.infrastructure['node0']['CPU']['CPU_node0']['metrics']
+
+
+def test_screen_sessions_can_be_spawned_listed_and_killed(cluster):
+    ssh_client = client(cluster, hosts=['node0'])
+    spawn = ScreenCommandBuilder.spawn('CUDA_VISIBLE_DEVICES=1 python train.py', session_name='tensorhive_task_7',
+                                       custom_log_name='task_7')
+    pid = int(next(ssh_client.run_command(spawn)['node0'].stdout))
+    node = cluster.node('node0')
+    assert [process.owner for process in node.gpu_processes(1)] == ['alice']
+
+    sessions = ssh_client.run_command(ScreenCommandBuilder.get_active_sessions('.*tensorhive_task.*'))
+    assert list(sessions['node0'].stdout) == ['{}.tensorhive_task_7'.format(pid)]
+    assert list(ssh_client.run_command('cat ~/TensorHiveLogs/task_7.log')['node0'].stdout)
+
+    output = ssh_client.run_command(ScreenCommandBuilder.kill(pid))
+    assert output['node0'].exit_code == 0
+    assert node.gpu_processes(1) == []
+    assert ssh_client.run_command(ScreenCommandBuilder.kill(pid))['node0'].exit_code == 1
+
+
+def test_only_owner_or_sudo_can_kill(cluster):
+    pid = cluster.node('node0').spawn('bob', 'python train.py', gpu_index=0)
+
+    assert client(cluster).run_command('kill {}'.format(pid))['node0'].exit_code == 1
+    assert client(cluster).run_command('sudo kill {}'.format(pid))['node0'].exit_code == 0
+    assert pid not in cluster.node('node0').processes
+
+
+def test_who_lists_terminal_sessions(cluster):
+    cluster.node('node1').login('bob')
+
+    output = client(cluster).run_command('who')
+    assert list(output['node0'].stdout) == []
+    assert [line.split()[:2] for line in output['node1'].stdout] == [['bob', 'pts/0']]
+
+
+def test_unreachable_node(cluster):
+    cluster.node('node1').reachable = False
+
+    output = client(cluster).run_command('uname', stop_on_errors=False)
+    assert list(output['node0'].stdout) == ['Linux']
+    assert isinstance(output['node1'].exception, ConnectionErrorException)
+    with pytest.raises(ConnectionErrorException):
+        client(cluster).run_command('uname')
+
+
+def test_agent_script_reports_cycles_until_channel_is_closed(cluster):
+    monitors = [CompositeMonitor([CPUMonitor(), GPUMonitor()])]
+    infrastructure_manager = InfrastructureManager({'node0': {}})
+    ssh_client = client(cluster, hosts=['node0'])
+    # GPU inventory is not part of the agent script, it is queried by a one-shot probe
+    refresh = probe.execute_sections(ssh_client, monitors[0].refresh_sections('node0'))['node0']
+    probe.dispatch('node0', probe.split_output(refresh.stdout), monitors, infrastructure_manager, fill_missing=False)
+    script = agent.build_script(monitors, interval=0.01)
+    assert GPUMonitor().inventory_query_command not in script
+    output = ssh_client.run_command(script, use_pty=True)['node0']
+    parser = agent.AgentOutputParser('node0', monitors, infrastructure_manager)
+
+    cycles = 0
+    for line in output.stdout:
+        if parser.feed(line):
+            cycles += 1
+            if cycles == 2:
+                ssh_client.host_clients['node0'].close_channel(output.channel)
+
+    assert cycles == 2
+    assert len(infrastructure_manager.infrastructure['node0']['GPU']) == 2
@@ -0,0 +1,134 @@
+from tensorhive.core.monitors.GPUMonitor import GPUMonitor
+from tensorhive.core.monitors.probe import SectionOutput
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+
+UUID_0 = 'GPU-c6d01ed6-8240-2e11-efe9-1111111111111'
+UUID_1 = 'GPU-c6d01ed6-8240-2e11-efe9-2222222222222'
+
+INVENTORY = SectionOutput(exit_code=0, lines=[
+    'uuid, name, index, memory.total [MiB]',
+    '{}, GeForce GTX 1080 Ti, 0, 11178'.format(UUID_0),
+])
+NOT_QUERIED = SectionOutput(exit_code=0, lines=[])
+NO_PROCESSES = SectionOutput(exit_code=0, lines=['[COMPUTE APPS]', '', '[OWNERS]'])
+
+
+def metrics_section(*uuids, utilization=45):
+    return SectionOutput(exit_code=0, lines=['uuid, utilization.gpu [%], memory.used [MiB]'] + [
+        '{}, {}, 1178'.format(uuid, utilization) for uuid in uuids])
+
+
+def probe(monitor, infrastructure_manager, inventory, metrics):
+    monitor.parse_probe('host', {
+        'gpu_inventory': inventory,
+        'gpu_metrics': metrics,
+        'gpu_processes': NO_PROCESSES
+    }, infrastructure_manager)
+    return infrastructure_manager.infrastructure['host']['GPU']
+
+
+def test_static_properties_are_merged_into_cached_records():
+    monitor = GPUMonitor()
+    infrastructure_manager = InfrastructureManager({'host': {}})
+    assert monitor.inventory_refresh_due
+
+    gpus = probe(monitor, infrastructure_manager, INVENTORY, metrics_section(UUID_0))
+    record = gpus[UUID_0]
+    assert record['name'] == 'GeForce GTX 1080 Ti'
+    assert record['index'] == 0
+    assert record['metrics'] == {
+        'utilization': {'value': 45, 'unit': '%'},
+        'mem_used': {'value': 1178, 'unit': 'MiB'},
+        'mem_total': {'value': 11178, 'unit': 'MiB'}
+    }
+    assert record['processes'] is None
+    assert not monitor.inventory_refresh_due
+    assert 'nvidia-smi' not in monitor.probe_sections['gpu_inventory']
+
+    gpus = probe(monitor, infrastructure_manager, NOT_QUERIED, metrics_section(UUID_0, utilization=90))
+    assert gpus[UUID_0] is record
+    assert record['metrics']['utilization']['value'] == 90
+
+
+def test_unknown_uuid_triggers_inventory_refresh():
+    monitor = GPUMonitor()
+    infrastructure_manager = InfrastructureManager({'host': {}})
+    probe(monitor, infrastructure_manager, INVENTORY, metrics_section(UUID_0))
+
+    gpus = probe(monitor, infrastructure_manager, NOT_QUERIED, metrics_section(UUID_0, UUID_1))
+    assert list(gpus) == [UUID_0]
+    assert monitor.inventory_refresh_due
+
+    refreshed_inventory = SectionOutput(exit_code=0, lines=INVENTORY.lines + [
+        '{}, GeForce GTX 1060, 1, 6078'.format(UUID_1)])
+    gpus = probe(monitor, infrastructure_manager, refreshed_inventory, metrics_section(UUID_0, UUID_1))
+    assert list(gpus) == [UUID_0, UUID_1]
+    assert gpus[UUID_1]['index'] == 1
+    assert not monitor.inventory_refresh_due
+
+
+def test_inventory_is_refreshed_after_interval():
+    monitor = GPUMonitor(inventory_refresh_interval=0)
+    infrastructure_manager = InfrastructureManager({'host': {}})
+    probe(monitor, infrastructure_manager, INVENTORY, metrics_section(UUID_0))
+
+    assert monitor.inventory_refresh_due
+
+
+def test_streamed_metrics_update_single_gpu():
+    monitor = GPUMonitor()
+    infrastructure_manager = InfrastructureManager({'host': {}})
+    two_gpus = SectionOutput(exit_code=0, lines=INVENTORY.lines + ['{}, GeForce GTX 1060, 1, 6078'.format(UUID_1)])
+    probe(monitor, infrastructure_manager, two_gpus, metrics_section(UUID_0, UUID_1))
+
+    header, line = metrics_section(UUID_1, utilization=99).lines
+    monitor.parse_stream_line('host', 'gpu_metrics', header, infrastructure_manager)
+    monitor.parse_stream_line('host', 'gpu_metrics', line, infrastructure_manager)
+
+    gpus = infrastructure_manager.infrastructure['host']['GPU']
+    assert list(gpus) == [UUID_0, UUID_1]
+    assert gpus[UUID_0]['metrics']['utilization']['value'] == 45
+    assert gpus[UUID_1]['metrics']['utilization']['value'] == 99
+    assert 'loop-ms=500' in monitor.stream_sections(0.5)['gpu_metrics']
+
+
+def test_inventory_refresh_is_due_on_each_node_separately():
+    monitor = GPUMonitor()
+    infrastructure_manager = InfrastructureManager({'host': {}, 'other_host': {}})
+    assert monitor.refresh_sections('host') == {'gpu_inventory': monitor.inventory_query_command}
+
+    # Agent mode: inventory only
+    monitor.parse_probe('host', {'gpu_inventory': INVENTORY}, infrastructure_manager)
+    assert list(infrastructure_manager.gpu_inventory('host')) == [UUID_0]
+    assert monitor.refresh_sections('host') == {}
+    assert monitor.refresh_sections('other_host') == {'gpu_inventory': monitor.inventory_query_command}
+
+    header, line = metrics_section(UUID_1).lines
+    monitor.parse_stream_line('host', 'gpu_metrics', header, infrastructure_manager)
+    monitor.parse_stream_line('host', 'gpu_metrics', line, infrastructure_manager)
+    assert monitor.refresh_sections('host') == {'gpu_inventory': monitor.inventory_query_command}
+
+
+def test_processes_on_unknown_gpu_are_skipped():
+    monitor = GPUMonitor()
+    infrastructure_manager = InfrastructureManager({'host': {}})
+    probe(monitor, infrastructure_manager, INVENTORY, metrics_section(UUID_0))
+
+    # GPU was added after inventory had been queried
+    monitor.parse_probe('host', {
+        'gpu_inventory': NOT_QUERIED,
+        'gpu_metrics': metrics_section(UUID_0, UUID_1),
+        'gpu_processes': SectionOutput(exit_code=0, lines=[
+            '[COMPUTE APPS]',
+            '{}, 1234, 1178, python'.format(UUID_0),
+            '{}, 4567, 2000, python'.format(UUID_1),
+            '[OWNERS]',
+            ' 1234 alice',
+            ' 4567 bob'
+        ])
+    }, infrastructure_manager)
+
+    gpus = infrastructure_manager.infrastructure['host']['GPU']
+    assert list(gpus) == [UUID_0]
+    assert [(process['pid'], process['owner']) for process in gpus[UUID_0]['processes']] == [(1234, 'alice')]
+    assert monitor.refresh_sections('host') == {'gpu_inventory': monitor.inventory_query_command}
@@ -0,0 +1,149 @@
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+from tensorhive.core.services.ProtectionService import ProtectionService
+from tensorhive.core.utils.ReservationIndex import ReservationIndex
+from tensorhive.core.utils.records import GPUProcess, GPURecord
+from unittest.mock import MagicMock
+
+ALICE_PROCESS = {'pid': 1, 'owner': 'alice', 'command': 'python'}
+BOB_PROCESS = {'pid': 2, 'owner': 'bob', 'command': 'python'}
+
+
+def test_snapshot_is_published_when_node_is_updated():
+    infrastructure_manager = InfrastructureManager({'node0': {}, 'node1': {}})
+    initial_snapshot = infrastructure_manager.snapshot
+    infrastructure_manager.infrastructure['node0']['CPU'] = {'CPU_node0': {'metrics': {'utilization': 10}}}
+    assert infrastructure_manager.snapshot is initial_snapshot
+
+    infrastructure_manager.mark_updated('node0')
+
+    snapshot = infrastructure_manager.snapshot
+    assert snapshot.version == initial_snapshot.version + 1
+    assert snapshot.nodes['node0']['CPU']['CPU_node0']['metrics']['utilization'] == 10
+    assert initial_snapshot.nodes['node0'] == {}
+    # Nodes which have not changed are shared
+    assert snapshot.nodes['node1'] is initial_snapshot.nodes['node1']
+
+
+def test_snapshot_is_not_affected_by_monitors():
+    infrastructure_manager = InfrastructureManager({'node0': {}})
+    infrastructure_manager.set_gpu_inventory('node0', {'GPU-0': {'name': 'GeForce', 'index': 0,
+                                                                 'mem_total': {'value': 11178, 'unit': 'MiB'}}})
+    infrastructure_manager.merge_gpu_metrics('node0', {'GPU-0': {'utilization': {'value': 30, 'unit': '%'}}})
+    infrastructure_manager.infrastructure['node0']['GPU']['GPU-0']['processes'] = [ALICE_PROCESS]
+    snapshot = infrastructure_manager.publish()
+
+    # Next cycle updates records in place
+    infrastructure_manager.merge_gpu_metrics('node0', {'GPU-0': {'utilization': {'value': 90, 'unit': '%'}}})
+    infrastructure_manager.infrastructure['node0']['GPU']['GPU-0']['processes'].append(BOB_PROCESS)
+
+    gpu = snapshot.nodes['node0']['GPU']['GPU-0']
+    assert gpu['metrics']['utilization']['value'] == 30
+    assert gpu['processes'] == [ALICE_PROCESS]
+    assert infrastructure_manager.node_gpu_processes('node0') == {'GPU-0': [ALICE_PROCESS]}
+
+
+def test_gpu_indexes_follow_inventory():
+    infrastructure_manager = InfrastructureManager({'node0': {}, 'node1': {}})
+    infrastructure_manager.set_gpu_inventory('node0', {'GPU-0': {'name': 'GeForce', 'index': 0},
+                                                       'GPU-1': {'name': 'GeForce', 'index': 1}})
+    infrastructure_manager.set_gpu_inventory('node1', {'GPU-2': {'name': 'Tesla', 'index': 0}})
+    assert infrastructure_manager.gpu_location('GPU-1') == ('node0', 1)
+    assert infrastructure_manager.gpu_uuid('node1', 0) == 'GPU-2'
+
+    # GPU was swapped
+    infrastructure_manager.set_gpu_inventory('node0', {'GPU-0': {'name': 'GeForce', 'index': 0},
+                                                       'GPU-3': {'name': 'GeForce', 'index': 1}})
+    assert infrastructure_manager.gpu_location('GPU-1') is None
+    assert infrastructure_manager.gpu_uuid('node0', 1) == 'GPU-3'
+    assert infrastructure_manager.get_gpu_uid('node0', 1) == 'GPU-3'
+
+    infrastructure_manager.set_gpu_inventory('node1', None)
+    assert infrastructure_manager.gpu_uuid('node1', 0) is None
+
+
+def test_process_index_is_built_once_per_snapshot():
+    infrastructure_manager = InfrastructureManager({'node0': {}, 'node1': {}})
+    infrastructure_manager.set_gpu_inventory('node0', {'GPU-0': {'name': 'GeForce', 'index': 0},
+                                                       'GPU-1': {'name': 'GeForce', 'index': 1}})
+    infrastructure_manager.merge_gpu_metrics('node0', {'GPU-0': {}, 'GPU-1': {}})
+    gpus = infrastructure_manager.infrastructure['node0']['GPU']
+    gpus['GPU-0']['processes'] = [ALICE_PROCESS, BOB_PROCESS, {'pid': 3, 'owner': 'root', 'command': 'Xorg'}]
+    # Single process using both GPUs
+    gpus['GPU-1']['processes'] = [ALICE_PROCESS]
+    infrastructure_manager.mark_updated('node0')
+
+    index = infrastructure_manager.process_index()
+    assert infrastructure_manager.process_index() is index
+    assert index.hostnames == ['node0']
+    assert [process.uuid for process in index.get('node0', 1)] == ['GPU-0', 'GPU-1']
+    assert index.is_running('node0', 2, 'GPU-0')
+    assert not index.is_running('node0', 2, 'GPU-1')
+    assert not index.is_running('node0', 3)
+    assert [process.pid for process in index.others_on_gpu('GPU-0', 1)] == [2]
+    assert [process.uuid for process in index.owned_by('alice')] == ['GPU-0', 'GPU-1']
+    assert len(index.on_host('node0')) == 3
+
+    gpus['GPU-0']['processes'] = []
+    infrastructure_manager.mark_updated('node0')
+    index = infrastructure_manager.process_index()
+    assert index.version == infrastructure_manager.snapshot.version
+    assert index.gpus('node0') == {'GPU-0': [], 'GPU-1': index.get('node0', 1)}
+    assert index.others_on_gpu('GPU-0', 1) == []
+
+
+def test_snapshot_is_restored_as_stale(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    infrastructure_manager = InfrastructureManager({'node0': {}, 'node1': {}})
+    infrastructure_manager.set_gpu_inventory('node0', {'GPU-0': {'name': 'GeForce', 'index': 0,
+                                                                 'mem_total': {'value': 11178, 'unit': 'MiB'}}})
+    infrastructure_manager.merge_gpu_metrics('node0', {'GPU-0': {'utilization': {'value': 30, 'unit': '%'}}})
+    process = GPUProcess(1, 'python', 'alice', 1178)
+    infrastructure_manager.infrastructure['node0']['GPU']['GPU-0']['processes'] = [process]
+    infrastructure_manager.mark_updated('node0')
+    infrastructure_manager.save_snapshot(path)
+
+    # node1 is no longer configured
+    restored_manager = InfrastructureManager({'node0': {}, 'node2': {}})
+    assert restored_manager.load_snapshot(path)
+
+    assert list(restored_manager.snapshot.nodes) == ['node0', 'node2']
+    gpu = restored_manager.snapshot.nodes['node0']['GPU']['GPU-0']
+    assert isinstance(gpu, GPURecord)
+    assert gpu['metrics'] == infrastructure_manager.snapshot.nodes['node0']['GPU']['GPU-0']['metrics']
+    assert restored_manager.gpu_uuid('node0', 0) == 'GPU-0'
+    # Processes from before restart are not listed
+    assert gpu['processes'] is None
+    assert not restored_manager.process_index().is_running('node0', 1, 'GPU-0')
+    status = restored_manager.node_status()['node0']
+    assert status['stale'] and status['last_updated'] is not None
+
+    assert not InfrastructureManager({'node0': {}}).load_snapshot(str(tmp_path / 'missing.json'))
+
+
+def test_restored_snapshot_creates_no_violations(tmp_path, tables, active_reservation):
+    active_reservation.save()
+    ReservationIndex().invalidate()
+    path = str(tmp_path / 'snapshot.json')
+    uuid = active_reservation.resource_id
+    infrastructure_manager = InfrastructureManager({'node0': {}})
+    infrastructure_manager.set_gpu_inventory('node0', {uuid: {'name': 'GeForce', 'index': 0}})
+    infrastructure_manager.merge_gpu_metrics('node0', {uuid: {}})
+    # Process of someone else than the owner of the reservation
+    gpu = infrastructure_manager.infrastructure['node0']['GPU'][uuid]
+    gpu['processes'] = [GPUProcess(1, 'python', 'alice', 1178)]
+    infrastructure_manager.mark_updated('node0')
+    infrastructure_manager.save_snapshot(path)
+
+    def run_protection(manager):
+        handler = MagicMock()
+        service = ProtectionService([handler])
+        service.inject(manager)
+        service.connection_manager = MagicMock()
+        service.do_run()
+        return handler.trigger_action
+
+    assert run_protection(infrastructure_manager).called
+
+    restored_manager = InfrastructureManager({'node0': {}})
+    assert restored_manager.load_snapshot(path)
+    assert not run_protection(restored_manager).called
@@ -0,0 +1,121 @@
+from tensorhive.api.InfrastructureStream import InfrastructureStream
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+from tensorhive.core.utils.AllowedGPUIndex import AllowedGPUIndex
+import json
+import pytest
+import time
+
+
+def parse(event):
+    lines = dict(line.split(': ', 1) for line in event.strip().split('\n'))
+    return int(lines['id']), lines['event'], json.loads(lines['data'])
+
+
+@pytest.fixture
+def infrastructure_manager():
+    infrastructure_manager = InfrastructureManager({'node0': {}, 'node1': {}})
+    for index, hostname in enumerate(['node0', 'node1']):
+        infrastructure_manager.infrastructure[hostname]['GPU'] = {'GPU-{}'.format(index): {'metrics': {'temp': 40}}}
+    infrastructure_manager.publish()
+    return infrastructure_manager
+
+
+@pytest.fixture
+def stream(infrastructure_manager):
+    # Broadcasts are triggered by tests
+    stream = InfrastructureStream(infrastructure_manager, interval=60.0)
+    yield stream
+    stream._greenlet.kill()
+
+
+def test_subscriber_gets_snapshot_and_then_changed_nodes_only(infrastructure_manager, stream):
+    events = stream.subscribe(allowed_gpus=None)
+    version, event, data = parse(next(events))
+    assert (version, event, set(data)) == (infrastructure_manager.snapshot.version, 'snapshot', {'node0', 'node1'})
+
+    infrastructure_manager.infrastructure['node1']['GPU']['GPU-1']['metrics']['temp'] = 50
+    infrastructure_manager.mark_updated('node1')
+    assert stream.broadcast() == 1
+
+    version, event, data = parse(next(events))
+    assert (version, event) == (infrastructure_manager.snapshot.version, 'delta')
+    assert data == {'node1': {'GPU': {'GPU-1': {'metrics': {'temp': 50}}}}}
+    events.close()
+    assert not stream._subscribers
+
+
+def test_changes_are_serialized_once_per_set_of_visible_gpus(infrastructure_manager, stream):
+    everything = [stream.subscribe(allowed_gpus=None) for _ in range(3)]
+    restricted = [stream.subscribe(allowed_gpus={'GPU-0'}) for _ in range(2)]
+    for events in everything + restricted:
+        next(events)
+
+    infrastructure_manager.publish()
+    assert stream.broadcast() == 2
+
+    everything_events = [next(events) for events in everything]
+    assert all(event is everything_events[0] for event in everything_events)
+    assert set(parse(everything_events[0])[2]) == {'node0', 'node1'}
+    assert [set(parse(next(events))[2]) for events in restricted] == [{'node0'}, {'node0'}]
+
+    # Nothing visible has changed
+    infrastructure_manager.mark_updated('node1')
+    assert stream.broadcast() == 1
+
+
+def test_resumed_stream_starts_with_nodes_changed_since_last_event(infrastructure_manager, stream):
+    last_version = infrastructure_manager.snapshot.version
+    infrastructure_manager.mark_updated('node0')
+
+    version, event, data = parse(next(stream.subscribe(allowed_gpus=None, last_version=last_version)))
+    assert (version, event, set(data)) == (last_version + 1, 'delta', {'node0'})
+
+
+def test_slow_subscriber_is_disconnected(infrastructure_manager, stream):
+    events = stream.subscribe(allowed_gpus=None)
+    next(events)
+    for _ in range(stream.max_queued_events + 1):
+        infrastructure_manager.mark_updated('node0')
+        stream.broadcast()
+
+    assert list(events) == []
+    assert not stream._subscribers
+
+
+def test_node_which_is_no_longer_visible_is_sent_as_null(infrastructure_manager, stream):
+    events = stream.subscribe(allowed_gpus={'GPU-0'})
+    next(events)
+
+    # GPUs could not be listed
+    infrastructure_manager.infrastructure['node0']['GPU'] = None
+    infrastructure_manager.mark_updated('node0')
+    stream.broadcast()
+    assert parse(next(events))[2] == {'node0': None}
+
+    # Node which has never been visible is not mentioned
+    infrastructure_manager.mark_updated('node1')
+    assert stream.broadcast() == 0
+
+
+def test_permissions_are_checked_again_when_they_change(infrastructure_manager, stream):
+    allowed_gpus = {'GPU-0'}
+    events = stream.subscribe(allowed_gpus=set(allowed_gpus), refresh_allowed_gpus=lambda: allowed_gpus)
+    next(events)
+
+    allowed_gpus = {'GPU-1'}
+    AllowedGPUIndex().invalidate()
+    infrastructure_manager.mark_updated('node0')
+    stream.broadcast()
+
+    # Delta filtered with previous permissions is replaced with the whole infrastructure
+    version, event, data = parse(next(events))
+    assert (version, event, set(data)) == (infrastructure_manager.snapshot.version, 'snapshot', {'node1'})
+    assert set(stream._subscribers) == {frozenset({'GPU-1'})}
+    events.close()
+
+
+def test_stream_ends_when_token_expires(stream):
+    events = stream.subscribe(allowed_gpus=None, expires_at=time.time() + 0.05)
+    next(events)
+    assert list(events) == []
+    assert not stream._subscribers
@@ -0,0 +1,68 @@
+from tensorhive.core.utils.MetricHistory import MetricHistory
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+
+
+def gpu_metrics(utilization, power=80.5):
+    return {'utilization': {'value': utilization, 'unit': '%'}, 'power': {'value': power, 'unit': 'W'}, 'temp': 50}
+
+
+def test_history_is_bounded_and_chronological():
+    history = MetricHistory(capacity=3)
+    for second in range(5):
+        history.append('GPU-0', gpu_metrics(utilization=second), timestamp=float(second))
+
+    result = history.window('GPU-0')
+    assert result['timestamps'] == [2.0, 3.0, 4.0]
+    assert result['metrics']['utilization'] == {'values': [2, 3, 4], 'unit': '%'}
+    assert result['metrics']['temp'] == {'values': [50, 50, 50], 'unit': None}
+
+
+def test_window_and_metric_type_filters():
+    history = MetricHistory(capacity=10)
+    for second in range(5):
+        history.append('GPU-0', gpu_metrics(utilization=second), timestamp=float(second))
+
+    result = history.window('GPU-0', since=1.0, until=3.0, metric_type='utilization')
+    assert result == {'timestamps': [1.0, 2.0, 3.0], 'metrics': {'utilization': {'values': [1, 2, 3], 'unit': '%'}}}
+    assert history.window('GPU-0', since=10.0)['timestamps'] == []
+    assert history.window('GPU-1') is None
+
+
+def test_missing_values_are_null():
+    history = MetricHistory(capacity=10)
+    history.append('GPU-0', gpu_metrics(utilization=10), timestamp=1.0)
+    history.append('GPU-0', gpu_metrics(utilization=None, power='[Unknown Error]'), timestamp=2.0)
+
+    result = history.window('GPU-0')
+    assert result['metrics']['utilization']['values'] == [10, None]
+    assert result['metrics']['power']['values'] == [80.5, None]
+
+
+def test_metrics_missing_from_first_sample_are_recorded():
+    history = MetricHistory(capacity=10)
+    history.append('GPU-0', {'utilization': {'value': None, 'unit': '%'}, 'temp': 50}, timestamp=1.0)
+    history.append('GPU-0', {'utilization': {'value': 10, 'unit': '%'}, 'temp': 51, 'fan_speed': 30}, timestamp=2.0)
+
+    result = history.window('GPU-0')
+    assert result['metrics']['utilization'] == {'values': [None, 10], 'unit': '%'}
+    assert result['metrics']['fan_speed'] == {'values': [None, 30], 'unit': None}
+    # Integers are not turned into floats
+    assert all(isinstance(value, int) for value in result['metrics']['temp']['values'])
+
+
+def test_disabled_history_keeps_nothing():
+    history = MetricHistory(capacity=0)
+    history.append('GPU-0', gpu_metrics(utilization=10), timestamp=1.0)
+    assert history.window('GPU-0') is None
+
+
+def test_merged_gpu_metrics_are_recorded():
+    infrastructure_manager = InfrastructureManager({'node0': {}}, history_capacity=10)
+    infrastructure_manager.set_gpu_inventory('node0', {'GPU-0': {'name': 'GeForce', 'index': 0,
+                                                                 'mem_total': {'value': 11178, 'unit': 'MiB'}}})
+    infrastructure_manager.merge_gpu_metrics('node0', {'GPU-0': gpu_metrics(utilization=30)})
+    infrastructure_manager.merge_gpu_metrics('node0', {'GPU-0': gpu_metrics(utilization=40)})
+
+    history = infrastructure_manager.metric_history('GPU-0', metric_type='utilization')
+    assert history['metrics']['utilization']['values'] == [30, 40]
+    assert len(history['timestamps']) == 2
@@ -0,0 +1,140 @@
+from tensorhive.core.monitors.Monitor import Monitor
+from tensorhive.core.managers.InfrastructureManager import InfrastructureManager
+from tensorhive.core.services.MonitoringService import MonitoringService
+from tensorhive.models.Resource import Resource
+import gevent
+import time
+
+
+class HostOutput:
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.exit_code = 0
+        self.exception = None
+
+
+class Connection:
+    def __init__(self, hostname, delay):
+        self.hostname = hostname
+        self.delay = delay
+        self.reachable = True
+        self.calls = 0
+
+    def run_command(self, command, stop_on_errors=True):
+        self.calls += 1
+        gevent.sleep(self.delay)
+        if not self.reachable:
+            raise ConnectionError()
+        return {self.hostname: HostOutput(['#TH_BEGIN value', str(self.calls), '#TH_END value 0'])}
+
+    def join(self, output, **kwargs):
+        pass
+
+
+class ConnectionManager:
+    def __init__(self, delays):
+        self.connections = {hostname: Connection(hostname, delay) for hostname, delay in delays.items()}
+
+    def new_single_connection(self, hostname):
+        return self.connections[hostname]
+
+
+class ValueMonitor(Monitor):
+    probe_sections = {'value': 'echo 1'}
+
+    def parse_probe(self, hostname, sections, infrastructure_manager):
+        infrastructure_manager.infrastructure[hostname]['value'] = int(sections['value'].lines[0])
+
+    def probe_failed(self, hostname, infrastructure_manager):
+        infrastructure_manager.infrastructure[hostname]['value'] = None
+
+
+def service_for(delays, busy_hosts=(), **kwargs):
+    connection_manager = ConnectionManager(delays)
+    infrastructure_manager = InfrastructureManager({hostname: {} for hostname in delays})
+    service = MonitoringService(monitors=[ValueMonitor()], **kwargs)
+    service.infrastructure_manager = infrastructure_manager
+    service.connection_manager = connection_manager
+    service.busy_hosts = lambda: set(busy_hosts)
+    return service, connection_manager.connections, infrastructure_manager
+
+
+def update(service, wait=0.05):
+    service.update_all()
+    gevent.sleep(wait)
+
+
+def test_late_host_is_marked_stale_and_keeps_previous_data():
+    service, connections, infrastructure_manager = service_for({'fast': 0, 'slow': 0}, deadline=0.2)
+
+    update(service)
+    assert infrastructure_manager.infrastructure == {'fast': {'value': 1}, 'slow': {'value': 1}}
+
+    connections['slow'].delay = 0.5
+    update(service, wait=0.25)
+    update(service)
+    status = infrastructure_manager.node_status()
+    assert infrastructure_manager.infrastructure == {'fast': {'value': 3}, 'slow': {'value': 1}}
+    assert status['fast']['stale'] is False
+    assert status['slow']['stale'] is True
+    assert status['slow']['age'] is not None
+
+    # Pending probe is not started again
+    assert connections['slow'].calls == 2
+
+    gevent.sleep(0.5)
+    assert infrastructure_manager.infrastructure['slow']['value'] == 2
+    assert infrastructure_manager.node_status()['slow']['stale'] is False
+
+
+def test_busy_hosts_are_probed_more_often():
+    service, connections, _ = service_for({'busy': 0, 'idle': 0}, busy_hosts={'busy'},
+                                          busy_interval=0.1, idle_interval=10.0)
+    for _ in range(5):
+        update(service, wait=0.1)
+
+    assert connections['busy'].calls >= 4
+    assert connections['idle'].calls == 1
+    assert 0 < service.seconds_until_next_probe() <= 0.1
+
+
+def test_unreachable_host_backs_off_exponentially():
+    service, connections, infrastructure_manager = service_for({'host': 0}, idle_interval=1.0, max_backoff=8.0)
+    connections['host'].reachable = False
+
+    for failures in range(1, 7):
+        service._next_probe_at.clear()
+        started_at = time.time()
+        update(service, wait=0.01)
+        backoff = min(8.0, 2 ** (failures - 1))
+        assert backoff / 2 <= service._next_probe_at[('host', 0)] - started_at <= backoff + 0.01
+
+    assert infrastructure_manager.infrastructure['host'] == {'value': None}
+
+    connections['host'].reachable = True
+    service._next_probe_at.clear()
+    update(service, wait=0.01)
+    assert service._failures[('host', 0)] == 0
+    assert infrastructure_manager.infrastructure['host'] == {'value': 7}
+
+
+def test_discovered_gpus_are_registered_once_per_inventory_change(tables, resource1):
+    service, _, infrastructure_manager = service_for({'node0': 0, 'node1': 0})
+    gpu = {'name': 'GeForce', 'index': 0, 'mem_total': {'value': 11178, 'unit': 'MiB'}}
+    infrastructure_manager.set_gpu_inventory('node0', {resource1.id: gpu, 'GPU-new': gpu})
+
+    service.register_resources()
+    assert Resource.get(resource1.id).hostname == 'node0'
+    assert Resource.get('GPU-new').name == 'GeForce'
+
+    # Same inventory does not touch the database
+    Resource.get('GPU-new').destroy()
+    infrastructure_manager.set_gpu_inventory('node0', {resource1.id: gpu, 'GPU-new': gpu})
+    service.register_resources()
+    assert Resource.query.filter(Resource.id == 'GPU-new').first() is None
+
+    # GPU moved to another node
+    infrastructure_manager.set_gpu_inventory('node0', {'GPU-new': gpu})
+    infrastructure_manager.set_gpu_inventory('node1', {resource1.id: gpu})
+    service.register_resources()
+    assert Resource.get(resource1.id).hostname == 'node1'
@@ -0,0 +1,82 @@
+from tensorhive.core.utils.NvidiaSmiParser import NvidiaSmiParser as sut
+
+PMON_WITH_OWNERS = [
+    'UUID=GPU-c6d01ed6-8240-2e11-efe9-1111111111111',
+    '# gpu        pid  type    sm   mem   enc   dec   command',
+    '# Idx          #   C/G     %     %     %     %   name',
+    '    0       1979     G     0     3     0     0   X',
+    '    0       1234     C     0    90     0     0   python',
+    '[OWNERS]',
+    ' 1979 root',
+    ' 1234 foo',
+]
+
+
+def test_processes_are_separated_from_owners_block():
+    pmon_lines, owner_lines = sut.split_owners_block(PMON_WITH_OWNERS)
+
+    assert sut.parse_pmon_stdout(pmon_lines) == [
+        {'uuid': 'GPU-c6d01ed6-8240-2e11-efe9-1111111111111', 'pid': 1979, 'command': 'X'},
+        {'uuid': 'GPU-c6d01ed6-8240-2e11-efe9-1111111111111', 'pid': 1234, 'command': 'python'},
+    ]
+    assert sut.parse_ps_owners_stdout(owner_lines) == {1979: 'root', 1234: 'foo'}
+
+
+def test_missing_owners_block_gives_no_owners():
+    pmon_lines, owner_lines = sut.split_owners_block(PMON_WITH_OWNERS[:5])
+
+    assert pmon_lines == PMON_WITH_OWNERS[:5]
+    assert sut.parse_ps_owners_stdout(owner_lines) == {}
+
+
+def test_compute_apps_output_is_parsed_with_memory_usage():
+    stdout = [
+        'GPU-c6d01ed6-8240-2e11-efe9-1111111111111, 1234, 1178, python',
+        'GPU-c6d01ed6-8240-2e11-efe9-2222222222222, 4567, [Not Supported], /opt/my, app',
+    ]
+
+    assert sut.parse_compute_apps_stdout(stdout) == [
+        {'uuid': 'GPU-c6d01ed6-8240-2e11-efe9-1111111111111', 'pid': 1234, 'command': 'python',
+         'mem_used': {'value': 1178, 'unit': 'MiB'}},
+        {'uuid': 'GPU-c6d01ed6-8240-2e11-efe9-2222222222222', 'pid': 4567, 'command': '/opt/my, app',
+         'mem_used': {'value': None, 'unit': 'MiB'}},
+    ]
+    assert sut.parse_compute_apps_stdout(['']) == []
+
+
+def test_query_gpu_values_are_typed():
+    stdout = [
+        'uuid, name, index, fan.speed [%], temperature.gpu, power.draw [W]',
+        'GPU-c6d01ed6-8240-2e11-efe9-1111111111111, GeForce GTX 1080 Ti, 0, 30, 50, 80.50',
+        'GPU-c6d01ed6-8240-2e11-efe9-2222222222222, Tesla K80, 1, [N/A], 41, [Not Supported]',
+    ]
+
+    assert sut.parse_query_gpu_stdout(stdout) == {
+        'GPU-c6d01ed6-8240-2e11-efe9-1111111111111': {
+            'name': 'GeForce GTX 1080 Ti',
+            'index': 0,
+            'metrics': {
+                'fan_speed': {'value': 30, 'unit': '%'},
+                'temp': 50,
+                'power': {'value': 80.5, 'unit': 'W'}
+            }
+        },
+        'GPU-c6d01ed6-8240-2e11-efe9-2222222222222': {
+            'name': 'Tesla K80',
+            'index': 1,
+            'metrics': {
+                'fan_speed': {'value': None, 'unit': '%'},
+                'temp': 41,
+                'power': {'value': None, 'unit': 'W'}
+            }
+        }
+    }
+
+
+def test_column_plan_is_compiled_once_per_header():
+    header = 'uuid, memory.used [MiB]'
+    plan = sut.column_plan(header)
+
+    assert [(column.key, column.unit) for column in plan] == [('uuid', None), ('mem_used', 'MiB')]
+    assert sut.column_plan(header) is plan
+    assert sut.make_dict(['memory.used [MiB]'], ['1178']) == {'mem_used': {'value': 1178, 'unit': 'MiB'}}
@@ -0,0 +1,28 @@
+import subprocess
+import tensorhive.core.monitors.probe as sut
+
+
+def run_locally(script):
+    result = subprocess.run(['bash', '-c', script], stdout=subprocess.PIPE, universal_newlines=True)
+    return result.stdout.splitlines()
+
+
+def test_split_output_reverses_build_script():
+    script = sut.build_script({
+        'first': 'echo foo; echo bar',
+        'second': 'echo baz; exit 3',
+        'third': 'printf "no newline"'
+    })
+    sections = sut.split_output(run_locally(script))
+
+    assert sections['first'] == sut.SectionOutput(exit_code=0, lines=['foo', 'bar'])
+    assert sections['second'] == sut.SectionOutput(exit_code=3, lines=['baz'])
+    assert sections['third'] == sut.SectionOutput(exit_code=0, lines=['no newline'])
+
+
+def test_split_output_marks_interrupted_section():
+    stdout = ['#TH_BEGIN first', 'foo', '#TH_END first 0', '#TH_BEGIN second', 'bar']
+    sections = sut.split_output(stdout)
+
+    assert sections['first'].exit_code == 0
+    assert sections['second'] == sut.SectionOutput(exit_code=None, lines=['bar'])
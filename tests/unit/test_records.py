@@ -0,0 +1,59 @@
+from tensorhive.core.utils.NvidiaSmiParser import NvidiaSmiParser
+from tensorhive.core.utils.records import GPUProcess, GPURecord, Metrics, MetricSchema, render
+import json
+
+UUID = 'GPU-c6d01ed6-8240-2e11-efe9-1111111111111'
+STDOUT = ['uuid, utilization.gpu [%], temperature.gpu, power.draw [W]', UUID + ', 45, 50, [Not Supported]']
+
+
+def test_rows_share_single_interned_schema():
+    first = NvidiaSmiParser.parse_gpu_metrics_stdout(STDOUT)[UUID]
+    second = NvidiaSmiParser.parse_gpu_metrics_stdout(STDOUT)[UUID]
+    assert first.schema is second.schema
+    assert first.schema.with_metric('mem_total', 'MiB') is second.schema.with_metric('mem_total', 'MiB')
+
+
+def test_records_render_in_api_format():
+    metrics = NvidiaSmiParser.parse_gpu_metrics_stdout(STDOUT)[UUID]
+    metrics['mem_total'] = {'value': 11178, 'unit': 'MiB'}
+    record = GPURecord('GeForce', 0, metrics, [GPUProcess(1234, 'python', 'alice', 1178), GPUProcess(4567, 'X')])
+
+    expected = {
+        'name': 'GeForce',
+        'index': 0,
+        'metrics': {
+            'utilization': {'value': 45, 'unit': '%'},
+            'temp': 50,
+            'power': {'value': None, 'unit': 'W'},
+            'mem_total': {'value': 11178, 'unit': 'MiB'}
+        },
+        'processes': [
+            {'pid': 1234, 'command': 'python', 'owner': 'alice', 'mem_used': {'value': 1178, 'unit': 'MiB'}},
+            {'pid': 4567, 'command': 'X', 'owner': None, 'mem_used': {'value': None, 'unit': 'MiB'}}
+        ]
+    }
+    assert json.loads(json.dumps(render({'node0': {'GPU': {UUID: record}}}))) == {'node0': {'GPU': {UUID: expected}}}
+    assert record == expected
+    assert record['processes'][0]['owner'] == 'alice'
+    assert record['metrics']['power'] == {'value': None, 'unit': 'W'}
+
+
+def test_update_replaces_values_in_place():
+    schema = MetricSchema.get(('utilization', 'temp'), ('%', None))
+    metrics = Metrics(schema, [10, 40])
+    metrics.set('mem_total', 11178, 'MiB')
+    values = metrics._values
+
+    metrics.update(Metrics(schema, [90, 60]))
+    assert metrics._values is values
+    assert metrics.as_dict() == {'utilization': {'value': 90, 'unit': '%'}, 'temp': 60,
+                                 'mem_total': {'value': 11178, 'unit': 'MiB'}}
+
+
+def test_copy_is_independent():
+    record = GPURecord('GeForce', 0, Metrics(MetricSchema.get(('temp',), (None,)), [40]), [])
+    copy = record.copy()
+    record.metrics['temp'] = 50
+    record.processes.append(GPUProcess(1234, 'python'))
+    assert copy['metrics'] == {'temp': 40}
+    assert copy['processes'] == []
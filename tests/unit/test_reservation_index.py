@@ -0,0 +1,104 @@
+from tensorhive.core.utils.ReservationIndex import ReservationIndex
+from tensorhive.database import db_session, engine
+from tensorhive.models.Reservation import Reservation
+from sqlalchemy import event
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import pytest
+
+
+@pytest.fixture
+def index():
+    index = ReservationIndex()
+    # Tables are recreated by each test, reservations from previous tests must not be reused
+    index.invalidate()
+    return index
+
+
+def test_lookups_do_not_query_database_until_reservations_change(tables, index, active_reservation,
+                                                                 future_reservation, new_user):
+    active_reservation.save()
+    future_reservation.save()
+    resource_id = active_reservation.resource_id
+    assert index.active(resource_id).id == active_reservation.id
+    assert index.active(resource_id).username == new_user.username
+
+    statements = []
+
+    def count_statement(connection, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    try:
+        assert index.next(resource_id).id == future_reservation.id
+        assert [entry.id for entry in index.upcoming(resource_id, timedelta(hours=6))] == \
+            [active_reservation.id, future_reservation.id]
+        assert [entry.id for entry in index.upcoming(resource_id, timedelta(hours=1))] == [active_reservation.id]
+        assert index.active(resource_id, future_reservation.start + timedelta(hours=1)).id == future_reservation.id
+        assert index.active(resource_id, datetime.utcnow() - timedelta(days=1)) is None
+        assert index.active('GPU-unknown') is None
+        assert [entry.id for entry in index.current()] == [active_reservation.id]
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
+    assert statements == []
+
+
+def test_changes_are_applied_when_committed(tables, index, active_reservation, future_reservation, resource2):
+    active_reservation.save()
+    resource_id = active_reservation.resource_id
+    assert index.next(resource_id) is None
+
+    future_reservation.save()
+    assert index.next(resource_id).id == future_reservation.id
+
+    active_reservation.is_cancelled = True
+    active_reservation.save()
+    assert index.active(resource_id) is None
+
+    # Moved to another GPU
+    future_reservation.resource_id = resource2.id
+    future_reservation.save()
+    assert index.next(resource_id) is None
+    assert index.next(resource2.id).id == future_reservation.id
+
+    future_reservation.destroy()
+    assert index.next(resource2.id) is None
+    assert index.get(future_reservation.id) is None
+
+
+def test_uncommitted_changes_are_not_indexed(tables, index, active_reservation):
+    index.current()
+    db_session.add(active_reservation)
+    db_session.flush()
+    db_session.rollback()
+    assert index.current() == []
+
+
+def test_changes_committed_in_other_sessions_are_loaded(tables, index, active_reservation):
+    active_reservation.save()
+    resource_id = active_reservation.resource_id
+    # The reservation stays in the identity map of this thread's session
+    assert index.active(resource_id).id == active_reservation.id
+
+    session = db_session.session_factory()
+    try:
+        session.query(Reservation).get(active_reservation.id).is_cancelled = True
+        session.commit()
+    finally:
+        session.close()
+    assert index.active(resource_id) is None
+
+
+def test_ended_reservations_are_dropped(tables, index, active_reservation):
+    active_reservation.save()
+    assert index.get(active_reservation.id) is not None
+
+    class Later(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime.utcnow() + timedelta(days=1)
+
+    with patch('tensorhive.core.utils.ReservationIndex.datetime', Later):
+        assert index.current() == []
+    assert index.timeline(active_reservation.resource_id) == ((), ())
+    assert index.get(active_reservation.id) is None
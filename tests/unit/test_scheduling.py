@@ -0,0 +1,20 @@
+from tensorhive.core.scheduling import Scheduler
+from types import SimpleNamespace
+
+GPU_UUIDS = {('node0', 0): 'GPU-0', ('node0', 1): 'GPU-1'}
+
+
+def test_assigned_gpu_is_found_by_index():
+    task = SimpleNamespace(hostname='node0', gpu_id=1)
+    # User is allowed to use the second GPU only, so its position differs from its index
+    hardware_map = {'node0': {'GPU-1': None}}
+    assert Scheduler.get_assigned_gpu_uid(task, hardware_map, GPU_UUIDS) == 'GPU-1'
+    assert Scheduler.get_assigned_gpu_uid(SimpleNamespace(hostname='node0', gpu_id=0), hardware_map, GPU_UUIDS) is None
+    assert Scheduler.get_assigned_gpu_uid(SimpleNamespace(hostname='node0', gpu_id=None), hardware_map,
+                                          GPU_UUIDS) is None
+
+
+def test_assigned_gpu_falls_back_to_position():
+    hardware_map = {'node0': {'GPU-0': None, 'GPU-1': None}}
+    assert Scheduler.get_assigned_gpu_uid(SimpleNamespace(hostname='node0', gpu_id=1), hardware_map) == 'GPU-1'
+    assert Scheduler.get_assigned_gpu_uid(SimpleNamespace(hostname='node0', gpu_id=2), hardware_map) is None